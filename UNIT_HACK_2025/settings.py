@@ -28,16 +28,17 @@ DEBUG = True
 ALLOWED_HOSTS = ["*"]
 CSRF_TRUSTED_ORIGINS = ["https://unit-hack-2025.onrender.com"]
 
+# Документация API (Swagger и генерация схемы). В рабочих воркерах её выключают
+# переменной GAME_API_DOCS=0: drf_spectacular тогда не импортируется, а схема
+# отдаётся из файла GAME_API_SCHEMA_FILE, собранного командой buildschema
+GAME_API_DOCS = environ.get('GAME_API_DOCS', '1') != '0'
+GAME_API_SCHEMA_FILE = BASE_DIR / 'schema.json'
+
 # Application definition
 
-REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-}
+REST_FRAMEWORK = {}
 
 INSTALLED_APPS = [
-    'drf_spectacular_websocket',
-    'drf_spectacular',
-    'drf_spectacular_sidecar',
     'channels',
     'daphne',
     'django.contrib.admin',
@@ -49,6 +50,10 @@ INSTALLED_APPS = [
     "game.apps.GameConfig"
 ]
 
+if GAME_API_DOCS:
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
+    INSTALLED_APPS = ['drf_spectacular_websocket', 'drf_spectacular', 'drf_spectacular_sidecar', *INSTALLED_APPS]
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    'game.metrics.MetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'UNIT_HACK_2025.urls'
@@ -78,19 +84,30 @@ TEMPLATES = [
     },
 ]
 
+REDIS_URL = environ["REDIS_URL"]
+
 ASGI_APPLICATION = 'UNIT_HACK_2025.asgi.application'
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [environ["REDIS_URL"]],
+            "hosts": [REDIS_URL],
         },
     },
 }
 
+# Общий кэш для всех воркеров: события комнат и флаги не должны жить в памяти процесса
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    },
+}
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# PostgreSQL работает через psycopg 3: на нём и ORM, и пул горячих запросов (game/db.py)
 DATABASES = {
     'default': {
         "ENGINE": environ["ENGINE"],
@@ -99,9 +116,16 @@ DATABASES = {
         "PASSWORD": environ["DB_PASSWORD"],
         "HOST": environ["DB_HOST"],
         "PORT": environ["DB_PORT"],
+        # Пул проверяет соединение, прежде чем отдать его запросу
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Под ASGI каждый поток sync_to_async держал бы своё постоянное соединение
+# (CONN_MAX_AGE), поэтому ORM на PostgreSQL берёт соединения из пула Django
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['OPTIONS'] = {'pool': True}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -156,3 +180,62 @@ SPECTACULAR_SETTINGS = {
         'socketMessagesInitialOpened': False,
     },
 }
+
+# Game rooms
+
+GAME_DEFAULT_ROOM = 'main'
+
+# Горячее состояние раунда (ответы и голоса), см. game/state.py
+GAME_STATE = {
+    'BACKEND': 'game.state.RedisGameState',
+    'LOCATION': REDIS_URL,
+}
+
+# Окно склейки событий о подключении игроков, в секундах (0 — отправлять сразу)
+GAME_BROADCAST_WINDOW = 0.1
+
+# Метрики в формате Prometheus на /metrics, см. game/metrics.py
+GAME_METRICS = False
+
+# Проверка бюджетов запросов к БД у обработчиков, включается в тестах (см. game/budgets.py)
+GAME_QUERY_BUDGETS = False
+
+# Сколько лучших игроков показывать в таблице лидеров, см. game/leaderboard.py
+GAME_LEADERBOARD_SIZE = 10
+
+# Время жизни кэшированных фрагментов страниц, в секундах. Ключи фрагментов
+# содержат версию состава, фазы или таблицы лидеров и устаревают вместе с ней
+GAME_FRAGMENT_CACHE_TIMEOUT = 5 * 60
+
+# Сроки фаз в секундах: по истечении недостающие ответы заменяются запасными,
+# а голосование закрывается с теми голосами, что есть (см. game/scheduler.py)
+GAME_PHASE_DEADLINES = {
+    'answering': 120,
+    'voting': 45,
+}
+
+# Веб-сокеты по типу потребителя, см. game/consumers/mixins.py:
+# HEARTBEAT — период ping в секундах (None — не слать), IDLE_TIMEOUT — через
+# сколько секунд тишины соединение закрывается (None — не закрывать),
+# QUEUE_SIZE — предел очереди исходящих сообщений, OVERFLOW — что делать при
+# переполнении: 'drop' выбрасывает самое старое сообщение, 'close' закрывает сокет
+GAME_WEBSOCKETS = {
+    'players': {'HEARTBEAT': 20, 'IDLE_TIMEOUT': 60, 'QUEUE_SIZE': 64, 'OVERFLOW': 'drop'},
+    'spectators': {'HEARTBEAT': 30, 'IDLE_TIMEOUT': 90, 'QUEUE_SIZE': 32, 'OVERFLOW': 'drop'},
+    'bot': {'HEARTBEAT': None, 'IDLE_TIMEOUT': None, 'QUEUE_SIZE': 1024, 'OVERFLOW': 'close'},
+}
+
+# Как часто воркер записывает накопленные голоса зрителей, в секундах (см. game/audience.py)
+GAME_AUDIENCE_FLUSH_INTERVAL = 0.25
+
+# Пул асинхронного драйвера psycopg для горячих запросов сокетов на PostgreSQL
+# (см. game/db.py): MIN_SIZE и MAX_SIZE — границы пула на event loop, TIMEOUT —
+# сколько секунд ждать свободного соединения. None — все запросы через ORM
+GAME_DB_POOL = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5,
+}
+
+# Разбиение игроков на пары: 'pairs', 'round_robin' или путь к функции
+GAME_PAIRING_STRATEGY = 'pairs'
@@ -14,16 +14,23 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
 from UNIT_HACK_2025.views import HomeView
+from game.views.metrics import MetricsView
+from game.views.schema import SchemaView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', HomeView.as_view(), name='home'),
     path('game/', include('game.urls')),
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('api/schema/', SchemaView.as_view(), name='schema'),
 ]
+
+if settings.GAME_API_DOCS:
+    from drf_spectacular.views import SpectacularSwaggerView
+
+    urlpatterns.append(path('docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'))
@@ -7,5 +7,9 @@ pip install -r requirements.txt
 # Convert static asset files
 python manage.py collectstatic --no-input
 
+# Prebuild the API schema served at /api/schema/ (the generator needs the doc apps,
+# even when the deployment turns them off with GAME_API_DOCS=0)
+GAME_API_DOCS=1 python manage.py buildschema
+
 # Apply any outstanding database migrations
 python manage.py migrate
\ No newline at end of file
@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        from django.conf import settings
+
+        from game import budgets
+        from game import catalog  # noqa: F401 — сигналы сброса каталога
+
+        if settings.GAME_QUERY_BUDGETS:
+            budgets.install()
+
+        if settings.GAME_METRICS:
+            from game import metrics
+
+            metrics.install()
@@ -0,0 +1,49 @@
+"""
+Голоса зрителей.
+
+Зритель голосует за одного из двух игроков текущей пары. Воркер копит голоса
+в памяти в течение GAME_AUDIENCE_FLUSH_INTERVAL секунд и записывает их
+в хранилище состояния одним вызовом на раунд, где повторные голоса сессии
+отбрасываются. Поэтому тысячи голосов за раунд стоят нескольких записей.
+Итоги подмешиваются в результаты раунда (см. game.transitions).
+"""
+from django.conf import settings
+
+from game import metrics
+from game.loops import PerLoop, WindowBuffer
+from game.state import get_game_state
+
+
+class AudienceTally(WindowBuffer):
+    def add(self, room, prompt_index, session, choice):
+        """
+        Запоминает голос сессии за игрока choice (0 или 1) в раунде prompt_index.
+        Внутри окна засчитывается первый голос сессии.
+        """
+        self.buffer((room.code, prompt_index)).setdefault(session, choice)
+
+    async def send(self, key, votes):
+        room_code, prompt_index = key
+        # None — раунд уже закрыт, голоса опоздали
+        accepted = sum(await get_game_state().add_audience_votes(room_code, prompt_index, votes) or ())
+        metrics.audience_flushes_total.inc()
+        metrics.audience_votes_total.inc(accepted, status='accepted')
+        metrics.audience_votes_total.inc(len(votes) - accepted, status='rejected')
+
+
+_tallies = PerLoop(lambda: AudienceTally(settings.GAME_AUDIENCE_FLUSH_INTERVAL))
+
+
+def get_tally():
+    return _tallies.get()
+
+
+async def flush_audience(room, prompt_index):
+    """Дописывает голоса раунда, накопленные этим воркером, не дожидаясь окна."""
+    await get_tally().flush((room.code, prompt_index))
+
+
+async def get_audience_votes(room, prompt_index):
+    """Возвращает голоса зрителей раунда: {'player0': голоса, 'player1': голоса}."""
+    votes = await get_game_state().get_audience_votes(room.code, prompt_index)
+    return {'player0': votes[0], 'player1': votes[1]}
@@ -0,0 +1,61 @@
+"""
+Склейка частых групповых событий.
+
+Когда зал разом сканирует QR-код, каждое подключение порождает событие для
+всех экранов комнаты. Коалесцер копит такие события в течение окна
+GAME_BROADCAST_WINDOW секунд и отправляет группе одно сообщение со списком.
+"""
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from game.loops import PerLoop, WindowBuffer
+from game.roster import record_joins
+
+
+class BroadcastCoalescer(WindowBuffer):
+    def __init__(self, channel_layer, window):
+        super().__init__(window)
+        self.channel_layer = channel_layer
+
+    def new_buffer(self):
+        # Элементы по id и остальные поля сообщения
+        return {}, {}
+
+    async def add(self, group, type, field, items, **extra):
+        """
+        Добавляет элементы в сообщение {'type': type, field: [...]} для группы.
+        Элементы с одинаковым id внутри окна схлопываются в последний,
+        остальные поля сообщения берутся из последнего вызова.
+        """
+        if self.window <= 0:
+            await self.channel_layer.group_send(group, {'type': type, field: list(items), **extra})
+            return
+
+        buffer = self.buffer((group, type, field))
+        for item in items:
+            buffer[0][item['id']] = item
+        buffer[1].update(extra)
+
+    async def send(self, key, buffer):
+        group, type, field = key
+        items, extra = buffer
+        await self.channel_layer.group_send(group, {'type': type, field: list(items.values()), **extra})
+
+
+_coalescers = PerLoop(lambda: BroadcastCoalescer(get_channel_layer(), settings.GAME_BROADCAST_WINDOW))
+
+
+def get_coalescer():
+    return _coalescers.get()
+
+
+async def players_joined(room, players):
+    """
+    Записывает новых игроков в журнал состава и сообщает о них экранам
+    комнаты одним сообщением на окно.
+    """
+    players = [{'id': player.id, 'username': player.username} for player in players]
+    if not players:
+        return
+    version = await record_joins(room, players)
+    await get_coalescer().add(room.players_group, 'players_joined', 'players', players, version=version)
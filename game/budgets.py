@@ -0,0 +1,125 @@
+"""
+Бюджеты запросов к БД для обработчиков.
+
+Обработчик объявляет бюджет декоратором @query_budget(n). Пока включена
+настройка GAME_QUERY_BUDGETS (в тестах), каждый вызов записывает выполненный
+SQL и падает с QueryBudgetExceeded, если запросов больше бюджета или один и
+тот же запрос повторяется больше repeats раз — признак N+1.
+Запись SQL подключается к соединениям БД, только пока настройка включена;
+в остальное время декоратор стоит одной проверки настройки, а запросы
+идут без обёртки.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Одинаковый SQL, выполненный больше стольких раз за обработчик, считается N+1
+N_PLUS_ONE_REPEATS = 2
+
+# Списки открытых записей: вложенный обработчик пишет и в свой, и во внешний
+current_queries = ContextVar('current_queries', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def record_query(execute, sql, params, many, context):
+    for queries in current_queries.get():
+        queries.append(sql)
+    return execute(sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install():
+    """Подключает запись SQL к новым и уже открытым соединениям."""
+    connection_created.connect(install_query_recorder)
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+
+
+def uninstall():
+    connection_created.disconnect(install_query_recorder)
+    for connection in connections.all(initialized_only=True):
+        if record_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(record_query)
+
+
+@receiver(setting_changed)
+def toggle_query_recorder(setting, value, **kwargs):
+    # Тесты включают бюджеты через override_settings уже после запуска приложения
+    if setting != 'GAME_QUERY_BUDGETS':
+        return
+    if value:
+        install()
+    else:
+        uninstall()
+
+
+@contextmanager
+def record_queries():
+    """Собирает SQL, выполненный внутри блока, в том числе из sync_to_async."""
+    queries = []
+    token = current_queries.set(current_queries.get() + (queries,))
+    try:
+        yield queries
+    finally:
+        current_queries.reset(token)
+
+
+def check_budget(name, queries, limit, repeats=N_PLUS_ONE_REPEATS):
+    if len(queries) > limit:
+        raise QueryBudgetExceeded(
+            f'{name}: {len(queries)} queries over budget of {limit}:\n' + '\n'.join(queries))
+    statement, count = next(iter(Counter(
+        sql for sql in queries if not sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+    ).most_common(1)), (None, 0))
+    if count > repeats:
+        raise QueryBudgetExceeded(f'{name}: N+1, query repeated {count} times: {statement}')
+
+
+@contextmanager
+def query_budget_block(name, limit, repeats=N_PLUS_ONE_REPEATS):
+    with record_queries() as queries:
+        yield queries
+    check_budget(name, queries, limit, repeats)
+
+
+def query_budget(limit, repeats=N_PLUS_ONE_REPEATS):
+    """
+    Объявляет бюджет запросов обработчика: консьюмера, view или функции.
+    """
+    def decorator(func):
+        name = func.__qualname__
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not settings.GAME_QUERY_BUDGETS:
+                    return await func(*args, **kwargs)
+                with query_budget_block(name, limit, repeats):
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not settings.GAME_QUERY_BUDGETS:
+                    return func(*args, **kwargs)
+                with query_budget_block(name, limit, repeats):
+                    return func(*args, **kwargs)
+
+        wrapper.query_budget = limit
+        return wrapper
+
+    return decorator
@@ -0,0 +1,116 @@
+"""
+Каталог фраз и запасных ответов в памяти воркера.
+
+Каталог читается из БД при первом обращении и дальше отдаёт фразу и запасные
+ответы по id фразы без запросов, поэтому пары раундов выбираются без JOIN
+на Prompt. Сохранение или удаление Prompt и BackupAnswer сбрасывает каталог
+сигналом в своём процессе и рассылкой в группу CATALOG_GROUP в остальных.
+"""
+import random
+from asyncio import ensure_future
+from collections import namedtuple
+from threading import Lock
+from types import MappingProxyType
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from game.loops import PerLoop, group_messages
+from game.models import Prompt, BackupAnswer
+
+CATALOG_GROUP = 'game_catalog'
+
+
+class Catalog(namedtuple('Catalog', ('phrases', 'backup_answers'))):
+    """
+    phrases — {id фразы: текст}, backup_answers — {id фразы: (ответы, ...)}.
+    """
+
+    def phrase(self, prompt_id):
+        return self.phrases.get(prompt_id)
+
+    def backup_answer(self, prompt_id):
+        answers = self.backup_answers.get(prompt_id)
+        return random.choice(answers) if answers else None
+
+
+_catalog = None
+_generation = 0
+_lock = Lock()
+_listeners = PerLoop(lambda: ensure_future(listen()))
+
+
+def load_catalog():
+    global _catalog
+    with _lock:
+        generation = _generation
+        phrases = dict(Prompt.objects.values_list('id', 'phrase'))
+        backup_answers = {}
+        for prompt_id, text in BackupAnswer.objects.values_list('prompt_id', 'text'):
+            backup_answers.setdefault(prompt_id, []).append(text)
+        catalog = Catalog(
+            MappingProxyType(phrases),
+            MappingProxyType({prompt_id: tuple(answers) for prompt_id, answers in backup_answers.items()}),
+        )
+        # Сброс во время чтения означает, что прочитанное могло устареть: не запоминаем
+        if generation == _generation:
+            _catalog = catalog
+        return catalog
+
+
+def is_stale(catalog, prompt_ids):
+    # Фразы, созданные в обход сигналов (например, bulk_create), находятся по промаху
+    return catalog is None or any(prompt_id not in catalog.phrases for prompt_id in prompt_ids)
+
+
+def get_catalog(prompt_ids=()):
+    """
+    Возвращает каталог, перечитывая его, если в нём нет какой-то из prompt_ids.
+    """
+    catalog = _catalog
+    if is_stale(catalog, prompt_ids):
+        catalog = load_catalog()
+    return catalog
+
+
+async def aget_catalog(prompt_ids=()):
+    ensure_listener()
+    catalog = _catalog
+    if is_stale(catalog, prompt_ids):
+        catalog = await sync_to_async(load_catalog)()
+    return catalog
+
+
+def invalidate_catalog():
+    global _catalog, _generation
+    _generation += 1
+    _catalog = None
+
+
+def ensure_listener():
+    _listeners.get()
+
+
+async def listen():
+    channel_layer = get_channel_layer()
+    channel = await channel_layer.new_channel('catalog.')
+    async for message in group_messages(channel_layer, CATALOG_GROUP, channel):
+        if message.get('type') == 'catalog.invalidate':
+            invalidate_catalog()
+
+
+@receiver(post_save, sender=Prompt)
+@receiver(post_delete, sender=Prompt)
+@receiver(post_save, sender=BackupAnswer)
+@receiver(post_delete, sender=BackupAnswer)
+def catalog_changed(**kwargs):
+    # После коммита, иначе другие воркеры успеют перечитать старые данные
+    transaction.on_commit(broadcast_invalidation)
+
+
+def broadcast_invalidation():
+    invalidate_catalog()
+    async_to_sync(get_channel_layer().group_send)(CATALOG_GROUP, {'type': 'catalog.invalidate'})
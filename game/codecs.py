@@ -0,0 +1,84 @@
+"""
+Кодеки сообщений веб-сокетов.
+
+Текстовые кадры кодируются orjson, если он установлен, иначе стандартным json.
+Бот может запросить подпротокол msgpack и обмениваться бинарными кадрами.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_SUBPROTOCOL = 'msgpack'
+
+
+class JsonCodec:
+    name = 'json'
+    format_name = 'JSON'
+    binary = False
+    subprotocol = None
+
+    def encode(self, content):
+        return json.dumps(content)
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def encode(self, content):
+        return orjson.dumps(content).decode()
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    format_name = 'MessagePack'
+    binary = True
+    subprotocol = MSGPACK_SUBPROTOCOL
+
+    def encode(self, content):
+        return msgpack.packb(content)
+
+    def decode(self, data):
+        # Кроме ValueError unpackb бросает TypeError (ключ словаря не строка)
+        # и ExtraData (лишние байты после объекта); потребитель ловит ValueError
+        try:
+            return msgpack.unpackb(data)
+        except (ValueError, TypeError, msgpack.ExtraData) as exc:
+            raise ValueError(str(exc)) from exc
+
+
+def get_codecs():
+    """Доступные кодеки по имени: json есть всегда, остальные — если установлены."""
+    codecs = {'json': JsonCodec()}
+    if orjson is not None:
+        codecs['orjson'] = OrjsonCodec()
+    if msgpack is not None:
+        codecs['msgpack'] = MsgpackCodec()
+    return codecs
+
+
+def get_text_codec():
+    return OrjsonCodec() if orjson is not None else JsonCodec()
+
+
+def negotiate_codec(subprotocols, binary=False):
+    """
+    Выбирает кодек по подпротоколам, предложенным клиентом при подключении.
+    MessagePack включается только там, где его разрешает консьюмер.
+    """
+    if binary and msgpack is not None and MSGPACK_SUBPROTOCOL in subprotocols:
+        return MsgpackCodec()
+    return get_text_codec()
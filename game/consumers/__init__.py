@@ -1,2 +1,2 @@
 from .bot import BotConsumer
-from .players import PlayerConsumer
+from .players import PlayerConsumer, SpectatorConsumer
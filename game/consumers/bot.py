@@ -1,67 +1,79 @@
-from json import loads, JSONDecodeError
-from math import ceil
-
-from asgiref.sync import sync_to_async
-from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.layers import get_channel_layer
-from django.core.cache import cache
-from django.utils import timezone
-from drf_spectacular_websocket.decorators import extend_ws_schema
 
-from game.models import Player
+from game import metrics
+from game.broadcast import players_joined
+from game.budgets import query_budget
+from game.catalog import aget_catalog
+from game.consumers.mixins import CodecMixin, ConnectionMixin
+from game.db import aget_matchup, aget_matchups, aget_room, aregister_player, aregister_players
+from game.models import GameRoom
+from game.phase import get_phase
+from game.scheduler import ensure_scheduler
+from game.schema import extend_ws_schema
 from game.serializers import RegisterPlayerInputSerializer, StatusOutputSerializer, \
     SendPlayerAnswerInputSerializer, SendPlayerVoteInputSerializer, PlayersPromptsOutputSerializer, \
-    PlayerAnswersOutputSerializer
-
-
-@sync_to_async
-def get_players(prompt_index):
-    return list(Player.objects.select_related('prompt').all().order_by('prompt')[2 * (prompt_index - 1):2 * prompt_index])
+    PlayerAnswersOutputSerializer, RegisterPlayersInputSerializer, SendPlayerAnswersInputSerializer, \
+    SendPlayerVotesInputSerializer, BatchStatusOutputSerializer, ReceivePlayerAnswersInputSerializer
+from game.transitions import complete_answers, complete_round
+from game.validation import get_validator
+from game.state import get_game_state, ANSWER_CLOSED, ANSWER_UNKNOWN_PLAYER, ANSWER_ACCEPTED, VOTE_CLOSED, \
+    VOTE_UNKNOWN_PLAYER, VOTE_DUPLICATE
 
 
-@sync_to_async
-def get_all_players():
-    return list(Player.objects.select_related('prompt').all())
+class BotConsumer(ConnectionMixin, CodecMixin, AsyncJsonWebsocketConsumer):
+    consumer = 'bot'
+    allow_binary = True
+    room = None
 
-
-class BotConsumer(AsyncJsonWebsocketConsumer):
+    @query_budget(4)
     async def connect(self):
-        await self.channel_layer.group_add('bot', self.channel_name)
+        try:
+            self.room = await aget_room(self.scope['url_route']['kwargs'].get('room'))
+        except GameRoom.DoesNotExist:
+            return await self.close()
+        ensure_scheduler()
+        await self.channel_layer.group_add(self.room.bot_group, self.channel_name)
         await self.accept()
+        metrics.websockets.inc(consumer='bot')
 
         await self.send_json({'status': 'ok'})
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard('players', self.channel_name)
-
-    async def receive(self, text_data=None, bytes_data=None, **kwargs):
-        if text_data is None:
-            return
-
-        try:
-            content = loads(text_data)
-        except JSONDecodeError:
-            await self.send_json({
-                'status': 'error',
-                'message': 'Invalid JSON format'
-            })
-            return
-
-        await self.receive_json(content)
+        if self.room is not None:
+            metrics.websockets.dec(consumer='bot')
+            await self.channel_layer.group_discard(self.room.bot_group, self.channel_name)
 
     async def receive_json(self, content, **kwargs):
-        type = content.get('type')
+        type = content.get('type') if isinstance(content, dict) else None
+        with metrics.track(f'bot:{type}', metrics.bot_message_seconds, type=type):
+            validate = get_validator(type)
+            if validate is not None:
+                content, errors = validate(content)
+                if errors:
+                    return await self.send_json({'type': type, 'status': 'error', 'message': 'Invalid message',
+                                                 'errors': errors})
+            await self.dispatch_message(type, content)
+
+    async def dispatch_message(self, type, content):
         if type == 'register_player':
             await self.register_player(content)
         elif type == 'send_player_answer':
             await self.send_player_answer(content)
         elif type == 'send_player_vote':
             await self.send_player_vote(content)
+        elif type == 'register_players':
+            await self.register_players(content)
+        elif type == 'send_player_answers':
+            await self.send_player_answers(content)
+        elif type == 'send_player_votes':
+            await self.send_player_votes(content)
         elif type == 'receive_players_prompts':
             await self.receive_players_prompts(content)
         elif type == 'receive_player_answers':
             await self.receive_player_answers(content)
+        elif type in ('ping', 'pong'):
+            await self.receive_heartbeat(content)
         else:
             await self.send_json({
                 'status': 'error',
@@ -74,164 +86,209 @@ class BotConsumer(AsyncJsonWebsocketConsumer):
         type='send',
         description='Регистрация игрока'
     )
+    @query_budget(3)
     async def register_player(self, content):
-        telegram_id = content.get('telegram_id')
+        telegram_id = content['telegram_id']
         username = content.get('username', '')
 
-        if telegram_id is None:
-            await self.send_json({'status': 'error', 'message': 'telegram_id is required'})
-            return
-
-        player, created = await database_sync_to_async(Player.objects.get_or_create)(
-            telegram_id=telegram_id,
-            defaults={'username': username, 'prompt': None, 'answer': None, 'vote_count': None},
-        )
-
-        if not created:
-            player.username = username
-            player.joined_at = timezone.now()
-            await player.asave()
-
-        channel_layer = get_channel_layer()
-        await channel_layer.group_send(
-            'players',
-            {
-                'type': 'player_joined',
-                'player': {
-                    'id': player.id,
-                    'username': player.username,
-                },
-            }
-        )
+        player = await aregister_player(self.room, telegram_id, username)
+        await get_game_state().add_player(self.room.code, telegram_id)
+        await players_joined(self.room, [player])
 
         return await self.send_json({'type': 'register_player', 'status': 'ok'})
 
+    @extend_ws_schema(
+        request=RegisterPlayersInputSerializer,
+        responses={200: BatchStatusOutputSerializer},
+        type='send',
+        description='Регистрация пачки игроков'
+    )
+    @query_budget(4)
+    async def register_players(self, content):
+        items = content['players']
+        players = {}
+        statuses = []
+        for item in items:
+            players[item['telegram_id']] = item.get('username', '')
+            statuses.append({'telegram_id': item['telegram_id'], 'status': 'ok'})
+
+        if players:
+            registered = await aregister_players(self.room, players)
+            await get_game_state().add_players(self.room.code, list(players))
+            await players_joined(self.room, registered)
+
+        return await self.send_json({'type': 'register_players', 'status': 'ok', 'results': statuses})
+
     @extend_ws_schema(
         request=SendPlayerAnswerInputSerializer,
         responses={200: StatusOutputSerializer},
         type='send',
         description='Отправка ответа игрока'
     )
+    @query_budget(3)
     async def send_player_answer(self, content):
-        telegram_id = content.get('telegram_id')
-        answer = content.get('answer')
-
-        player = await Player.objects.aget(telegram_id=telegram_id)
-        player.answer = answer
-        await player.asave()
+        telegram_id = content['telegram_id']
+        answer = content['answer']
+        prompt_index = content.get('round')
 
-        total_players = await Player.objects.acount()
-        answered_players = await Player.objects.filter(answer__isnull=False).acount()
+        state = get_game_state()
+        status, answered_players, total_players = await state.set_answer(
+            self.room.code, telegram_id, answer, prompt_index)
+        if status == ANSWER_CLOSED:
+            return await self.send_json({'status': 'error', 'message': 'Answering is closed'})
+        if status == ANSWER_UNKNOWN_PLAYER:
+            return await self.send_json({'status': 'error', 'message': 'Unknown player'})
 
-        if answered_players >= total_players > 0:
-            channel_layer = get_channel_layer()
-            await channel_layer.group_send(
-                'players',
-                {
-                    'type': 'all_answers_received',
-                }
-            )
+        if status == ANSWER_ACCEPTED and answered_players >= total_players > 0:
+            await complete_answers(self.room)
 
         return await self.send_json({'status': 'ok'})
 
+    @extend_ws_schema(
+        request=SendPlayerAnswersInputSerializer,
+        responses={200: BatchStatusOutputSerializer},
+        type='send',
+        description='Отправка пачки ответов игроков'
+    )
+    @query_budget(3)
+    async def send_player_answers(self, content):
+        items = content['answers']
+        state = get_game_state()
+        results = await state.set_answers(
+            self.room.code, [(item.get('telegram_id'), item.get('answer'), item.get('round')) for item in items])
+
+        statuses = []
+        completed = False
+        for item, (status, answered_players, total_players) in zip(items, results):
+            if status == ANSWER_CLOSED:
+                statuses.append({'telegram_id': item.get('telegram_id'), 'status': 'error',
+                                 'message': 'Answering is closed'})
+                continue
+            if status == ANSWER_UNKNOWN_PLAYER:
+                statuses.append({'telegram_id': item.get('telegram_id'), 'status': 'error', 'message': 'Unknown player'})
+                continue
+            statuses.append({'telegram_id': item.get('telegram_id'), 'status': 'ok'})
+            completed = completed or (status == ANSWER_ACCEPTED and answered_players >= total_players > 0)
+
+        if completed:
+            await complete_answers(self.room)
+
+        return await self.send_json({'type': 'send_player_answers', 'status': 'ok', 'results': statuses})
+
     @extend_ws_schema(
         request=SendPlayerVoteInputSerializer,
         responses={200: StatusOutputSerializer},
         type='send',
         description='Отправка голоса игрока'
     )
+    @query_budget(9)
     async def send_player_vote(self, content):
-        voter_id = content.get('voter_id')
-        candidate_id = content.get('candidate_id')
-
-        voter = await Player.objects.aget(telegram_id=voter_id)
-        if voter.is_voted:
+        voter_id = content['voter_id']
+        candidate_id = content['candidate_id']
+
+        state = get_game_state()
+        status, remaining, prompt_index = await state.record_vote(self.room.code, voter_id, candidate_id)
+        if status == VOTE_CLOSED:
+            return await self.send_json({'type': 'send_player_vote', 'status': 'error', 'message': 'Voting is closed'})
+        if status == VOTE_UNKNOWN_PLAYER:
+            return await self.send_json({'type': 'send_player_vote', 'status': 'error', 'message': 'Unknown player'})
+        if status == VOTE_DUPLICATE:
             return await self.send_json({'type': 'send_player_vote', 'status': 'Already voted'})
 
-        voter.is_voted = True
-        await voter.asave()
-
-        candidate = await Player.objects.aget(telegram_id=candidate_id)
-        candidate.vote_count = (candidate.vote_count or 0) + 1
-        await candidate.asave()
-
         channel_layer = get_channel_layer()
-        await channel_layer.group_send('players', {'type': 'player_voted'})
+        await channel_layer.group_send(self.room.players_group, {'type': 'player_voted'})
 
-        remaining = await Player.objects.filter(is_voted=False).acount()
         if remaining == 2:
-            prompt_index = await sync_to_async(cache.get)("prompt_index") or 0
-
-            async for p in Player.objects.filter(is_voted=True):
-                p.is_voted = False
-                await p.asave()
-
-            players = await get_players(prompt_index)
-            await sync_to_async(cache.set)("prompt_index", prompt_index + 1, timeout=300)
-
-            total_players = await Player.objects.acount()
-            is_all_voted = prompt_index == ceil(total_players / 2)
-
-            result = {
-                'all_voted': is_all_voted,
-                "prompt": players[0].prompt.phrase,
-                "player0": {
-                    "username": players[0].username,
-                    "answer": players[0].answer,
-                    "vote_count": players[0].vote_count or 0,
-                },
-                "player1": {
-                    "username": players[1].username,
-                    "answer": players[1].answer,
-                    "vote_count": players[1].vote_count or 0,
-                },
-            }
-
-            await channel_layer.group_send('players', {'type': 'all_voted', 'message': result})
-
-            if not is_all_voted:
-                await channel_layer.group_send('bot', {'type': 'receive_player_answers'})
+            await complete_round(self.room, prompt_index)
 
         return await self.send_json({'type': 'send_player_vote', 'status': 'ok'})
 
+    @extend_ws_schema(
+        request=SendPlayerVotesInputSerializer,
+        responses={200: BatchStatusOutputSerializer},
+        type='send',
+        description='Отправка пачки голосов игроков'
+    )
+    @query_budget(9)
+    async def send_player_votes(self, content):
+        items = content['votes']
+        state = get_game_state()
+        results = await state.record_votes(
+            self.room.code, [(item.get('voter_id'), item.get('candidate_id')) for item in items])
+
+        statuses = []
+        closing_round = None
+        for item, (status, remaining, prompt_index) in zip(items, results):
+            if status == VOTE_CLOSED:
+                statuses.append({'voter_id': item.get('voter_id'), 'status': 'error', 'message': 'Voting is closed'})
+            elif status == VOTE_UNKNOWN_PLAYER:
+                statuses.append({'voter_id': item.get('voter_id'), 'status': 'error', 'message': 'Unknown player'})
+            elif status == VOTE_DUPLICATE:
+                statuses.append({'voter_id': item.get('voter_id'), 'status': 'Already voted'})
+            else:
+                statuses.append({'voter_id': item.get('voter_id'), 'status': 'ok'})
+                if remaining == 2:
+                    closing_round = prompt_index
+
+        if any(status['status'] == 'ok' for status in statuses):
+            channel_layer = get_channel_layer()
+            await channel_layer.group_send(self.room.players_group, {'type': 'player_voted'})
+        if closing_round is not None:
+            await complete_round(self.room, closing_round)
+
+        return await self.send_json({'type': 'send_player_votes', 'status': 'ok', 'results': statuses})
+
     @extend_ws_schema(
         responses={200: PlayersPromptsOutputSerializer},
         type='receive',
         description='Получение фразы игрока'
     )
+    @query_budget(1)
     async def receive_players_prompts(self, _content):
 
-        players = await get_all_players()
+        matchups = await aget_matchups(self.room)
+        catalog = await aget_catalog([m.prompt_id for m in matchups])
 
         result = []
-        for p in players:
-            result.append({
-                'telegram_id': p.telegram_id,
-                'prompt': p.prompt.phrase
-            })
+        for m in matchups:
+            for player in (m.player_a, m.player_b):
+                result.append({
+                    'telegram_id': player.telegram_id,
+                    'prompt': catalog.phrase(m.prompt_id),
+                    'round': m.round,
+                })
 
         return await self.send_json({'type': 'receive_players_prompts', "players": result})
 
     @extend_ws_schema(
+        request=ReceivePlayerAnswersInputSerializer,
         responses={200: PlayerAnswersOutputSerializer},
         type='receive',
         description='Получение ответа игрока'
     )
-    async def receive_player_answers(self, _content):
-        prompt_index = await sync_to_async(cache.get)('prompt_index', 0)
-
-        players = await get_players(prompt_index)
-
+    @query_budget(1)
+    async def receive_player_answers(self, content):
+        prompt_index = content.get('round')
+        if prompt_index is None:
+            prompt_index = (await get_phase(self.room, fresh=True)).round
+
+        matchup = await aget_matchup(self.room, prompt_index)
+        if matchup is None:
+            return await self.send_json({'type': 'receive_player_answers', 'status': 'error',
+                                         'message': f'No matchup for round {prompt_index}'})
+
+        catalog = await aget_catalog([matchup.prompt_id])
         result = {
             "type": "receive_player_answers",
-            "prompt": players[0].prompt.phrase,
+            "round": matchup.round,
+            "prompt": catalog.phrase(matchup.prompt_id),
             "answer0": {
-                "telegram_id": players[0].telegram_id,
-                "answer": players[0].answer,
+                "telegram_id": matchup.player_a.telegram_id,
+                "answer": matchup.answer_a,
             },
             "answer1": {
-                "telegram_id": players[1].telegram_id,
-                "answer": players[1].answer,
+                "telegram_id": matchup.player_b.telegram_id,
+                "answer": matchup.answer_b,
             },
         }
 
@@ -0,0 +1,139 @@
+from asyncio import CancelledError, Queue, current_task, ensure_future, sleep
+from time import monotonic
+
+from channels.exceptions import StopConsumer
+from django.conf import settings
+
+from game import metrics
+from game.codecs import negotiate_codec
+
+# Коды закрытия из диапазона приложений (4000–4999)
+CLOSE_IDLE = 4000
+CLOSE_OVERFLOW = 4001
+
+
+class CodecMixin:
+    """
+    Кодирует и декодирует сообщения выбранным при подключении кодеком
+    вместо стандартного json у AsyncJsonWebsocketConsumer
+    """
+    allow_binary = False
+    codec = None
+
+    async def accept(self, subprotocol=None, headers=None):
+        self.codec = negotiate_codec(self.scope.get('subprotocols', ()), binary=self.allow_binary)
+        await super().accept(subprotocol=subprotocol or self.codec.subprotocol, headers=headers)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        data = bytes_data if self.codec.binary else text_data
+        if data is None:
+            return
+
+        try:
+            content = self.codec.decode(data)
+        except ValueError:
+            await self.send_json({
+                'status': 'error',
+                'message': f'Invalid {self.codec.format_name} format'
+            })
+            return
+
+        await self.receive_json(content, **kwargs)
+
+    async def send_json(self, content, close=False):
+        if self.codec.binary:
+            await self.send(bytes_data=self.codec.encode(content), close=close)
+        else:
+            await self.send(text_data=self.codec.encode(content), close=close)
+
+
+class ConnectionMixin:
+    """
+    Живость соединения и ограниченная очередь отправки.
+
+    После accept исходящие сообщения кладутся в очередь, которую пишет в сокет
+    отдельная задача: обработчики рассылок не ждут медленного клиента, и память
+    на него ограничена QUEUE_SIZE. Клиент, который дольше IDLE_TIMEOUT не
+    прислал ни одного сообщения (в том числе pong на наш ping), закрывается
+    и сразу выходит из групп. Настройки — GAME_WEBSOCKETS[consumer].
+    """
+    consumer = None
+    send_queue = None
+    released = False
+
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol=subprotocol, headers=headers)
+        options = settings.GAME_WEBSOCKETS[self.consumer]
+        self.overflow = options['OVERFLOW']
+        self.last_seen = monotonic()
+        self.send_queue = Queue(options['QUEUE_SIZE'])
+        self.socket_send, self.base_send = self.base_send, self.enqueue
+        self.tasks = [ensure_future(self.write())]
+        if options['HEARTBEAT']:
+            self.tasks.append(ensure_future(self.heartbeat(options['HEARTBEAT'], options['IDLE_TIMEOUT'])))
+
+    async def enqueue(self, message):
+        if self.released:
+            return
+        if self.send_queue.full():
+            if self.overflow == 'close':
+                metrics.websocket_overflow_closes_total.inc(consumer=self.consumer)
+                await self.drop(CLOSE_OVERFLOW)
+                return
+            self.send_queue.get_nowait()
+            metrics.websocket_dropped_total.inc(consumer=self.consumer)
+        self.send_queue.put_nowait(message)
+
+    async def write(self):
+        while True:
+            message = await self.send_queue.get()
+            try:
+                await self.socket_send(message)
+            except CancelledError:
+                raise
+            except Exception:
+                # Сокет уже закрыт: дальше придёт websocket.disconnect
+                return
+
+    async def heartbeat(self, interval, idle_timeout):
+        while True:
+            await sleep(interval)
+            if idle_timeout and monotonic() - self.last_seen > idle_timeout:
+                metrics.websocket_reaped_total.inc(consumer=self.consumer)
+                await self.drop(CLOSE_IDLE)
+                return
+            metrics.websocket_pings_total.inc(consumer=self.consumer)
+            await self.send_json({'type': 'ping'})
+
+    async def drop(self, code):
+        """Закрывает сокет мимо очереди и сразу отпускает группы и задачи."""
+        if self.released:
+            return
+        self.release()
+        await self.socket_send({'type': 'websocket.close', 'code': code})
+        await self.disconnect(code)
+
+    def release(self):
+        self.released = True
+        for task in getattr(self, 'tasks', ()):
+            if task is not current_task():
+                task.cancel()
+
+    async def websocket_receive(self, message):
+        self.last_seen = monotonic()
+        await super().websocket_receive(message)
+
+    async def websocket_disconnect(self, message):
+        # Сокет, закрытый нами, уже вышел из групп
+        if self.released:
+            raise StopConsumer()
+        self.release()
+        await super().websocket_disconnect(message)
+
+    async def receive_json(self, content, **kwargs):
+        await self.receive_heartbeat(content)
+
+    async def receive_heartbeat(self, content):
+        # Клиент тоже может проверять соединение своим ping
+        if isinstance(content, dict) and content.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
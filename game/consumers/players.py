@@ -1,36 +1,129 @@
-from json import dumps
+from urllib.parse import parse_qs
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.urls import reverse
 
-from game.models import Player
+from game import metrics
+from game.audience import get_tally
+from game.consumers.mixins import CodecMixin, ConnectionMixin
+from game.db import aget_room
+from game.models import GamePhase, GameRoom
+from game.phase import get_phase
+from game.roster import get_snapshot, get_changes
+from game.scheduler import ensure_scheduler
+from game.spectators import get_hub
 
 
-class PlayerConsumer(AsyncJsonWebsocketConsumer):
+class PlayerConsumer(ConnectionMixin, CodecMixin, AsyncJsonWebsocketConsumer):
+    consumer = 'players'
+    room = None
+
     async def connect(self):
-        await self.channel_layer.group_add('players', self.channel_name)
+        with metrics.track('players:connect'):
+            await self.join()
+
+    async def join(self):
+        try:
+            self.room = await aget_room(self.scope['url_route']['kwargs'].get('room'))
+        except GameRoom.DoesNotExist:
+            # Неизвестная комната не создаётся, сокет отклоняется
+            return await self.close()
+        # Сроки фаз проверяет воркер, к которому подключены экраны или бот
+        ensure_scheduler()
         await self.accept()
+        await self.subscribe()
+        metrics.websockets.inc(consumer=self.consumer)
 
-        players = await database_sync_to_async(list)(
-            Player.objects.order_by('joined_at').values('id', 'username'))
-        await self.send_json({'type': 'init', 'players': players})
+        # Экран с известной версией состава получает только изменения после неё
+        since = parse_qs(self.scope.get('query_string', b'').decode()).get('since')
+        if since and since[0].isdigit():
+            changes = await get_changes(self.room, int(since[0]))
+            if changes is not None:
+                version, players = changes
+                await self.send_json({'type': 'new_players', 'version': version, 'players': players})
+                return
+
+        snapshot = await database_sync_to_async(get_snapshot)(self.room)
+        await self.send(text_data=snapshot.frame)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard('players', self.channel_name)
+        if self.room is not None:
+            metrics.websockets.dec(consumer=self.consumer)
+            await self.unsubscribe()
+
+    async def subscribe(self):
+        await self.channel_layer.group_add(self.room.players_group, self.channel_name)
+
+    async def unsubscribe(self):
+        await self.channel_layer.group_discard(self.room.players_group, self.channel_name)
 
     async def player_joined(self, content):
         await self.send_json({'type': 'new_player', 'player': content['player']})
 
+    async def players_joined(self, content):
+        await self.send_json({'type': 'new_players', 'version': content.get('version'), 'players': content['players']})
+
     async def player_voted(self, content):
         ...
 
     async def all_voted(self, content):
-        message = content['message']
-        await self.send(text_data=dumps(message))
+        await self.send_json(content['message'])
+
+    async def leaderboard(self, content):
+        await self.send_json({'type': 'leaderboard', 'players': content['players']})
 
     async def all_answers_received(self, content):
-        url = content.get('url', '/game/vote/')
+        url = content.get('url') or reverse('game:vote', kwargs={'room': self.room.code})
         await self.send_json({
             'type': 'redirect',
             'url': url
         })
+
+
+class SpectatorConsumer(PlayerConsumer):
+    """
+    Зритель: те же сообщения, что у экрана, но без своего канала в channel layer.
+    События приходят через общую подписку воркера на комнату (game.spectators).
+    """
+    consumer = 'spectators'
+    channel_layer_alias = None
+    session = None
+
+    async def subscribe(self):
+        await get_hub().subscribe(self.room, self)
+
+    async def unsubscribe(self):
+        await get_hub().unsubscribe(self.room, self)
+
+    async def receive_json(self, content, **kwargs):
+        if isinstance(content, dict) and content.get('type') == 'vote':
+            await self.vote(content)
+        else:
+            await super().receive_json(content, **kwargs)
+
+    async def vote(self, content):
+        """Голос за первого (candidate=0) или второго (1) игрока текущей пары."""
+        choice = content.get('candidate')
+        if choice not in (0, 1):
+            return await self.send_json({'type': 'vote', 'status': 'error', 'message': 'candidate must be 0 or 1'})
+        current = await get_phase(self.room)
+        if current.phase != GamePhase.VOTING:
+            return await self.send_json({'type': 'vote', 'status': 'error', 'message': 'Voting is closed'})
+        if self.session is None:
+            self.session = await self.get_session_key()
+            if self.session is None:
+                return await self.send_json({'type': 'vote', 'status': 'error', 'message': 'Session required'})
+        get_tally().add(self.room, current.round, self.session, choice)
+        await self.send_json({'type': 'vote', 'status': 'ok', 'round': current.round})
+
+    async def get_session_key(self):
+        """
+        Ключ сессии браузера, заведённой страницей комнаты (game.views.mixins).
+        По нему голоса одного зрителя считаются один раз и после переподключения.
+        """
+        session = self.scope.get('session')
+        key = getattr(session, 'session_key', None)
+        if key and await database_sync_to_async(session.exists)(key):
+            return key
+        return None
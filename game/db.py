@@ -0,0 +1,245 @@
+"""
+Доступ к БД на горячих путях сокетов: комната, регистрация игроков, пары раунда.
+
+Вызовы ORM из потребителей идут через database_sync_to_async, то есть по одному
+в общем потоке: все сокеты воркера стоят в одной очереди к БД. На PostgreSQL
+с установленным psycopg 3 те же запросы выполняет асинхронный драйвер через
+ограниченный пул соединений (GAME_DB_POOL), по пулу на event loop, без потоков.
+На остальных базах (SQLite в тестах) и без psycopg запросы идут через ORM.
+Ответы и голоса в БД на каждое сообщение не ходят: они копятся в хранилище
+состояния (game.state) и переносятся в БД на границе раунда (game.rounds).
+"""
+from asyncio import ensure_future, shield
+from functools import cache
+from time import perf_counter
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from game import metrics
+from game.budgets import current_queries
+from game.loops import PerLoop
+from game.models import GameRoom, Matchup, Player
+from game.rooms import create_room, get_room, register_player, register_players
+from game.rounds import get_matchup, get_matchups
+
+try:
+    from psycopg.conninfo import make_conninfo
+    from psycopg.pq import Conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    AsyncConnectionPool = None
+
+
+class OrmDatabase:
+    """Те же запросы через ORM в потоке database_sync_to_async."""
+
+    get_room = staticmethod(database_sync_to_async(get_room))
+    create_room = staticmethod(database_sync_to_async(create_room))
+    register_player = staticmethod(database_sync_to_async(register_player))
+    register_players = staticmethod(database_sync_to_async(register_players))
+    get_matchup = staticmethod(database_sync_to_async(get_matchup))
+    get_matchups = staticmethod(database_sync_to_async(get_matchups))
+
+
+def columns(model, alias):
+    return ', '.join(f'{alias}.{field.column}' for field in model._meta.concrete_fields)
+
+
+def attnames(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+ROOM_FIELDS = attnames(GameRoom)
+PLAYER_FIELDS = attnames(Player)
+MATCHUP_FIELDS = attnames(Matchup)
+
+SELECT_ROOM = f'SELECT {columns(GameRoom, "r")} FROM {GameRoom._meta.db_table} r WHERE r.code = %s'
+
+INSERT_ROOM = (
+    f'INSERT INTO {GameRoom._meta.db_table} AS r (code, created_at) VALUES (%s, %s) '
+    f'ON CONFLICT (code) DO NOTHING RETURNING {columns(GameRoom, "r")}'
+)
+
+# Вернувшийся игрок получает новое имя и время входа, счёт голосов остаётся
+UPSERT_PLAYERS = (
+    f'INSERT INTO {Player._meta.db_table} AS p (room_id, telegram_id, username, joined_at, vote_count) '
+    f'SELECT %s, t.telegram_id, t.username, %s, NULL FROM unnest(%s::bigint[], %s::text[]) AS t(telegram_id, username) '
+    f'ON CONFLICT (room_id, telegram_id) DO UPDATE '
+    f'SET username = EXCLUDED.username, joined_at = EXCLUDED.joined_at '
+    f'RETURNING {columns(Player, "p")}'
+)
+
+# Пара вместе с обоими игроками, как select_related('player_a', 'player_b')
+MATCHUPS_QUERY = (
+    f'SELECT {columns(Matchup, "m")}, {columns(Player, "a")}, {columns(Player, "b")} '
+    f'FROM {Matchup._meta.db_table} m '
+    f'JOIN {Player._meta.db_table} a ON a.id = m.player_a_id '
+    f'JOIN {Player._meta.db_table} b ON b.id = m.player_b_id '
+    f'WHERE m.room_id = %s'
+)
+
+SELECT_MATCHUPS = f'{MATCHUPS_QUERY} ORDER BY m.round'
+
+SELECT_MATCHUP = f'{MATCHUPS_QUERY} AND m.round = %s LIMIT 1'
+
+
+def load_player(row):
+    return Player.from_db('default', PLAYER_FIELDS, row)
+
+
+def load_matchup(row):
+    size = len(MATCHUP_FIELDS)
+    matchup = Matchup.from_db('default', MATCHUP_FIELDS, row[:size])
+    matchup.player_a = load_player(row[size:size + len(PLAYER_FIELDS)])
+    matchup.player_b = load_player(row[size + len(PLAYER_FIELDS):])
+    return matchup
+
+
+def libpq_options(options):
+    """
+    Оставляет из OPTIONS базы параметры соединения libpq. Остальные
+    (isolation_level, pool, server_side_binding, assume_role) понимает
+    только бэкенд Django.
+    """
+    keywords = {option.keyword.decode() for option in Conninfo.get_defaults()}
+    return {
+        key: value for key, value in options.items()
+        if key in keywords and isinstance(value, (str, int))
+    }
+
+
+class PooledDatabase:
+    """
+    Запросы драйвером psycopg через AsyncConnectionPool. Соединения в режиме
+    autocommit: каждый запрос горячего пути — отдельная транзакция.
+    """
+
+    def __init__(self, database, min_size=1, max_size=10, timeout=5):
+        self.conninfo = make_conninfo(
+            dbname=database['NAME'],
+            user=database['USER'] or None,
+            password=database['PASSWORD'] or None,
+            host=database['HOST'] or None,
+            port=database['PORT'] or None,
+            **libpq_options(database.get('OPTIONS', {})),
+        )
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._pools = PerLoop(self._open_pool)
+
+    def _open_pool(self):
+        pool = AsyncConnectionPool(
+            self.conninfo,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            timeout=self.timeout,
+            kwargs={'autocommit': True},
+            open=False,
+        )
+        return pool, ensure_future(pool.open())
+
+    async def _pool(self):
+        pool, opening = self._pools.get()
+        await shield(opening)
+        return pool
+
+    async def close(self):
+        """Закрывает пул текущего event loop."""
+        pool, _ = self._pools.pop() or (None, None)
+        if pool is not None:
+            await pool.close()
+
+    async def _fetch(self, sql, params):
+        for queries in current_queries.get():
+            queries.append(sql)
+        handler = metrics.current_handler.get()
+        started = perf_counter()
+        pool = await self._pool()
+        try:
+            async with pool.connection() as connection:
+                cursor = await connection.execute(sql, params)
+                return await cursor.fetchall()
+        finally:
+            if handler is not None:
+                metrics.db_queries_total.inc(handler=handler)
+                metrics.db_query_seconds_total.inc(perf_counter() - started, handler=handler)
+
+    async def get_room(self, code=None):
+        code = code or settings.GAME_DEFAULT_ROOM
+        rows = await self._fetch(SELECT_ROOM, (code,))
+        if rows:
+            return GameRoom.from_db('default', ROOM_FIELDS, rows[0])
+        if code == settings.GAME_DEFAULT_ROOM:
+            return (await self.create_room(code))[0]
+        raise GameRoom.DoesNotExist(f'Room {code} does not exist')
+
+    async def create_room(self, code):
+        rows = await self._fetch(INSERT_ROOM, (code, timezone.now()))
+        if rows:
+            return GameRoom.from_db('default', ROOM_FIELDS, rows[0]), True
+        # Комната уже была или вставку опередил другой воркер
+        rows = await self._fetch(SELECT_ROOM, (code,))
+        return GameRoom.from_db('default', ROOM_FIELDS, rows[0]), False
+
+    async def register_player(self, room, telegram_id, username):
+        return (await self.register_players(room, {telegram_id: username}))[0]
+
+    async def register_players(self, room, players):
+        rows = await self._fetch(UPSERT_PLAYERS, (room.id, timezone.now(), list(players), list(players.values())))
+        return [load_player(row) for row in rows]
+
+    async def get_matchup(self, room, prompt_index):
+        rows = await self._fetch(SELECT_MATCHUP, (room.id, prompt_index))
+        return load_matchup(rows[0]) if rows else None
+
+    async def get_matchups(self, room):
+        rows = await self._fetch(SELECT_MATCHUPS, (room.id,))
+        return [load_matchup(row) for row in rows]
+
+
+@cache
+def get_database():
+    database = settings.DATABASES['default']
+    config = settings.GAME_DB_POOL
+    if config is None or AsyncConnectionPool is None or database['ENGINE'] != 'django.db.backends.postgresql':
+        return OrmDatabase()
+    options = {key.lower(): value for key, value in config.items()}
+    return PooledDatabase(database, **options)
+
+
+@receiver(setting_changed)
+def reset_database(setting, **kwargs):
+    if setting in ('GAME_DB_POOL', 'DATABASES'):
+        get_database.cache_clear()
+
+
+async def aget_room(code=None):
+    """Комната по коду или GameRoom.DoesNotExist (см. game.rooms.get_room)."""
+    return await get_database().get_room(code)
+
+
+async def acreate_room(code):
+    """Создаёт комнату, если её ещё нет. Возвращает (комната, создана ли)."""
+    return await get_database().create_room(code)
+
+
+async def aregister_player(room, telegram_id, username):
+    return await get_database().register_player(room, telegram_id, username)
+
+
+async def aregister_players(room, players):
+    """Регистрирует пачку игроков {telegram_id: username} и возвращает их."""
+    return await get_database().register_players(room, players)
+
+
+async def aget_matchup(room, prompt_index):
+    return await get_database().get_matchup(room, prompt_index)
+
+
+async def aget_matchups(room):
+    return await get_database().get_matchups(room)
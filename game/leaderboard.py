@@ -0,0 +1,43 @@
+"""
+Таблица лидеров комнаты.
+
+Счёт игроков хранится в хранилище состояния (в Redis — сортированное
+множество) и пополняется итогами каждого раунда, поэтому первые K игроков
+и место игрока читаются без обхода таблицы Player. После раунда экраны
+комнаты получают обновлённую верхушку таблицы сообщением 'leaderboard'.
+"""
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from game.state import get_game_state
+
+
+def serialize(entries):
+    return [entry._asdict() for entry in entries]
+
+
+async def start_leaderboard(room, players):
+    """Заводит таблицу с нулевым счётом для игроков, получивших фразы."""
+    await get_game_state().reset_leaderboard(room.code, {player.telegram_id: player.username for player in players})
+
+
+async def get_top(room, limit=None):
+    return await get_game_state().get_leaderboard(room.code, limit or settings.GAME_LEADERBOARD_SIZE)
+
+
+async def get_rank(room, telegram_id):
+    return await get_game_state().get_rank(room.code, telegram_id)
+
+
+async def get_version(room):
+    return await get_game_state().get_leaderboard_version(room.code)
+
+
+async def record_round(room, scores):
+    """
+    Прибавляет голоса раунда {telegram_id: голоса} к счёту и рассылает экранам
+    верхушку таблицы. Вызывается один раз на раунд — тем, кто выиграл переход фазы.
+    """
+    await get_game_state().add_scores(room.code, scores)
+    top = await get_top(room)
+    await get_channel_layer().group_send(room.players_group, {'type': 'leaderboard', 'players': serialize(top)})
@@ -0,0 +1,91 @@
+"""
+Объекты, привязанные к event loop воркера.
+
+Клиенты Redis и пулы соединений, таймеры и каналы-подписчики живут в том
+event loop, где их создали, поэтому таких объектов держим по одному на цикл:
+PerLoop создаёт значение при первом обращении из цикла и забывает его
+вместе с циклом. WindowBuffer копит частые события в течение окна и отдаёт
+их дальше одним вызовом. group_messages читает сообщения группы channel
+layer для долгоживущего канала-подписчика.
+"""
+from asyncio import TimeoutError, ensure_future, get_running_loop, sleep, wait_for
+from time import monotonic
+from weakref import WeakKeyDictionary
+
+# Членство в группе channel layer истекает, поэтому подписчик периодически его продлевает
+GROUP_REFRESH = 60 * 60
+
+
+class PerLoop:
+    """Значение factory(), по одному на event loop."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.values = WeakKeyDictionary()
+
+    def get(self):
+        loop = get_running_loop()
+        if loop not in self.values:
+            self.values[loop] = self.factory()
+        return self.values[loop]
+
+    def pop(self):
+        """Забывает значение текущего цикла и возвращает его или None."""
+        return self.values.pop(get_running_loop(), None)
+
+
+class WindowBuffer:
+    """
+    Буферы по ключу: первый вызов buffer(key) заводит буфер new_buffer()
+    и через window секунд передаёт накопленное в send(key, buffer).
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.buffers = {}
+        self.tasks = set()
+
+    def new_buffer(self):
+        return {}
+
+    async def send(self, key, buffer):
+        raise NotImplementedError
+
+    def buffer(self, key):
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = self.new_buffer()
+            task = ensure_future(self.flush_later(key))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return buffer
+
+    async def flush_later(self, key):
+        await sleep(self.window)
+        await self.flush(key)
+
+    async def flush(self, key):
+        """Отправляет буфер ключа, не дожидаясь окна."""
+        buffer = self.buffers.pop(key, None)
+        if buffer is not None:
+            await self.send(key, buffer)
+
+
+async def group_messages(channel_layer, group, channel, joined=None):
+    """
+    Сообщения группы group, приходящие на канал channel. Членство продлевается
+    раз в GROUP_REFRESH секунд, а не на каждое сообщение; joined (Event)
+    выставляется, когда канал впервые добавлен в группу.
+    """
+    refresh_at = 0
+    while True:
+        if monotonic() >= refresh_at:
+            await channel_layer.group_add(group, channel)
+            refresh_at = monotonic() + GROUP_REFRESH
+            if joined is not None:
+                joined.set()
+        try:
+            message = await wait_for(channel_layer.receive(channel), refresh_at - monotonic())
+        except TimeoutError:
+            continue
+        yield message
@@ -0,0 +1,69 @@
+from timeit import Timer
+
+from django.core.management.base import BaseCommand
+
+from game.codecs import get_codecs
+
+
+def sample_messages(players):
+    """
+    Сообщения протокола бота в форме из game/serializers.py для комнаты
+    из players игроков.
+    """
+    ids = [100000000 + i for i in range(players)]
+    return {
+        'register_players': {
+            'type': 'register_players',
+            'players': [{'telegram_id': tid, 'username': f'Игрок {tid}'} for tid in ids],
+        },
+        'send_player_answer': {
+            'type': 'send_player_answer', 'telegram_id': ids[0], 'answer': 'Смешной ответ на фразу', 'round': 1,
+        },
+        'send_player_answers': {
+            'type': 'send_player_answers',
+            'answers': [{'telegram_id': tid, 'answer': 'Смешной ответ на фразу', 'round': i // 2 + 1}
+                        for i, tid in enumerate(ids)],
+        },
+        'send_player_votes': {
+            'type': 'send_player_votes',
+            'votes': [{'voter_id': tid, 'candidate_id': ids[0]} for tid in ids[2:]],
+        },
+        'receive_players_prompts': {
+            'type': 'receive_players_prompts',
+            'players': [{'telegram_id': tid, 'prompt': f'Фраза номер {i // 2 + 1}', 'round': i // 2 + 1}
+                        for i, tid in enumerate(ids)],
+        },
+        'receive_player_answers': {
+            'type': 'receive_player_answers',
+            'round': 1,
+            'prompt': 'Фраза номер 1',
+            'answer0': {'telegram_id': ids[0], 'answer': 'Смешной ответ на фразу'},
+            'answer1': {'telegram_id': ids[1], 'answer': 'Ещё более смешной ответ'},
+        },
+        'batch_status': {
+            'type': 'send_player_votes',
+            'status': 'ok',
+            'results': [{'voter_id': tid, 'status': 'ok'} for tid in ids[2:]],
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает размер и скорость кодеков веб-сокетов на сообщениях протокола'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=200, help='Число игроков в пакетных сообщениях')
+        parser.add_argument('--number', type=int, default=1000, help='Число повторов на замер')
+
+    def handle(self, *args, **options):
+        codecs = get_codecs()
+        number = options['number']
+
+        self.stdout.write(f'{"message":<26}{"codec":<10}{"bytes":>9}{"encode, µs":>13}{"decode, µs":>13}')
+        for name, message in sample_messages(options['players']).items():
+            for codec in codecs.values():
+                encoded = codec.encode(message)
+                size = len(encoded.encode() if isinstance(encoded, str) else encoded)
+                encode = min(Timer(lambda: codec.encode(message)).repeat(3, number)) / number * 1e6
+                decode = min(Timer(lambda: codec.decode(encoded)).repeat(3, number)) / number * 1e6
+                self.stdout.write(f'{name:<26}{codec.name:<10}{size:>9}{encode:>13.2f}{decode:>13.2f}')
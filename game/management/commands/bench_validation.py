@@ -0,0 +1,36 @@
+from timeit import Timer
+
+from django.core.management.base import BaseCommand
+
+from game.management.commands.bench_codecs import sample_messages
+from game.validation import MESSAGE_SERIALIZERS, get_validator
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скомпилированную проверку сообщений бота с сериализаторами DRF'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=200, help='Число игроков в пакетных сообщениях')
+        parser.add_argument('--number', type=int, default=1000, help='Число повторов на замер')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        messages = sample_messages(options['players'])
+        messages['register_player'] = {'type': 'register_player', 'telegram_id': 100000000, 'username': 'Игрок'}
+        messages['send_player_vote'] = {'type': 'send_player_vote', 'voter_id': 100000002, 'candidate_id': 100000000}
+        messages['receive_player_answers'] = {'type': 'receive_player_answers', 'round': 1}
+
+        self.stdout.write(f'{"message":<22}{"compiled, µs":>14}{"DRF, µs":>12}{"speedup":>10}')
+        for type, serializer_class in MESSAGE_SERIALIZERS.items():
+            message = messages[type]
+
+            def compiled():
+                # Как в BotConsumer.receive_json: поиск проверки по типу и сама проверка
+                get_validator(message['type'])(message)
+
+            def drf():
+                serializer_class(data=message).is_valid()
+
+            fast = min(Timer(compiled).repeat(3, number)) / number * 1e6
+            slow = min(Timer(drf).repeat(3, number)) / number * 1e6
+            self.stdout.write(f'{type:<22}{fast:>14.2f}{slow:>12.2f}{slow / fast:>9.1f}x')
@@ -0,0 +1,25 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from game.schema import generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Собирает схему OpenAPI с описанием сокетов в GAME_API_SCHEMA_FILE для /api/schema/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Файл схемы вместо GAME_API_SCHEMA_FILE')
+
+    def handle(self, *args, **options):
+        if not settings.GAME_API_DOCS:
+            raise CommandError('Схему собирают с включённой документацией: запустите без GAME_API_DOCS=0')
+
+        path = options['output'] or settings.GAME_API_SCHEMA_FILE
+        content = generate_schema()
+        # Через временный файл, чтобы работающие воркеры не прочитали схему наполовину
+        with open(f'{path}.tmp', 'wb') as file:
+            file.write(content)
+        os.replace(f'{path}.tmp', path)
+        self.stdout.write(f'Схема записана в {path} ({len(content)} байт)')
@@ -0,0 +1,262 @@
+import asyncio
+import json
+from time import perf_counter
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from channels.routing import get_default_application
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from game.models import GameRoom, Prompt
+
+# Сообщения, которые бот получает по рассылке, а не в ответ на свой запрос
+BOT_PUSH_TYPES = {'receive_players_prompts', 'receive_player_answers'}
+
+IN_MEMORY_SETTINGS = {
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'GAME_STATE': {'BACKEND': 'game.state.LocMemGameState'},
+}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+    }
+
+
+class Bot:
+    """
+    Соединение бота: ответы на запросы и рассылки приходят в один сокет,
+    поэтому читатель раскладывает их по двум очередям.
+    """
+
+    def __init__(self, communicator):
+        self.communicator = communicator
+        self.replies = asyncio.Queue()
+        self.pushes = asyncio.Queue()
+        self.reader = None
+
+    async def start(self):
+        self.reader = asyncio.ensure_future(self.read())
+
+    async def read(self):
+        while True:
+            message = await self.communicator.receive_json_from(timeout=None)
+            if message.get('type') in BOT_PUSH_TYPES:
+                await self.pushes.put(message)
+            else:
+                await self.replies.put(message)
+
+    async def request(self, content, timeout):
+        await self.communicator.send_json_to(content)
+        return await asyncio.wait_for(self.replies.get(), timeout)
+
+    async def push(self, type, timeout):
+        while True:
+            message = await asyncio.wait_for(self.pushes.get(), timeout)
+            if message['type'] == type:
+                return message
+
+    async def stop(self):
+        self.reader.cancel()
+        await self.communicator.disconnect()
+
+
+class LoadTest:
+    def __init__(self, players, displays, batch, timeout, spectators=0):
+        self.players = players
+        self.displays = displays
+        self.spectators = spectators
+        self.batch = batch
+        self.timeout = timeout
+        self.latencies = {}
+        self.transitions = []
+        self.messages = 0
+        self.room = None
+        self.prompts = []
+
+    def record(self, name, started):
+        self.latencies.setdefault(name, []).append(perf_counter() - started)
+        self.messages += 1
+
+    async def request(self, bot, content):
+        started = perf_counter()
+        reply = await bot.request(content, self.timeout)
+        self.record(content['type'], started)
+        return reply
+
+    async def send_all(self, bot, type, batch_type, field, items):
+        """
+        Отправляет элементы по одному или одной пачкой.
+        Возвращает момент отправки последнего запроса — от него считается переход.
+        """
+        if self.batch:
+            started = perf_counter()
+            await self.request(bot, {'type': batch_type, field: items})
+            return started
+        for item in items:
+            started = perf_counter()
+            await self.request(bot, {'type': type, **item})
+        return started
+
+    async def http(self, client, name, url, method='get'):
+        started = perf_counter()
+        response = await getattr(client, method)(url)
+        self.record(f'http:{name}', started)
+        return response
+
+    async def wait_displays(self, displays, predicate):
+        """Ждёт на каждом экране первое подходящее сообщение и возвращает их."""
+        async def wait(display):
+            while True:
+                message = await display.receive_json_from(timeout=self.timeout)
+                if predicate(message):
+                    return message
+
+        return await asyncio.gather(*(wait(display) for display in displays))
+
+    async def run(self):
+        self.room = await GameRoom.objects.acreate(code=f'load-{uuid4().hex[:12]}')
+        if not await Prompt.objects.aexists():
+            self.prompts = [await Prompt.objects.acreate(phrase=f'Нагрузочная фраза {i}') for i in range(10)]
+
+        application = get_default_application()
+        client = AsyncClient()
+        code = self.room.code
+        ids = [1_000_000 + i for i in range(self.players)]
+
+        started = perf_counter()
+        displays = []
+        for _ in range(self.displays):
+            display = WebsocketCommunicator(application, f'/ws/players/{code}/')
+            connect_started = perf_counter()
+            await display.connect()
+            await display.receive_json_from(timeout=self.timeout)
+            self.record('display:connect', connect_started)
+            displays.append(display)
+        # Зрители получают те же сообщения, что экраны, поэтому ждём их вместе
+        for _ in range(self.spectators):
+            spectator = WebsocketCommunicator(application, f'/ws/spectators/{code}/')
+            connect_started = perf_counter()
+            await spectator.connect()
+            await spectator.receive_json_from(timeout=self.timeout)
+            self.record('spectator:connect', connect_started)
+            displays.append(spectator)
+
+        bot = Bot(WebsocketCommunicator(application, f'/ws/bot/{code}/'))
+        await bot.communicator.connect()
+        await bot.communicator.receive_json_from(timeout=self.timeout)
+        await bot.start()
+
+        await self.http(client, 'home', reverse('game:home', kwargs={'room': code}))
+        if self.batch:
+            await self.request(bot, {
+                'type': 'register_players',
+                'players': [{'telegram_id': tid, 'username': f'load{tid}'} for tid in ids],
+            })
+        else:
+            for tid in ids:
+                await self.request(bot, {'type': 'register_player', 'telegram_id': tid, 'username': f'load{tid}'})
+
+        await self.http(client, 'waiting', reverse('game:waiting', kwargs={'room': code}))
+        prompts = await bot.push('receive_players_prompts', self.timeout)
+
+        # Ответы: переход считается от последнего ответа до редиректа на всех экранах
+        answers = [
+            {'telegram_id': entry['telegram_id'], 'answer': f"ответ {entry['telegram_id']}", 'round': entry['round']}
+            for entry in prompts['players']
+        ]
+        transition_started = await self.send_all(bot, 'send_player_answer', 'send_player_answers', 'answers', answers)
+        await self.wait_displays(displays, lambda message: message.get('type') == 'redirect')
+        matchup = await bot.push('receive_player_answers', self.timeout)
+        self.transitions.append({'to': 'voting', 'round': 1, 'ms': (perf_counter() - transition_started) * 1000})
+        await self.http(client, 'vote', reverse('game:vote', kwargs={'room': code}))
+
+        while True:
+            candidates = {matchup['answer0']['telegram_id'], matchup['answer1']['telegram_id']}
+            votes = [
+                {'voter_id': tid, 'candidate_id': sorted(candidates)[i % 2]}
+                for i, tid in enumerate(ids) if tid not in candidates
+            ]
+            transition_started = await self.send_all(bot, 'send_player_vote', 'send_player_votes', 'votes', votes)
+            results = await self.wait_displays(displays, lambda message: 'all_voted' in message)
+            await self.http(client, 'count', reverse('game:count', kwargs={'room': code}))
+            if results[0]['all_voted']:
+                self.transitions.append({'to': 'results', 'round': matchup['round'],
+                                         'ms': (perf_counter() - transition_started) * 1000})
+                break
+            matchup = await bot.push('receive_player_answers', self.timeout)
+            self.transitions.append({'to': 'voting', 'round': matchup['round'],
+                                     'ms': (perf_counter() - transition_started) * 1000})
+
+        await self.http(client, 'win', reverse('game:win', kwargs={'room': code}))
+        elapsed = perf_counter() - started
+
+        await bot.stop()
+        for display in displays:
+            await display.disconnect()
+
+        return {
+            'config': {'players': self.players, 'displays': self.displays, 'spectators': self.spectators,
+                       'batch': self.batch},
+            'elapsed_s': elapsed,
+            'messages': self.messages,
+            'throughput_per_s': self.messages / elapsed,
+            'latency': {name: summarize(values) for name, values in sorted(self.latencies.items())},
+            'transitions': self.transitions,
+        }
+
+    async def cleanup(self):
+        await sync_to_async(self.room.delete)()
+        for prompt in self.prompts:
+            await prompt.adelete()
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет игру с ботом и N игроками и выводит задержки и время переходов в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=50, help='Число игроков')
+        parser.add_argument('--displays', type=int, default=1, help='Число экранов комнаты')
+        parser.add_argument('--spectators', type=int, default=0, help='Число зрителей комнаты')
+        parser.add_argument('--batch', action='store_true', help='Использовать пакетные сообщения бота')
+        parser.add_argument('--timeout', type=float, default=30, help='Таймаут ожидания сообщения, в секундах')
+        parser.add_argument('--in-memory', action='store_true',
+                            help='Канальный слой, кэш и состояние игры в памяти процесса вместо Redis')
+        parser.add_argument('--output', help='Файл для отчёта вместо stdout')
+
+    def handle(self, *args, **options):
+        if options['players'] < 2 or options['displays'] < 1:
+            self.stderr.write('Нужно хотя бы два игрока и один экран')
+            return
+
+        overrides = IN_MEMORY_SETTINGS if options['in_memory'] else {}
+        with override_settings(**overrides):
+            load_test = LoadTest(options['players'], options['displays'], options['batch'], options['timeout'],
+                                 options['spectators'])
+            try:
+                report = asyncio.run(load_test.run())
+            finally:
+                if load_test.room is not None:
+                    asyncio.run(load_test.cleanup())
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,37 @@
+"""
+Стратегии разбиения игроков на пары. Расписание строится один раз при
+раздаче фраз и сохраняется в Matchup, раунд — это номер записи.
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def pairs(players):
+    """
+    Каждый игрок отвечает на одну фразу. При нечётном числе игроков
+    последний пропускает игру и только голосует.
+    """
+    return [(players[i], players[i + 1]) for i in range(0, len(players) - 1, 2)]
+
+
+def round_robin(players):
+    """
+    Игроки стоят по кругу, и каждый отвечает на две фразы: с соседом слева
+    и с соседом справа. Подходит для нечётного числа игроков.
+    """
+    if len(players) < 3:
+        return pairs(players)
+    return [(players[i], players[(i + 1) % len(players)]) for i in range(len(players))]
+
+
+STRATEGIES = {
+    'pairs': pairs,
+    'round_robin': round_robin,
+}
+
+
+def get_strategy(name=None):
+    name = name or settings.GAME_PAIRING_STRATEGY
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    return import_string(name)
@@ -0,0 +1,234 @@
+"""
+Метрики процесса в текстовом формате Prometheus.
+
+Включаются настройкой GAME_METRICS. Без неё записи ничего не делают,
+middleware не подключается, а /metrics отвечает 404. Значения хранятся
+в памяти процесса: при нескольких воркерах Prometheus опрашивает каждый.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from channels.layers import ChannelLayerManager, channel_layers
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+enabled = False
+
+# Обработчик, которому засчитываются запросы к БД: тип сообщения бота или имя view
+current_handler = ContextVar('current_handler', default=None)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self._lock = Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.type}'
+        for key, value in sorted(self.values.items()):
+            yield f'{self.name}{format_labels(self.labels, key)} {value}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, value=1, **labels):
+        if not enabled:
+            return
+        key = self.key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        if not enabled:
+            return
+        key = self.key(labels)
+        with self._lock:
+            counts, total, count = self.values.get(key, ((0,) * len(self.buckets), 0, 0))
+            counts = tuple(bucket + (value <= bound) for bucket, bound in zip(counts, self.buckets))
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.type}'
+        names = self.labels + ('le',)
+        for key, (counts, total, count) in sorted(self.values.items()):
+            for bound, bucket in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{format_labels(names, key + (bound,))} {bucket}'
+            yield f'{self.name}_bucket{format_labels(names, key + ("+Inf",))} {count}'
+            yield f'{self.name}_sum{format_labels(self.labels, key)} {total}'
+            yield f'{self.name}_count{format_labels(self.labels, key)} {count}'
+
+
+REGISTRY = []
+
+bot_message_seconds = Histogram('game_bot_message_seconds', 'Время обработки сообщения бота', ('type',))
+http_request_seconds = Histogram('game_http_request_seconds', 'Время обработки HTTP-запроса', ('view',))
+group_sends_total = Counter('game_group_sends_total', 'Рассылки в группы channel layer', ('type',))
+websockets = Gauge('game_websockets', 'Открытые веб-сокеты', ('consumer',))
+db_queries_total = Counter('game_db_queries_total', 'Запросы к БД', ('handler',))
+db_query_seconds_total = Counter('game_db_query_seconds_total', 'Время запросов к БД', ('handler',))
+websocket_pings_total = Counter('game_websocket_pings_total', 'Отправленные проверки живости', ('consumer',))
+websocket_reaped_total = Counter('game_websocket_reaped_total', 'Веб-сокеты, закрытые по простою', ('consumer',))
+websocket_dropped_total = Counter(
+    'game_websocket_dropped_total', 'Сообщения, выброшенные из переполненной очереди отправки', ('consumer',))
+websocket_overflow_closes_total = Counter(
+    'game_websocket_overflow_closes_total', 'Веб-сокеты, закрытые из-за переполненной очереди отправки', ('consumer',))
+spectator_feeds = Gauge('game_spectator_feeds', 'Подписки воркера на группы экранов для зрителей')
+spectator_frames_total = Counter('game_spectator_frames_total', 'Кадры, разосланные зрителям')
+audience_votes_total = Counter('game_audience_votes_total', 'Голоса зрителей, записанные в хранилище', ('status',))
+audience_flushes_total = Counter('game_audience_flushes_total', 'Записи накопленных голосов зрителей')
+
+
+def render():
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+@contextmanager
+def track(handler, histogram=None, **labels):
+    """
+    Засчитывает запросы к БД внутри блока обработчику handler
+    и, если задана гистограмма, записывает в неё длительность блока.
+    """
+    if not enabled:
+        yield
+        return
+    token = current_handler.set(handler)
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        current_handler.reset(token)
+        if histogram is not None:
+            histogram.observe(perf_counter() - started, **labels)
+
+
+def record_query(execute, sql, params, many, context):
+    handler = current_handler.get()
+    if handler is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        db_queries_total.inc(handler=handler)
+        db_query_seconds_total.inc(perf_counter() - started, handler=handler)
+
+
+def install_query_wrapper(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_layer(layer):
+    group_send = layer.group_send
+
+    async def counted_group_send(group, message):
+        group_sends_total.inc(type=message.get('type', ''))
+        await group_send(group, message)
+
+    layer.group_send = counted_group_send
+    return layer
+
+
+def install():
+    """
+    Включает сбор метрик: обёртку запросов к БД на каждом соединении
+    и подсчёт group_send на каждом создаваемом channel layer.
+    """
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    connection_created.connect(install_query_wrapper)
+
+    make_backend = ChannelLayerManager._make_backend
+
+    def _make_backend(self, name, config):
+        return instrument_layer(make_backend(self, name, config))
+
+    ChannelLayerManager._make_backend = _make_backend
+    channel_layers.backends = {}
+
+
+class MetricsMiddleware:
+    """
+    Время обработки и запросы к БД по имени view.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not settings.GAME_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = current_handler.set(None)
+        started = perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self.observe(request, started, token)
+
+    async def __acall__(self, request):
+        token = current_handler.set(None)
+        started = perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.observe(request, started, token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_handler.set(request.resolver_match.view_name or view_func.__name__)
+
+    def observe(self, request, started, token):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            http_request_seconds.observe(perf_counter() - started, view=match.view_name or match.func.__name__)
+        current_handler.reset(token)
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.9 on 2025-05-24 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameRoom',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=32, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Game Room',
+                'verbose_name_plural': 'Game Rooms',
+                'db_table': 'game_rooms',
+            },
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='room',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='players', to='game.gameroom'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.9 on 2025-05-24 10:12
+
+from django.db import migrations
+
+DEFAULT_ROOM = 'main'
+
+
+def assign_default_room(apps, schema_editor):
+    GameRoom = apps.get_model('game', 'GameRoom')
+    Player = apps.get_model('game', 'Player')
+    if Player.objects.filter(room__isnull=True).exists():
+        room, _ = GameRoom.objects.get_or_create(code=DEFAULT_ROOM)
+        Player.objects.filter(room__isnull=True).update(room=room)
+
+
+# Отдельно от смены схемы: на PostgreSQL ALTER TABLE в одной транзакции
+# с обновлением строк падает на отложенных проверках внешнего ключа
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_game_rooms'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_default_room, migrations.RunPython.noop),
+    ]
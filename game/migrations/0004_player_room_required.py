@@ -0,0 +1,28 @@
+# Generated by Django 5.1.9 on 2025-05-24 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_assign_default_room'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='players', to='game.gameroom'),
+        ),
+        migrations.AlterField(
+            model_name='player',
+            name='telegram_id',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='player',
+            constraint=models.UniqueConstraint(fields=('room', 'telegram_id'), name='unique_player_in_room'),
+        ),
+    ]
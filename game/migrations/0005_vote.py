@@ -0,0 +1,34 @@
+# Generated by Django 5.1.9 on 2025-05-25 09:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_player_room_required'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='player',
+            name='is_voted',
+        ),
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes_received', to='game.player')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='game.gameroom')),
+                ('voter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes_cast', to='game.player')),
+            ],
+            options={
+                'db_table': 'votes',
+                'indexes': [models.Index(fields=['room', 'round'], name='votes_room_id_4718ad_idx')],
+                'constraints': [models.UniqueConstraint(fields=('voter', 'round'), name='unique_vote_per_round')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.9 on 2025-05-25 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_vote'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='player',
+            name='answer',
+        ),
+        migrations.RemoveField(
+            model_name='player',
+            name='prompt',
+        ),
+        migrations.CreateModel(
+            name='Matchup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round', models.PositiveIntegerField()),
+                ('answer_a', models.TextField(blank=True, null=True)),
+                ('answer_b', models.TextField(blank=True, null=True)),
+                ('player_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='game.player')),
+                ('player_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='game.player')),
+                ('prompt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.prompt')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matchups', to='game.gameroom')),
+            ],
+            options={
+                'db_table': 'matchups',
+                'ordering': ['round'],
+                'constraints': [models.UniqueConstraint(fields=('room', 'round'), name='unique_matchup_round')],
+            },
+        ),
+    ]
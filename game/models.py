@@ -21,14 +21,88 @@ class BackupAnswer(models.Model):
         db_table = 'backup_answers'
 
 
+class GamePhase(models.TextChoices):
+    LOBBY = 'lobby', 'Лобби'
+    ANSWERING = 'answering', 'Ответы'
+    VOTING = 'voting', 'Голосование'
+    RESULTS = 'results', 'Итоги'
+
+
+class GameRoom(models.Model):
+    code = models.SlugField(max_length=32, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.code
+
+    @property
+    def players_group(self):
+        return f'players_{self.code}'
+
+    @property
+    def bot_group(self):
+        return f'bot_{self.code}'
+
+    def cache_key(self, name):
+        return f'room:{self.code}:{name}'
+
+    class Meta:
+        verbose_name_plural = 'Game Rooms'
+        verbose_name = 'Game Room'
+        db_table = 'game_rooms'
+
+
 class Player(models.Model):
-    telegram_id = models.BigIntegerField(unique=True)
+    room = models.ForeignKey(GameRoom, on_delete=models.CASCADE, related_name='players')
+    telegram_id = models.BigIntegerField()
     username = models.CharField(max_length=50)
     joined_at = models.DateTimeField(auto_now_add=True)
-    prompt = models.ForeignKey(Prompt, on_delete=models.CASCADE, null=True)
-    answer = models.TextField(null=True, blank=True)
     vote_count = models.IntegerField(null=True, blank=True)
-    is_voted = models.BooleanField(default=False)
 
     def __str__(self):
         return self.username
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'telegram_id'], name='unique_player_in_room'),
+        ]
+
+
+class Matchup(models.Model):
+    room = models.ForeignKey(GameRoom, on_delete=models.CASCADE, related_name='matchups')
+    round = models.PositiveIntegerField()
+    prompt = models.ForeignKey(Prompt, on_delete=models.CASCADE)
+    player_a = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    player_b = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    answer_a = models.TextField(null=True, blank=True)
+    answer_b = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.round}: {self.player_a} vs {self.player_b}'
+
+    class Meta:
+        db_table = 'matchups'
+        ordering = ['round']
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'round'], name='unique_matchup_round'),
+        ]
+
+
+class Vote(models.Model):
+    room = models.ForeignKey(GameRoom, on_delete=models.CASCADE, related_name='votes')
+    round = models.PositiveIntegerField()
+    voter = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='votes_cast')
+    candidate = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='votes_received')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.voter} -> {self.candidate} ({self.round})'
+
+    class Meta:
+        db_table = 'votes'
+        constraints = [
+            models.UniqueConstraint(fields=['voter', 'round'], name='unique_vote_per_round'),
+        ]
+        indexes = [
+            models.Index(fields=['room', 'round']),
+        ]
@@ -0,0 +1,91 @@
+"""
+Ожидание событий комнаты без опроса БД.
+
+Производитель вызывает notify(): значение события запоминается в кэше
+(на случай, если ожидающий придёт позже) и рассылается через channel layer.
+Каждый процесс держит один канал-подписчик и будит свои ожидающие запросы.
+"""
+from asyncio import Lock, TimeoutError, ensure_future, get_running_loop, wait_for
+
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+
+from game.loops import PerLoop
+
+EVENT_TIMEOUT = 5 * 60
+
+PROMPTS_ASSIGNED = 'prompts'
+ROUND_STARTED = 'round'
+
+
+def event_group(room, name):
+    return f'hub.{name}.{room.code}'
+
+
+def event_cache_key(room, name):
+    return room.cache_key(f'event:{name}')
+
+
+class NotificationHub:
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.channel_name = None
+        self.listener = None
+        self.waiters = {}
+        self._start_lock = Lock()
+
+    async def start(self):
+        async with self._start_lock:
+            if self.listener is None:
+                self.channel_name = await self.channel_layer.new_channel()
+                self.listener = ensure_future(self.listen())
+
+    async def listen(self):
+        while True:
+            message = await self.channel_layer.receive(self.channel_name)
+            for future in self.waiters.get(message['group'], ()):
+                if not future.done():
+                    future.set_result(message['payload'])
+
+    async def wait(self, room, name, timeout):
+        """
+        Возвращает значение события или None, если оно не наступило за timeout секунд.
+        """
+        latch = event_cache_key(room, name)
+        payload = await cache.aget(latch)
+        if payload is not None:
+            return payload
+
+        await self.start()
+        group = event_group(room, name)
+        future = get_running_loop().create_future()
+        waiters = self.waiters.setdefault(group, set())
+        waiters.add(future)
+        try:
+            if len(waiters) == 1:
+                await self.channel_layer.group_add(group, self.channel_name)
+            # Событие могло произойти, пока мы подписывались
+            payload = await cache.aget(latch)
+            if payload is not None:
+                return payload
+            return await wait_for(future, timeout)
+        except TimeoutError:
+            return None
+        finally:
+            waiters.discard(future)
+            if not waiters and self.waiters.get(group) is waiters:
+                del self.waiters[group]
+                await self.channel_layer.group_discard(group, self.channel_name)
+
+
+_hubs = PerLoop(lambda: NotificationHub(get_channel_layer()))
+
+
+def get_hub():
+    return _hubs.get()
+
+
+async def notify(room, name, payload=True):
+    group = event_group(room, name)
+    await cache.aset(event_cache_key(room, name), payload, EVENT_TIMEOUT)
+    await get_channel_layer().group_send(group, {'type': 'hub.notify', 'group': group, 'payload': payload})
@@ -0,0 +1,106 @@
+"""
+Фазы игры: LOBBY → ANSWERING → VOTING (по раунду на пару) → RESULTS → LOBBY.
+
+Фаза хранится в общем хранилище состояния с номером версии, поэтому все
+воркеры видят один и тот же переход, а выполнить его может только один.
+"""
+from collections import namedtuple
+from time import monotonic, time
+
+from django.conf import settings
+
+from game.models import GamePhase
+from game.state import get_game_state
+
+PHASE_CACHE_TIMEOUT = 1
+
+TRANSITIONS = {
+    GamePhase.LOBBY: {GamePhase.ANSWERING},
+    GamePhase.ANSWERING: {GamePhase.VOTING},
+    GamePhase.VOTING: {GamePhase.VOTING, GamePhase.RESULTS},
+    GamePhase.RESULTS: {GamePhase.LOBBY},
+}
+
+PhaseState = namedtuple('PhaseState', ('phase', 'round', 'version'))
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+# Короткий кэш в памяти процесса для частых чтений из консьюмеров и страниц
+_cache = {}
+
+
+async def get_phase(room, fresh=False):
+    """
+    Возвращает PhaseState комнаты. Значение может отставать на PHASE_CACHE_TIMEOUT
+    секунд; fresh=True читает его из хранилища.
+    """
+    cached = _cache.get(room.code)
+    if not fresh and cached and cached[0] > monotonic():
+        return cached[1]
+    state = PhaseState(*await get_game_state().get_phase(room.code))
+    _cache[room.code] = (monotonic() + PHASE_CACHE_TIMEOUT, state)
+    return state
+
+
+async def advance(room, current, phase, round=0):
+    """
+    Переводит комнату из состояния current в phase.
+    Возвращает новое состояние или None, если другой воркер успел раньше.
+    """
+    if phase not in TRANSITIONS[current.phase]:
+        raise InvalidTransition(f'{current.phase} → {phase}')
+    version = await get_game_state().compare_and_set_phase(room.code, current.version, phase, round)
+    if version is None:
+        _cache.pop(room.code, None)
+        return None
+    state = PhaseState(phase, round, version)
+    _cache[room.code] = (monotonic() + PHASE_CACHE_TIMEOUT, state)
+    await schedule_deadline(room, current, state)
+    return state
+
+
+async def schedule_deadline(room, previous, current):
+    """
+    Снимает срок прошлой фазы и назначает срок новой по GAME_PHASE_DEADLINES.
+    Просроченные фазы завершает game.scheduler.
+    """
+    state = get_game_state()
+    await state.remove_deadline(room.code, previous.version)
+    timeout = settings.GAME_PHASE_DEADLINES.get(current.phase)
+    if timeout:
+        await state.set_deadline(room.code, current.version, time() + timeout)
+
+
+async def reset_phase(room):
+    """Возвращает комнату в лобби из любой фазы."""
+    while True:
+        current = await get_phase(room, fresh=True)
+        if current.phase == GamePhase.LOBBY and current.round == 0:
+            return current
+        version = await get_game_state().compare_and_set_phase(room.code, current.version, GamePhase.LOBBY, 0)
+        if version is not None:
+            state = PhaseState(GamePhase.LOBBY, 0, version)
+            _cache[room.code] = (monotonic() + PHASE_CACHE_TIMEOUT, state)
+            await schedule_deadline(room, current, state)
+            return state
+
+
+async def start_voting(room):
+    """Все ответы получены: открывает голосование за первую пару."""
+    current = await get_phase(room, fresh=True)
+    if current.phase != GamePhase.ANSWERING:
+        return None
+    return await advance(room, current, GamePhase.VOTING, 1)
+
+
+async def finish_round(room, prompt_index, all_voted):
+    """Закрывает раунд prompt_index: следующий раунд или итоги."""
+    current = await get_phase(room, fresh=True)
+    if current.phase != GamePhase.VOTING or current.round != prompt_index:
+        return None
+    if all_voted:
+        return await advance(room, current, GamePhase.RESULTS)
+    return await advance(room, current, GamePhase.VOTING, prompt_index + 1)
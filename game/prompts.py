@@ -0,0 +1,45 @@
+"""
+Раздача фраз без повторов.
+
+У каждой комнаты в кэше лежит перемешанная колода id фраз. Игра снимает
+фразы с верха колоды, поэтому выборка стоит O(k), а фраза повторится,
+только когда колода кончится и будет перемешана заново. Полный список id
+читается раз в колоду, а не сортировкой всей таблицы на каждую игру.
+"""
+import random
+
+from django.core.cache import cache
+
+from game.models import Prompt
+
+DECK_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def shuffled_deck(exclude=()):
+    ids = [prompt_id for prompt_id in Prompt.objects.values_list('id', flat=True) if prompt_id not in exclude]
+    random.shuffle(ids)
+    return ids
+
+
+def draw_prompts(room, count):
+    """
+    Снимает с колоды комнаты до count разных фраз. Если колоды не хватает,
+    остаток дополняется из новой, в которой нет уже снятых фраз.
+    Вызывать только из воркера, захватившего раздачу (см. game.phase).
+    """
+    key = room.cache_key('prompt_deck')
+    deck = cache.get(key) or []
+    drawn, deck = deck[:count], deck[count:]
+    if len(drawn) < count:
+        fresh = shuffled_deck(exclude=set(drawn))
+        missing = count - len(drawn)
+        drawn, deck = drawn + fresh[:missing], fresh[missing:]
+
+    prompts = Prompt.objects.in_bulk(drawn)
+    if len(prompts) < len(drawn):
+        # Часть фраз удалили: собираем колоду заново из оставшихся
+        cache.delete(key)
+        return draw_prompts(room, count)
+
+    cache.set(key, deck, DECK_TIMEOUT)
+    return [prompts[prompt_id] for prompt_id in drawn]
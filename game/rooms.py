@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.utils import timezone
+
+from game.models import GameRoom, Player
+
+ROOM_CACHE_KEYS = ('event:prompts', 'event:round')
+
+
+def get_room(code=None):
+    """
+    Возвращает комнату по коду или бросает GameRoom.DoesNotExist.
+    Без кода используется комната по умолчанию — её заводит первое обращение,
+    остальные комнаты создаёт только create_room.
+    """
+    code = code or settings.GAME_DEFAULT_ROOM
+    if code == settings.GAME_DEFAULT_ROOM:
+        return create_room(code)[0]
+    return GameRoom.objects.get(code=code)
+
+
+def create_room(code):
+    """Создаёт комнату, если её ещё нет. Возвращает (комната, создана ли)."""
+    return GameRoom.objects.get_or_create(code=code)
+
+
+def register_player(room, telegram_id, username):
+    """
+    Регистрирует игрока: нового создаёт, вернувшемуся обновляет имя и время входа.
+    """
+    player, created = Player.objects.get_or_create(
+        room=room,
+        telegram_id=telegram_id,
+        defaults={'username': username, 'vote_count': None},
+    )
+    if not created:
+        player.username = username
+        player.joined_at = timezone.now()
+        player.save(update_fields=['username', 'joined_at'])
+    return player
+
+
+def register_players(room, players):
+    """
+    Регистрирует пачку игроков {telegram_id: username}: новых создаёт одной
+    вставкой, вернувшимся обновляет имя и время входа.
+    """
+    now = timezone.now()
+    existing = {player.telegram_id: player for player in Player.objects.filter(room=room, telegram_id__in=players)}
+    for telegram_id, player in existing.items():
+        player.username = players[telegram_id]
+        player.joined_at = now
+    Player.objects.bulk_update(existing.values(), ['username', 'joined_at'])
+    Player.objects.bulk_create(
+        [
+            Player(room=room, telegram_id=telegram_id, username=username, vote_count=None)
+            for telegram_id, username in players.items()
+            if telegram_id not in existing
+        ],
+        ignore_conflicts=True,
+    )
+    return list(Player.objects.filter(room=room, telegram_id__in=players).order_by('joined_at'))
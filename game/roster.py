@@ -0,0 +1,53 @@
+"""
+Версионированный состав комнаты.
+
+Каждое подключение игроков увеличивает версию состава и попадает в журнал
+хранилища состояния. Экран, знающий свою версию, получает только изменения
+после неё, а полный снимок собирается один раз на версию и лежит в кэше
+уже закодированным.
+"""
+from collections import namedtuple
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+
+from game.codecs import get_text_codec
+from game.models import Player
+from game.state import get_game_state
+
+SNAPSHOT_TIMEOUT = 5 * 60
+
+RosterSnapshot = namedtuple('RosterSnapshot', ('version', 'players', 'frame'))
+
+
+def get_snapshot(room):
+    """
+    Возвращает RosterSnapshot: игроков комнаты и готовый кадр 'init' для экранов.
+    """
+    # Версию читаем до запроса к БД: снимок может оказаться новее версии, но не старше
+    version, _ = async_to_sync(get_game_state().get_roster)(room.code)
+    key = room.cache_key(f'roster:{version}')
+    snapshot = cache.get(key)
+    if snapshot is None:
+        players = list(Player.objects.filter(room=room).order_by('joined_at').values('id', 'username'))
+        frame = get_text_codec().encode({'type': 'init', 'version': version, 'players': players})
+        snapshot = RosterSnapshot(version, players, frame)
+        cache.add(key, tuple(snapshot), SNAPSHOT_TIMEOUT)
+    return RosterSnapshot(*snapshot)
+
+
+async def get_changes(room, since):
+    """Возвращает (версия, игроки, подключившиеся после since) или None."""
+    version, players = await get_game_state().get_roster(room.code, since)
+    if players is None:
+        return None
+    return version, players
+
+
+async def record_joins(room, players):
+    """Записывает подключение игроков и возвращает новую версию состава."""
+    return await get_game_state().append_roster(room.code, players)
+
+
+async def reset_roster(room):
+    return await get_game_state().reset_roster(room.code)
@@ -0,0 +1,107 @@
+"""
+Операции на границах раунда: перенос горячего состояния в БД и подведение итогов.
+Фразы пар берутся из каталога (game.catalog), а не JOIN на Prompt.
+"""
+from collections import Counter
+
+from django.db.models import Count
+
+from game.catalog import get_catalog
+from game.models import Player, Vote, Matchup
+
+FLUSH_BATCH_SIZE = 500
+
+
+def get_matchup(room, prompt_index):
+    return (Matchup.objects.select_related('player_a', 'player_b')
+            .filter(room=room, round=prompt_index).first())
+
+
+def get_matchups(room):
+    return list(Matchup.objects.select_related('player_a', 'player_b').filter(room=room))
+
+
+def get_telegram_ids(room):
+    return list(Player.objects.filter(room=room).values_list('telegram_id', flat=True))
+
+
+def get_slots(players, matchups):
+    """
+    Слоты ответов для горячего состояния: {telegram_id: [раунды]}.
+    """
+    slots = {player.telegram_id: [] for player in players}
+    for matchup in matchups:
+        slots[matchup.player_a.telegram_id].append(matchup.round)
+        slots[matchup.player_b.telegram_id].append(matchup.round)
+    return slots
+
+
+def flush_answers(room, answers):
+    """
+    Записывает ответы всех пар комнаты одним bulk_update.
+    """
+    matchups = get_matchups(room)
+    for matchup in matchups:
+        matchup.answer_a = answers.get((matchup.round, matchup.player_a.telegram_id))
+        matchup.answer_b = answers.get((matchup.round, matchup.player_b.telegram_id))
+    Matchup.objects.bulk_update(matchups, ['answer_a', 'answer_b'], batch_size=FLUSH_BATCH_SIZE)
+
+
+def flush_votes(room, prompt_index, ballots):
+    """
+    Записывает бюллетени раунда в журнал Vote одной вставкой и пересчитывает
+    счёт кандидатов раунда одним сгруппированным запросом.
+    Повторный вызов для того же раунда ничего не меняет.
+    Возвращает голоса записанных бюллетеней: {telegram_id кандидата: голоса}.
+    """
+    player_ids = dict(
+        Player.objects.filter(room=room, telegram_id__in={*ballots, *ballots.values()})
+        .values_list('telegram_id', 'id')
+    )
+    ballots = {
+        voter_id: candidate_id for voter_id, candidate_id in ballots.items()
+        if voter_id in player_ids and candidate_id in player_ids
+    }
+    votes = [
+        Vote(room=room, round=prompt_index, voter_id=player_ids[voter_id], candidate_id=player_ids[candidate_id])
+        for voter_id, candidate_id in ballots.items()
+    ]
+    Vote.objects.bulk_create(votes, ignore_conflicts=True, batch_size=FLUSH_BATCH_SIZE)
+
+    totals = (
+        Vote.objects.filter(room=room, candidate__in={vote.candidate_id for vote in votes})
+        .values('candidate').annotate(total=Count('id'))
+    )
+    Player.objects.bulk_update(
+        [Player(id=row['candidate'], vote_count=row['total']) for row in totals],
+        ['vote_count'],
+        batch_size=FLUSH_BATCH_SIZE,
+    )
+    return Counter(ballots.values())
+
+
+def is_last_round(room, prompt_index):
+    return not Matchup.objects.filter(room=room, round__gt=prompt_index).exists()
+
+
+def close_voting_round(room, prompt_index, ballots):
+    """
+    Сохраняет голоса раунда и возвращает итоги для рассылки экранам
+    и голоса кандидатов для таблицы лидеров.
+    """
+    scores = flush_votes(room, prompt_index, ballots)
+    matchup = get_matchup(room, prompt_index)
+
+    return {
+        "prompt": get_catalog([matchup.prompt_id]).phrase(matchup.prompt_id),
+        "player0": {
+            "username": matchup.player_a.username,
+            "answer": matchup.answer_a,
+            "vote_count": matchup.player_a.vote_count or 0,
+        },
+        "player1": {
+            "username": matchup.player_b.username,
+            "answer": matchup.answer_b,
+            "vote_count": matchup.player_b.vote_count or 0,
+        },
+    }, scores
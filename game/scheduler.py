@@ -0,0 +1,78 @@
+"""
+Планировщик сроков фаз.
+
+При переходе в фазу ответов или голосования (game.phase) в хранилище
+состояния записывается её срок. Планировщик — одна задача asyncio на event
+loop воркера — раз в TICK секунд забирает просроченные сроки всех комнат
+и завершает фазу сам: недостающие ответы заменяет запасными из каталога,
+голосование закрывает с теми голосами, что есть. Сроки лежат в общем
+хранилище и переживают перезапуск воркеров. Просроченный срок забирает
+(снимает из хранилища) один воркер, и только он завершает фазу. Каждая
+фаза завершается своей задачей: комната, чей перенос в БД повторяется
+(game.transitions.until_saved), не задерживает сроки остальных.
+"""
+import logging
+from asyncio import ensure_future, sleep
+from time import time
+
+from game.db import aget_room
+from game.loops import PerLoop
+from game.models import GamePhase, GameRoom
+from game.phase import get_phase
+from game.state import get_game_state
+from game.transitions import complete_answers, complete_round
+
+logger = logging.getLogger(__name__)
+
+TICK = 1
+
+_schedulers = PerLoop(lambda: ensure_future(run()))
+_expiring = set()
+
+
+def ensure_scheduler():
+    _schedulers.get()
+
+
+async def run():
+    while True:
+        await sleep(TICK)
+        try:
+            due = await get_game_state().get_due_deadlines(time())
+        except Exception:
+            logger.exception('Не удалось прочитать сроки фаз')
+            continue
+        for room_code, version in due:
+            task = ensure_future(expire_logged(room_code, version))
+            _expiring.add(task)
+            task.add_done_callback(_expiring.discard)
+
+
+async def expire_logged(room_code, version):
+    try:
+        await expire(room_code, version)
+    except Exception:
+        logger.exception('Не удалось завершить фазу комнаты %s', room_code)
+
+
+async def expire(room_code, version):
+    state = get_game_state()
+    # Срок забирает один воркер: у остальных снять его уже не выйдет
+    if not await state.remove_deadline(room_code, version):
+        return
+    try:
+        room = await aget_room(room_code)
+        current = await get_phase(room, fresh=True)
+        # Срок относится к версии фазы: если фаза уже сменилась, он просто снимается
+        if current.version == version:
+            if current.phase == GamePhase.ANSWERING:
+                await complete_answers(room, fill_missing=True)
+            elif current.phase == GamePhase.VOTING:
+                await complete_round(room, current.round)
+    except GameRoom.DoesNotExist:
+        # Комнату удалили вместе с её фазой, завершать нечего
+        return
+    except Exception:
+        # Срок возвращается, чтобы фазу завершил следующий тик
+        await state.set_deadline(room_code, version, time() + TICK)
+        raise
@@ -0,0 +1,54 @@
+"""
+Схема API.
+
+Схему OpenAPI вместе с описанием сокетов бота собирает при сборке команда
+buildschema, а /api/schema/ отдаёт готовый файл с ETag. Генератор
+и декораторы схемы из drf_spectacular нужны, только если включена
+настройка GAME_API_DOCS; без неё декораторы ничего не делают.
+"""
+import os
+from collections import namedtuple
+from hashlib import sha256
+
+from django.conf import settings
+
+if settings.GAME_API_DOCS:
+    from drf_spectacular_websocket.decorators import extend_ws_schema
+else:
+    def extend_ws_schema(type='send', **kwargs):
+        def decorator(func):
+            return func
+
+        return decorator
+
+Schema = namedtuple('Schema', ('content', 'etag'))
+
+_schema = None
+
+
+def generate_schema():
+    """Собирает схему генератором из SPECTACULAR_SETTINGS и возвращает её в JSON."""
+    from drf_spectacular.renderers import OpenApiJsonRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return OpenApiJsonRenderer().render(schema, renderer_context={})
+
+
+def load_schema():
+    """
+    Возвращает Schema из GAME_API_SCHEMA_FILE или None, если файла нет.
+    Файл перечитывается, только когда меняется время его изменения.
+    """
+    global _schema
+    path = settings.GAME_API_SCHEMA_FILE
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _schema is None or _schema[0] != (path, modified):
+        with open(path, 'rb') as file:
+            content = file.read()
+        _schema = ((path, modified), Schema(content, f'"{sha256(content).hexdigest()[:32]}"'))
+    return _schema[1]
@@ -11,6 +11,7 @@ class SendPlayerAnswerInputSerializer(serializers.Serializer):
     type = serializers.CharField(default='send_player_answer', allow_blank=False)
     telegram_id = serializers.IntegerField(required=True)
     answer = serializers.CharField(required=True, allow_blank=False)
+    round = serializers.IntegerField(required=False, allow_null=True)
 
 
 class SendPlayerVoteInputSerializer(serializers.Serializer):
@@ -19,6 +20,42 @@ class SendPlayerVoteInputSerializer(serializers.Serializer):
     candidate_id = serializers.IntegerField(required=True)
 
 
+class PlayerRegistrationSerializer(serializers.Serializer):
+    telegram_id = serializers.IntegerField(required=True)
+    username = serializers.CharField(required=False, allow_blank=True)
+
+
+class RegisterPlayersInputSerializer(serializers.Serializer):
+    type = serializers.CharField(default='register_players', allow_blank=False)
+    players = PlayerRegistrationSerializer(many=True)
+
+
+class PlayerAnswerItemSerializer(serializers.Serializer):
+    telegram_id = serializers.IntegerField(required=True)
+    answer = serializers.CharField(required=True, allow_blank=False)
+    round = serializers.IntegerField(required=False, allow_null=True)
+
+
+class SendPlayerAnswersInputSerializer(serializers.Serializer):
+    type = serializers.CharField(default='send_player_answers', allow_blank=False)
+    answers = PlayerAnswerItemSerializer(many=True)
+
+
+class PlayerVoteItemSerializer(serializers.Serializer):
+    voter_id = serializers.IntegerField(required=True)
+    candidate_id = serializers.IntegerField(required=True)
+
+
+class SendPlayerVotesInputSerializer(serializers.Serializer):
+    type = serializers.CharField(default='send_player_votes', allow_blank=False)
+    votes = PlayerVoteItemSerializer(many=True)
+
+
+class ReceivePlayerAnswersInputSerializer(serializers.Serializer):
+    type = serializers.CharField(default='receive_player_answers', allow_blank=False)
+    round = serializers.IntegerField(required=False, allow_null=True)
+
+
 class StatusOutputSerializer(serializers.Serializer):
     type = serializers.CharField()
     status = serializers.CharField()
@@ -27,6 +64,7 @@ class StatusOutputSerializer(serializers.Serializer):
 class PlayerSerializer(serializers.Serializer):
     telegram_id = serializers.IntegerField()
     prompt = serializers.CharField()
+    round = serializers.IntegerField()
 
 
 class PlayersPromptsOutputSerializer(serializers.Serializer):
@@ -41,10 +79,44 @@ class AnswerSerializer(serializers.Serializer):
 
 class PlayerAnswersOutputSerializer(serializers.Serializer):
     type = serializers.CharField(default='receive_player_answers', allow_blank=False)
+    round = serializers.IntegerField()
     prompt = serializers.CharField()
     answer0 = AnswerSerializer()
     answer1 = AnswerSerializer()
 
 
+class RoomCreateInputSerializer(serializers.Serializer):
+    code = serializers.SlugField(max_length=32)
+
+
 class PlayerCountSerializer(serializers.Serializer):
     count = serializers.IntegerField()
+
+
+class LeaderboardEntrySerializer(serializers.Serializer):
+    telegram_id = serializers.IntegerField()
+    username = serializers.CharField()
+    vote_count = serializers.IntegerField()
+
+
+class RankSerializer(serializers.Serializer):
+    place = serializers.IntegerField()
+    vote_count = serializers.IntegerField()
+
+
+class LeaderboardSerializer(serializers.Serializer):
+    players = LeaderboardEntrySerializer(many=True)
+    rank = RankSerializer(required=False, allow_null=True)
+
+
+class ItemStatusSerializer(serializers.Serializer):
+    telegram_id = serializers.IntegerField(required=False)
+    voter_id = serializers.IntegerField(required=False)
+    status = serializers.CharField()
+    message = serializers.CharField(required=False)
+
+
+class BatchStatusOutputSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    status = serializers.CharField()
+    results = ItemStatusSerializer(many=True)
@@ -0,0 +1,100 @@
+"""
+Зрители комнаты.
+
+Экран PlayerConsumer — отдельный участник группы channel layer, и каждая
+рассылка стоит доставки на каждый сокет. Зрители подписываются не сами:
+воркер держит на комнату один канал в группе экранов, кодирует пришедшее
+событие в кадр один раз и раздаёт его всем своим сокетам этой комнаты.
+Число зрителей упирается в число воркеров, а не в пропускную способность Redis.
+"""
+from asyncio import Event, ensure_future
+
+from channels.layers import get_channel_layer
+from django.urls import reverse
+
+from game import metrics
+from game.codecs import get_text_codec
+from game.loops import PerLoop, group_messages
+
+
+def render_event(room, message):
+    """
+    Сообщение для экранов по событию группы, как его отправляет PlayerConsumer.
+    None — событие экранам не показывается.
+    """
+    type = message.get('type')
+    if type == 'player_joined':
+        return {'type': 'new_player', 'player': message['player']}
+    if type == 'players_joined':
+        return {'type': 'new_players', 'version': message.get('version'), 'players': message['players']}
+    if type == 'all_voted':
+        return message['message']
+    if type == 'leaderboard':
+        return {'type': 'leaderboard', 'players': message['players']}
+    if type == 'all_answers_received':
+        return {'type': 'redirect', 'url': message.get('url') or reverse('game:vote', kwargs={'room': room.code})}
+    return None
+
+
+class RoomFeed:
+    """
+    Подписка воркера на группу экранов одной комнаты.
+    """
+
+    def __init__(self, channel_layer, room):
+        self.channel_layer = channel_layer
+        self.room = room
+        self.sockets = set()
+        self.channel = None
+        self.codec = get_text_codec()
+        self.ready = Event()
+        self.task = ensure_future(self.listen())
+
+    async def listen(self):
+        self.channel = await self.channel_layer.new_channel('spectators.')
+        async for message in group_messages(self.channel_layer, self.room.players_group, self.channel, self.ready):
+            content = render_event(self.room, message)
+            if content is None:
+                continue
+            frame = self.codec.encode(content)
+            metrics.spectator_frames_total.inc(len(self.sockets))
+            for socket in list(self.sockets):
+                await socket.send(text_data=frame)
+
+    async def close(self):
+        self.task.cancel()
+        if self.channel is not None:
+            await self.channel_layer.group_discard(self.room.players_group, self.channel)
+
+
+class SpectatorHub:
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.feeds = {}
+
+    async def subscribe(self, room, socket):
+        """Подключает сокет к рассылке комнаты, когда подписка воркера уже в группе."""
+        feed = self.feeds.get(room.code)
+        if feed is None:
+            feed = self.feeds[room.code] = RoomFeed(self.channel_layer, room)
+            metrics.spectator_feeds.inc()
+        feed.sockets.add(socket)
+        await feed.ready.wait()
+
+    async def unsubscribe(self, room, socket):
+        feed = self.feeds.get(room.code)
+        if feed is None:
+            return
+        feed.sockets.discard(socket)
+        # Последний зритель комнаты на воркере снимает подписку
+        if not feed.sockets:
+            del self.feeds[room.code]
+            metrics.spectator_feeds.dec()
+            await feed.close()
+
+
+_hubs = PerLoop(lambda: SpectatorHub(get_channel_layer()))
+
+
+def get_hub():
+    return _hubs.get()
@@ -0,0 +1,839 @@
+"""
+Горячее состояние игры: ответы, бюллетени и подсчёт голосов текущего раунда.
+
+Во время раунда консьюмеры и API пишут только сюда, а в таблицу Player
+данные переносятся пачкой на границе раунда (см. game.rounds).
+"""
+import heapq
+import json
+from collections import namedtuple
+from functools import cache
+from threading import Lock
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from game.loops import PerLoop
+from game.models import GamePhase
+
+VOTE_CLOSED = -2
+VOTE_UNKNOWN_PLAYER = -1
+VOTE_DUPLICATE = 0
+VOTE_ACCEPTED = 1
+
+ANSWER_CLOSED = -2
+ANSWER_UNKNOWN_PLAYER = -1
+ANSWER_UPDATED = 0
+ANSWER_ACCEPTED = 1
+
+# Сколько последних изменений состава хранится для догоняющих клиентов
+ROSTER_LOG_SIZE = 1000
+
+# Счётчики комнаты: игроки, ответы и слоты, голоса текущего раунда, оставшиеся пары
+Counters = namedtuple('Counters', ('players', 'answered', 'slots', 'voted', 'pairs_remaining'))
+
+# Строка таблицы лидеров
+LeaderboardEntry = namedtuple('LeaderboardEntry', ('telegram_id', 'username', 'vote_count'))
+
+SET_ANSWER_SCRIPT = """
+if redis.call('HGET', KEYS[4], 'phase') ~= ARGV[5] then
+    return {-2, 0, 0}
+end
+local rounds = redis.call('HGET', KEYS[1], ARGV[1])
+if not rounds then
+    return {-1, 0, 0}
+end
+local target = nil
+for round in string.gmatch(rounds, '[^,]+') do
+    if ARGV[4] == '' then
+        if redis.call('HEXISTS', KEYS[2], round .. ':' .. ARGV[1]) == 0 then
+            target = round
+            break
+        end
+    elseif round == ARGV[4] then
+        target = round
+        break
+    end
+end
+if not target then
+    if ARGV[4] ~= '' then
+        return {-1, 0, 0}
+    end
+    target = string.match(rounds, '[^,]+$')
+end
+local added = redis.call('HSET', KEYS[2], target .. ':' .. ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return {added, redis.call('HLEN', KEYS[2]), tonumber(redis.call('GET', KEYS[3]) or '0')}
+"""
+
+RECORD_VOTE_SCRIPT = """
+local phase = redis.call('HMGET', KEYS[2], 'phase', 'round')
+if phase[1] ~= ARGV[5] then
+    return {-2, 0, 0}
+end
+local round = tonumber(phase[2])
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 0 or redis.call('SISMEMBER', KEYS[1], ARGV[2]) == 0 then
+    return {-1, 0, round}
+end
+local ballots = ARGV[4] .. ':ballots:' .. round
+local added = redis.call('HSETNX', ballots, ARGV[1], ARGV[2])
+if added == 1 then
+    redis.call('EXPIRE', ballots, ARGV[3])
+end
+return {added, redis.call('SCARD', KEYS[1]) - redis.call('HLEN', ballots), round}
+"""
+
+COUNTERS_SCRIPT = """
+local phase = redis.call('HMGET', KEYS[5], 'phase', 'round')
+local round = tonumber(phase[2] or '0')
+local rounds = tonumber(redis.call('GET', KEYS[4]) or '0')
+local voted = 0
+local remaining = rounds
+if phase[1] == ARGV[2] then
+    voted = redis.call('HLEN', ARGV[1] .. ':ballots:' .. round)
+    remaining = rounds - round + 1
+elseif phase[1] == ARGV[3] then
+    remaining = 0
+end
+return {
+    redis.call('SCARD', KEYS[1]), redis.call('HLEN', KEYS[2]), tonumber(redis.call('GET', KEYS[3]) or '0'),
+    voted, remaining
+}
+"""
+
+APPEND_ROSTER_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], version, version .. ':' .. ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return version
+"""
+
+AUDIENCE_VOTES_SCRIPT = """
+local phase = redis.call('HMGET', KEYS[3], 'phase', 'round')
+if phase[1] ~= ARGV[2] or phase[2] ~= ARGV[3] then
+    return nil
+end
+local added = {0, 0}
+for i = 4, #ARGV, 2 do
+    if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+        local choice = tonumber(ARGV[i + 1]) + 1
+        added[choice] = added[choice] + 1
+    end
+end
+for choice = 1, 2 do
+    if added[choice] > 0 then
+        redis.call('HINCRBY', KEYS[2], choice - 1, added[choice])
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return added
+"""
+
+SET_PHASE_SCRIPT = """
+local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if version ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'phase', ARGV[2], 'round', ARGV[3], 'version', version + 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return version + 1
+"""
+
+# Первые игроки таблицы и все, кто делит счёт с последним из них: ZREVRANGE
+# упорядочивает равных по убыванию строки telegram_id, порядок задаём сами
+LEADERBOARD_TOP_SCRIPT = """
+local top = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1, 'WITHSCORES')
+if #top == 0 then
+    return {top, {}}
+end
+return {top, redis.call('ZRANGEBYSCORE', KEYS[1], top[#top], top[#top])}
+"""
+
+
+class BaseGameState:
+    """
+    Интерфейс хранилища. Все методы асинхронные, комната задаётся кодом.
+    """
+
+    def __init__(self, timeout=24 * 60 * 60, **kwargs):
+        self.timeout = timeout
+
+    async def add_player(self, room, telegram_id):
+        raise NotImplementedError
+
+    async def add_players(self, room, telegram_ids):
+        for telegram_id in telegram_ids:
+            await self.add_player(room, telegram_id)
+
+    async def assign_slots(self, room, slots):
+        """
+        Заменяет игроков комнаты и их слоты ответов: {telegram_id: [раунды]}.
+        Вызывается при раздаче фраз, заодно сверяя список игроков с БД.
+        """
+        raise NotImplementedError
+
+    async def sync_players(self, room, telegram_ids):
+        """Заменяет список игроков комнаты списком из БД."""
+        raise NotImplementedError
+
+    async def get_counters(self, room):
+        """
+        Возвращает Counters комнаты. Значения поддерживаются при записи,
+        поэтому чтение не зависит от числа игроков.
+        """
+        raise NotImplementedError
+
+    async def set_answer(self, room, telegram_id, answer, prompt_index=None):
+        """
+        Сохраняет ответ в слот раунда prompt_index, а без него — в первый
+        незаполненный слот игрока. Вне фазы ответов ответ не принимается.
+        Возвращает (статус, число ответов, число слотов).
+        """
+        raise NotImplementedError
+
+    async def set_answers(self, room, answers):
+        """
+        Пакетный set_answer для [(telegram_id, ответ, раунд или None)].
+        Возвращает результаты в том же порядке.
+        """
+        return [await self.set_answer(room, *answer) for answer in answers]
+
+    async def get_answers(self, room):
+        """Возвращает {(раунд, telegram_id): ответ}."""
+        raise NotImplementedError
+
+    async def record_vote(self, room, voter_id, candidate_id):
+        """
+        Атомарно записывает бюллетень голосующего в текущем раунде.
+        Вне фазы голосования голос не принимается.
+        Возвращает (статус, число ещё не проголосовавших, раунд).
+        """
+        raise NotImplementedError
+
+    async def record_votes(self, room, votes):
+        """Пакетный record_vote для [(голосующий, кандидат)]."""
+        return [await self.record_vote(room, *vote) for vote in votes]
+
+    async def get_ballots(self, room, prompt_index):
+        """Возвращает бюллетени раунда: {голосующий: кандидат}."""
+        raise NotImplementedError
+
+    async def add_audience_votes(self, room, prompt_index, votes):
+        """
+        Добавляет голоса зрителей {сессия: 0 или 1 — за первого или второго
+        игрока пары}. Каждая сессия голосует в раунде один раз; голоса не
+        принимаются, если раунд prompt_index уже не голосуется.
+        Возвращает число принятых голосов за каждого игрока или None.
+        """
+        raise NotImplementedError
+
+    async def get_audience_votes(self, room, prompt_index):
+        """Возвращает голоса зрителей раунда: (за первого, за второго)."""
+        raise NotImplementedError
+
+    async def get_phase(self, room):
+        """Возвращает (фаза, раунд, версия)."""
+        raise NotImplementedError
+
+    async def compare_and_set_phase(self, room, version, phase, prompt_index):
+        """
+        Меняет фазу, только если её версия всё ещё равна version.
+        Возвращает новую версию или None.
+        """
+        raise NotImplementedError
+
+    async def bump_answers_version(self, room):
+        """Отмечает, что ответы фазы перенесены в БД, увеличивая версию ответов."""
+        raise NotImplementedError
+
+    async def get_answers_version(self, room):
+        raise NotImplementedError
+
+    async def append_roster(self, room, players):
+        """
+        Записывает подключение игроков [{'id', 'username'}] в журнал состава.
+        Возвращает новую версию состава.
+        """
+        raise NotImplementedError
+
+    async def get_roster(self, room, since=None):
+        """
+        Возвращает (версия, изменения после since). Изменения — None, если
+        since не задан или журнал их уже не хранит: клиенту нужен полный снимок.
+        """
+        raise NotImplementedError
+
+    async def reset_roster(self, room):
+        """Очищает журнал состава, увеличивая версию."""
+        raise NotImplementedError
+
+    async def reset_leaderboard(self, room, players):
+        """
+        Заводит таблицу лидеров {telegram_id: имя} с нулевым счётом.
+        Каждое изменение таблицы увеличивает её версию.
+        """
+        raise NotImplementedError
+
+    async def add_scores(self, room, scores):
+        """Прибавляет голоса {telegram_id: голоса} к счёту игроков."""
+        raise NotImplementedError
+
+    async def get_leaderboard_version(self, room):
+        raise NotImplementedError
+
+    async def get_leaderboard(self, room, limit):
+        """
+        Возвращает limit лучших игроков списком LeaderboardEntry.
+        Игроки с равным счётом идут по возрастанию telegram_id.
+        """
+        raise NotImplementedError
+
+    async def get_rank(self, room, telegram_id):
+        """
+        Возвращает (место, счёт) игрока или None. Место — 1 плюс число
+        игроков с большим счётом, так что равные делят место.
+        """
+        raise NotImplementedError
+
+    async def set_deadline(self, room, version, at):
+        """Назначает срок (unix-время) фазе комнаты с версией version."""
+        raise NotImplementedError
+
+    async def remove_deadline(self, room, version):
+        """
+        Снимает срок. Возвращает True, если его снял этот вызов: так из
+        воркеров, заметивших просроченный срок, фазу завершает один.
+        """
+        raise NotImplementedError
+
+    async def get_due_deadlines(self, now):
+        """Возвращает просроченные сроки всех комнат: [(комната, версия фазы)]."""
+        raise NotImplementedError
+
+    async def clear(self, room):
+        """
+        Удаляет состояние комнаты. Версии фазы, ответов, состава и таблицы
+        лидеров остаются, чтобы не откатываться.
+        """
+        raise NotImplementedError
+
+
+def roster_changes(version, since, entries):
+    """
+    Собирает изменения состава из записей журнала [(версия, игроки)],
+    если они непрерывно покрывают версии после since.
+    """
+    if since > version:
+        return None
+    if since < version and (not entries or entries[0][0] != since + 1):
+        return None
+    return [player for _, players in entries for player in players]
+
+
+class RedisGameState(BaseGameState):
+    def __init__(self, location, prefix='game', **kwargs):
+        super().__init__(**kwargs)
+        self.location = location
+        self.prefix = prefix
+        self._clients = PerLoop(self._connect)
+
+    def key(self, room, *parts):
+        return ':'.join((self.prefix, room, *map(str, parts)))
+
+    def _client(self):
+        return self._clients.get()
+
+    def _connect(self):
+        from redis.asyncio import Redis
+
+        client = Redis.from_url(self.location, decode_responses=True)
+        scripts = {
+            'set_answer': client.register_script(SET_ANSWER_SCRIPT),
+            'record_vote': client.register_script(RECORD_VOTE_SCRIPT),
+            'set_phase': client.register_script(SET_PHASE_SCRIPT),
+            'counters': client.register_script(COUNTERS_SCRIPT),
+            'append_roster': client.register_script(APPEND_ROSTER_SCRIPT),
+            'audience_votes': client.register_script(AUDIENCE_VOTES_SCRIPT),
+            'leaderboard_top': client.register_script(LEADERBOARD_TOP_SCRIPT),
+        }
+        return client, scripts
+
+    async def add_player(self, room, telegram_id):
+        client, _ = self._client()
+        key = self.key(room, 'players')
+        async with client.pipeline(transaction=True) as pipe:
+            await pipe.sadd(key, telegram_id).expire(key, self.timeout).execute()
+
+    async def add_players(self, room, telegram_ids):
+        if not telegram_ids:
+            return
+        client, _ = self._client()
+        key = self.key(room, 'players')
+        async with client.pipeline(transaction=True) as pipe:
+            await pipe.sadd(key, *telegram_ids).expire(key, self.timeout).execute()
+
+    async def assign_slots(self, room, slots):
+        client, _ = self._client()
+        players, slots_key, total, answers, rounds_key = (
+            self.key(room, name) for name in ('players', 'slots', 'slots_total', 'answers', 'rounds')
+        )
+        assigned = {telegram_id: ','.join(map(str, rounds)) for telegram_id, rounds in slots.items() if rounds}
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(players, slots_key, total, answers)
+            if slots:
+                pipe.sadd(players, *slots).expire(players, self.timeout)
+            if assigned:
+                pipe.hset(slots_key, mapping=assigned).expire(slots_key, self.timeout)
+            pipe.set(total, sum(map(len, slots.values())), ex=self.timeout)
+            pipe.set(rounds_key, len({r for rounds in slots.values() for r in rounds}), ex=self.timeout)
+            await pipe.execute()
+
+    async def sync_players(self, room, telegram_ids):
+        client, _ = self._client()
+        key = self.key(room, 'players')
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if telegram_ids:
+                pipe.sadd(key, *telegram_ids).expire(key, self.timeout)
+            await pipe.execute()
+
+    async def get_counters(self, room):
+        _, scripts = self._client()
+        counters = await scripts['counters'](
+            keys=[self.key(room, name) for name in ('players', 'answers', 'slots_total', 'rounds', 'phase')],
+            args=[self.key(room), GamePhase.VOTING, GamePhase.RESULTS],
+        )
+        return Counters(*counters)
+
+    def _set_answer_call(self, room, telegram_id, answer, prompt_index=None):
+        return {
+            'keys': [self.key(room, 'slots'), self.key(room, 'answers'), self.key(room, 'slots_total'),
+                     self.key(room, 'phase')],
+            'args': [telegram_id, answer, self.timeout, '' if prompt_index is None else prompt_index,
+                     GamePhase.ANSWERING],
+        }
+
+    async def set_answer(self, room, telegram_id, answer, prompt_index=None):
+        _, scripts = self._client()
+        status, answered, total = await scripts['set_answer'](
+            **self._set_answer_call(room, telegram_id, answer, prompt_index))
+        return status, answered, total
+
+    async def set_answers(self, room, answers):
+        client, scripts = self._client()
+        # Скрипты выполняются по одному, но уходят на сервер одним пакетом
+        async with client.pipeline(transaction=False) as pipe:
+            for answer in answers:
+                await scripts['set_answer'](client=pipe, **self._set_answer_call(room, *answer))
+            return [tuple(result) for result in await pipe.execute()]
+
+    async def get_answers(self, room):
+        client, _ = self._client()
+        answers = await client.hgetall(self.key(room, 'answers'))
+        result = {}
+        for slot, answer in answers.items():
+            prompt_index, telegram_id = slot.split(':')
+            result[int(prompt_index), int(telegram_id)] = answer
+        return result
+
+    def _record_vote_call(self, room, voter_id, candidate_id):
+        return {
+            'keys': [self.key(room, 'players'), self.key(room, 'phase')],
+            'args': [voter_id, candidate_id, self.timeout, self.key(room), GamePhase.VOTING],
+        }
+
+    async def record_vote(self, room, voter_id, candidate_id):
+        _, scripts = self._client()
+        status, remaining, prompt_index = await scripts['record_vote'](
+            **self._record_vote_call(room, voter_id, candidate_id))
+        return status, remaining, prompt_index
+
+    async def record_votes(self, room, votes):
+        client, scripts = self._client()
+        async with client.pipeline(transaction=False) as pipe:
+            for vote in votes:
+                await scripts['record_vote'](client=pipe, **self._record_vote_call(room, *vote))
+            return [tuple(result) for result in await pipe.execute()]
+
+    async def get_ballots(self, room, prompt_index):
+        client, _ = self._client()
+        ballots = await client.hgetall(self.key(room, 'ballots', prompt_index))
+        return {int(voter_id): int(candidate_id) for voter_id, candidate_id in ballots.items()}
+
+    async def add_audience_votes(self, room, prompt_index, votes):
+        _, scripts = self._client()
+        args = [self.timeout, GamePhase.VOTING, prompt_index]
+        for session, choice in votes.items():
+            args += [session, choice]
+        added = await scripts['audience_votes'](
+            keys=[self.key(room, 'audience_voters', prompt_index), self.key(room, 'audience', prompt_index),
+                  self.key(room, 'phase')],
+            args=args,
+        )
+        return tuple(added) if added else None
+
+    async def get_audience_votes(self, room, prompt_index):
+        client, _ = self._client()
+        votes = await client.hmget(self.key(room, 'audience', prompt_index), ['0', '1'])
+        return tuple(int(count or 0) for count in votes)
+
+    async def get_phase(self, room):
+        client, _ = self._client()
+        phase = await client.hgetall(self.key(room, 'phase'))
+        return phase.get('phase', GamePhase.LOBBY), int(phase.get('round', 0)), int(phase.get('version', 0))
+
+    async def compare_and_set_phase(self, room, version, phase, prompt_index):
+        _, scripts = self._client()
+        new_version = await scripts['set_phase'](
+            keys=[self.key(room, 'phase')],
+            args=[version, phase, prompt_index, self.timeout],
+        )
+        return new_version or None
+
+    async def bump_answers_version(self, room):
+        client, _ = self._client()
+        version = self.key(room, 'answers_version')
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.incr(version).expire(version, self.timeout)
+            await pipe.execute()
+
+    async def get_answers_version(self, room):
+        client, _ = self._client()
+        return int(await client.get(self.key(room, 'answers_version')) or 0)
+
+    async def append_roster(self, room, players):
+        _, scripts = self._client()
+        return await scripts['append_roster'](
+            keys=[self.key(room, 'roster_version'), self.key(room, 'roster_log')],
+            args=[json.dumps(players), ROSTER_LOG_SIZE, self.timeout],
+        )
+
+    async def get_roster(self, room, since=None):
+        client, _ = self._client()
+        log = self.key(room, 'roster_log')
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.get(self.key(room, 'roster_version'))
+            pipe.zrangebyscore(log, f'({since or 0}', '+inf', withscores=True)
+            version, entries = await pipe.execute()
+        version = int(version or 0)
+        if since is None:
+            return version, None
+        entries = [(int(score), json.loads(member.partition(':')[2])) for member, score in entries]
+        return version, roster_changes(version, since, entries)
+
+    async def reset_roster(self, room):
+        client, _ = self._client()
+        version = self.key(room, 'roster_version')
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(self.key(room, 'roster_log'))
+            pipe.incr(version).expire(version, self.timeout)
+            return (await pipe.execute())[1]
+
+    async def reset_leaderboard(self, room, players):
+        client, _ = self._client()
+        board, names = self.key(room, 'leaderboard'), self.key(room, 'leaderboard_names')
+        version = self.key(room, 'leaderboard_version')
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(board, names)
+            if players:
+                pipe.zadd(board, {telegram_id: 0 for telegram_id in players})
+                pipe.hset(names, mapping=players)
+                pipe.expire(board, self.timeout).expire(names, self.timeout)
+            pipe.incr(version).expire(version, self.timeout)
+            await pipe.execute()
+
+    async def add_scores(self, room, scores):
+        if not scores:
+            return
+        client, _ = self._client()
+        board, version = self.key(room, 'leaderboard'), self.key(room, 'leaderboard_version')
+        async with client.pipeline(transaction=True) as pipe:
+            for telegram_id, count in scores.items():
+                pipe.zincrby(board, count, telegram_id)
+            pipe.expire(board, self.timeout)
+            pipe.incr(version).expire(version, self.timeout)
+            await pipe.execute()
+
+    async def get_leaderboard_version(self, room):
+        client, _ = self._client()
+        return int(await client.get(self.key(room, 'leaderboard_version')) or 0)
+
+    async def get_leaderboard(self, room, limit):
+        client, scripts = self._client()
+        top, tied = await scripts['leaderboard_top'](keys=[self.key(room, 'leaderboard')], args=[limit])
+        if not top:
+            return []
+        scores = {int(telegram_id): int(float(score)) for telegram_id, score in zip(top[::2], top[1::2])}
+        scores.update((int(telegram_id), int(float(top[-1]))) for telegram_id in tied)
+        top = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        names = await client.hmget(self.key(room, 'leaderboard_names'), [telegram_id for telegram_id, _ in top])
+        return [
+            LeaderboardEntry(int(telegram_id), username or '', int(score))
+            for (telegram_id, score), username in zip(top, names)
+        ]
+
+    async def get_rank(self, room, telegram_id):
+        client, _ = self._client()
+        board = self.key(room, 'leaderboard')
+        score = await client.zscore(board, telegram_id)
+        if score is None:
+            return None
+        return await client.zcount(board, f'({score}', '+inf') + 1, int(score)
+
+    @property
+    def deadlines_key(self):
+        # Сроки всех комнат в одном сортированном множестве, чтобы их находил любой воркер
+        return f'{self.prefix}:deadlines'
+
+    async def set_deadline(self, room, version, at):
+        client, _ = self._client()
+        await client.zadd(self.deadlines_key, {f'{room}:{version}': at})
+
+    async def remove_deadline(self, room, version):
+        client, _ = self._client()
+        return bool(await client.zrem(self.deadlines_key, f'{room}:{version}'))
+
+    async def get_due_deadlines(self, now):
+        client, _ = self._client()
+        due = await client.zrangebyscore(self.deadlines_key, '-inf', now)
+        return [(room, int(version)) for room, _, version in (member.rpartition(':') for member in due)]
+
+    async def clear(self, room):
+        client, _ = self._client()
+        leaderboard_version = self.key(room, 'leaderboard_version')
+        keep = {self.key(room, 'phase'), self.key(room, 'answers_version'), self.key(room, 'roster_version'),
+                leaderboard_version}
+        keys = [key async for key in client.scan_iter(match=self.key(room, '*')) if key not in keep]
+        async with client.pipeline(transaction=True) as pipe:
+            if keys:
+                pipe.delete(*keys)
+            pipe.incr(leaderboard_version).expire(leaderboard_version, self.timeout)
+            await pipe.execute()
+
+
+class LocMemGameState(BaseGameState):
+    """
+    Хранилище в памяти процесса — для разработки и тестов с одним воркером.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rooms = {}
+        self._deadlines = {}
+        self._lock = Lock()
+
+    def _room(self, room):
+        return self._rooms.setdefault(room, {
+            'players': set(), 'slots': {}, 'answers': {}, 'ballots': {}, 'audience': {},
+            'slots_total': 0, 'rounds': 0, 'phase': (GamePhase.LOBBY, 0, 0), 'answers_version': 0,
+            'roster_version': 0, 'roster_log': [], 'leaderboard': {}, 'leaderboard_names': {},
+            'leaderboard_version': 0,
+        })
+
+    async def add_player(self, room, telegram_id):
+        with self._lock:
+            self._room(room)['players'].add(int(telegram_id))
+
+    async def assign_slots(self, room, slots):
+        with self._lock:
+            state = self._room(room)
+            state['players'] = set(map(int, slots))
+            state['slots'] = {int(telegram_id): list(map(int, rounds)) for telegram_id, rounds in slots.items() if rounds}
+            state['answers'] = {}
+            state['slots_total'] = sum(map(len, state['slots'].values()))
+            state['rounds'] = len({r for rounds in state['slots'].values() for r in rounds})
+
+    async def sync_players(self, room, telegram_ids):
+        with self._lock:
+            self._room(room)['players'] = set(map(int, telegram_ids))
+
+    async def get_counters(self, room):
+        with self._lock:
+            state = self._room(room)
+            phase, prompt_index, _ = state['phase']
+            voted, remaining = 0, state['rounds']
+            if phase == GamePhase.VOTING:
+                voted = len(state['ballots'].get(prompt_index, {}))
+                remaining = state['rounds'] - prompt_index + 1
+            elif phase == GamePhase.RESULTS:
+                remaining = 0
+            return Counters(len(state['players']), len(state['answers']), state['slots_total'], voted, remaining)
+
+    async def set_answer(self, room, telegram_id, answer, prompt_index=None):
+        with self._lock:
+            state = self._room(room)
+            if state['phase'][0] != GamePhase.ANSWERING:
+                return ANSWER_CLOSED, 0, 0
+            rounds = state['slots'].get(int(telegram_id))
+            if not rounds or (prompt_index is not None and int(prompt_index) not in rounds):
+                return ANSWER_UNKNOWN_PLAYER, 0, 0
+            if prompt_index is None:
+                free = [r for r in rounds if (r, int(telegram_id)) not in state['answers']]
+                prompt_index = free[0] if free else rounds[-1]
+            slot = (int(prompt_index), int(telegram_id))
+            status = ANSWER_UPDATED if slot in state['answers'] else ANSWER_ACCEPTED
+            state['answers'][slot] = answer
+            return status, len(state['answers']), state['slots_total']
+
+    async def get_answers(self, room):
+        with self._lock:
+            return dict(self._room(room)['answers'])
+
+    async def record_vote(self, room, voter_id, candidate_id):
+        with self._lock:
+            state = self._room(room)
+            phase, prompt_index, _ = state['phase']
+            if phase != GamePhase.VOTING:
+                return VOTE_CLOSED, 0, 0
+            players = state['players']
+            if int(voter_id) not in players or int(candidate_id) not in players:
+                return VOTE_UNKNOWN_PLAYER, 0, prompt_index
+            ballots = state['ballots'].setdefault(prompt_index, {})
+            status = VOTE_DUPLICATE
+            if int(voter_id) not in ballots:
+                ballots[int(voter_id)] = int(candidate_id)
+                status = VOTE_ACCEPTED
+            return status, len(players) - len(ballots), prompt_index
+
+    async def get_ballots(self, room, prompt_index):
+        with self._lock:
+            return dict(self._room(room)['ballots'].get(prompt_index, {}))
+
+    async def add_audience_votes(self, room, prompt_index, votes):
+        with self._lock:
+            state = self._room(room)
+            phase, current, _ = state['phase']
+            if phase != GamePhase.VOTING or current != int(prompt_index):
+                return None
+            voters, counts = state['audience'].setdefault(current, (set(), [0, 0]))
+            added = [0, 0]
+            for session, choice in votes.items():
+                if session not in voters:
+                    voters.add(session)
+                    added[int(choice)] += 1
+            counts[0] += added[0]
+            counts[1] += added[1]
+            return tuple(added)
+
+    async def get_audience_votes(self, room, prompt_index):
+        with self._lock:
+            _, counts = self._room(room)['audience'].get(int(prompt_index), (None, (0, 0)))
+            return tuple(counts)
+
+    async def get_phase(self, room):
+        with self._lock:
+            return self._room(room)['phase']
+
+    async def compare_and_set_phase(self, room, version, phase, prompt_index):
+        with self._lock:
+            state = self._room(room)
+            if state['phase'][2] != version:
+                return None
+            state['phase'] = (phase, prompt_index, version + 1)
+            return version + 1
+
+    async def bump_answers_version(self, room):
+        with self._lock:
+            self._room(room)['answers_version'] += 1
+
+    async def get_answers_version(self, room):
+        with self._lock:
+            return self._room(room)['answers_version']
+
+    async def append_roster(self, room, players):
+        with self._lock:
+            state = self._room(room)
+            state['roster_version'] += 1
+            state['roster_log'] = state['roster_log'][-ROSTER_LOG_SIZE + 1:] + [(state['roster_version'], players)]
+            return state['roster_version']
+
+    async def get_roster(self, room, since=None):
+        with self._lock:
+            state = self._room(room)
+            version = state['roster_version']
+            if since is None:
+                return version, None
+            entries = [entry for entry in state['roster_log'] if entry[0] > since]
+            return version, roster_changes(version, since, entries)
+
+    async def reset_roster(self, room):
+        with self._lock:
+            state = self._room(room)
+            state['roster_version'] += 1
+            state['roster_log'] = []
+            return state['roster_version']
+
+    async def reset_leaderboard(self, room, players):
+        with self._lock:
+            state = self._room(room)
+            state['leaderboard'] = {int(telegram_id): 0 for telegram_id in players}
+            state['leaderboard_names'] = {int(telegram_id): username for telegram_id, username in players.items()}
+            state['leaderboard_version'] += 1
+
+    async def add_scores(self, room, scores):
+        with self._lock:
+            state = self._room(room)
+            board = state['leaderboard']
+            for telegram_id, count in scores.items():
+                board[int(telegram_id)] = board.get(int(telegram_id), 0) + count
+            state['leaderboard_version'] += 1
+
+    async def get_leaderboard_version(self, room):
+        with self._lock:
+            return self._room(room)['leaderboard_version']
+
+    async def get_leaderboard(self, room, limit):
+        with self._lock:
+            state = self._room(room)
+            top = heapq.nsmallest(limit, state['leaderboard'].items(), key=lambda item: (-item[1], item[0]))
+            return [
+                LeaderboardEntry(telegram_id, state['leaderboard_names'].get(telegram_id, ''), score)
+                for telegram_id, score in top
+            ]
+
+    async def get_rank(self, room, telegram_id):
+        with self._lock:
+            board = self._room(room)['leaderboard']
+            score = board.get(int(telegram_id))
+            if score is None:
+                return None
+            return sum(other > score for other in board.values()) + 1, score
+
+    async def set_deadline(self, room, version, at):
+        with self._lock:
+            self._deadlines[room, version] = at
+
+    async def remove_deadline(self, room, version):
+        with self._lock:
+            return self._deadlines.pop((room, version), None) is not None
+
+    async def get_due_deadlines(self, now):
+        with self._lock:
+            return [key for key, at in self._deadlines.items() if at <= now]
+
+    async def clear(self, room):
+        with self._lock:
+            state = self._room(room)
+            self._rooms.pop(room)
+            self._room(room).update(phase=state['phase'], answers_version=state['answers_version'],
+                                    roster_version=state['roster_version'],
+                                    leaderboard_version=state['leaderboard_version'] + 1)
+
+
+@cache
+def get_game_state():
+    config = dict(settings.GAME_STATE)
+    backend = import_string(config.pop('BACKEND'))
+    options = {key.lower(): value for key, value in config.items()}
+    return backend(**options)
+
+
+@receiver(setting_changed)
+def reset_game_state(setting, **kwargs):
+    if setting == 'GAME_STATE':
+        get_game_state.cache_clear()
@@ -1,3 +1,870 @@
-from django.test import TestCase
+import json
+from asyncio import Queue, gather
+from time import time
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from game.budgets import QueryBudgetExceeded, query_budget, record_query
+from game.audience import flush_audience, get_audience_votes
+from game.broadcast import players_joined
+from game.catalog import load_catalog
+from game.codecs import MSGPACK_SUBPROTOCOL, msgpack
+from game.consumers import BotConsumer, PlayerConsumer
+from game.consumers.mixins import CLOSE_IDLE, CLOSE_OVERFLOW
+from game.db import AsyncConnectionPool, OrmDatabase, PooledDatabase, acreate_room, aget_matchup, aget_matchups, \
+    aregister_player
+from game.models import GamePhase, GameRoom, Matchup, Player, Prompt, Vote
+from game.phase import _cache as phase_cache, advance, get_phase, start_voting
+from game.roster import record_joins
+from game.rounds import close_voting_round, flush_answers
+from game.scheduler import expire
+from game.state import ANSWER_CLOSED, get_game_state
+from game.transitions import FALLBACK_ANSWER, save_answers
+from game.validation import MESSAGE_SERIALIZERS, get_validator
+from game.views.API import PlayerConnectAPIView, PlayerAnswerAPIView, VoteAPIView, PromptAPIView, \
+    PlayerCountAPIView, LeaderboardAPIView
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+GAME_SETTINGS = {
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'GAME_STATE': {'BACKEND': 'game.state.LocMemGameState'},
+    'GAME_BROADCAST_WINDOW': 0,
+    'GAME_QUERY_BUDGETS': True,
+    # Пул живёт в event loop, а у каждого теста цикл свой: запросы идут через ORM
+    'GAME_DB_POOL': None,
+}
+
+
+def redis_backend(test_class):
+    """
+    Те же тесты на RedisGameState поверх fakeredis: скрипты Lua проверяются
+    наравне с LocMemGameState, и расхождение хранилищ роняет тесты.
+    """
+    @skipUnless(fakeredis is not None, 'нужен fakeredis')
+    @override_settings(GAME_STATE={'BACKEND': 'game.state.RedisGameState', 'LOCATION': 'redis://fakeredis'})
+    class RedisTests(test_class):
+        def setUp(self):
+            server = fakeredis.FakeServer()
+            patcher = patch('redis.asyncio.Redis.from_url',
+                            lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+            # Коды комнат те же, что у тестов на LocMem: кэши фазы и состава не должны их помнить
+            phase_cache.clear()
+            cache.clear()
+            super().setUp()
+
+    RedisTests.__name__ = RedisTests.__qualname__ = f'Redis{test_class.__name__}'
+    return RedisTests
+
+
+@override_settings(GAME_QUERY_BUDGETS=True)
+class QueryBudgetTests(TestCase):
+    def test_recorder_follows_setting(self):
+        self.assertIn(record_query, connection.execute_wrappers)
+        with override_settings(GAME_QUERY_BUDGETS=False):
+            # Без бюджетов запросы идут без обёртки
+            self.assertNotIn(record_query, connection.execute_wrappers)
+        self.assertIn(record_query, connection.execute_wrappers)
+
+    def test_over_budget(self):
+        @query_budget(1)
+        def handler():
+            Player.objects.count()
+            Prompt.objects.count()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            handler()
+
+    def test_repeated_query(self):
+        @query_budget(10)
+        def handler():
+            for telegram_id in range(3):
+                Player.objects.filter(telegram_id=telegram_id).exists()
+
+        with self.assertRaisesRegex(QueryBudgetExceeded, 'N\\+1'):
+            handler()
+
+    def test_nested_handlers_share_queries(self):
+        @query_budget(1)
+        def inner():
+            Player.objects.count()
+
+        @query_budget(1)
+        def outer():
+            Prompt.objects.count()
+            inner()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            outer()
+
+    @override_settings(GAME_QUERY_BUDGETS=False)
+    def test_disabled(self):
+        @query_budget(0)
+        def handler():
+            return Player.objects.count()
+
+        self.assertEqual(handler(), 0)
+
+
+@override_settings(**GAME_SETTINGS)
+class BotBudgetTests(TransactionTestCase):
+    """
+    Полная игра через BotConsumer: обработчик сверх бюджета роняет сокет.
+    """
+    players = 5
+
+    def setUp(self):
+        Prompt.objects.bulk_create([Prompt(phrase=f'Фраза {i}') for i in range(5)])
+        # Каталог фраз читается раз на воркер, а бюджеты считают обработчик в рабочем режиме
+        load_catalog()
+
+    async def request(self, bot, content):
+        await bot.send_json_to(content)
+        while True:
+            message = await bot.receive_json_from(timeout=5)
+            if message.get('type') not in ('receive_players_prompts', 'receive_player_answers'):
+                return message
+            self.pushes.append(message)
+
+    async def push(self, bot, type):
+        while True:
+            message = self.pushes.pop(0) if self.pushes else await bot.receive_json_from(timeout=5)
+            if message.get('type') == type:
+                return message
+
+    async def play(self, batch):
+        from UNIT_HACK_2025.asgi import application
+
+        # Состояние игры в памяти общее для процесса: у каждого теста своя комната
+        room = 'batch' if batch else 'single'
+        self.pushes = []
+        await acreate_room(room)
+        bot = WebsocketCommunicator(application, f'/ws/bot/{room}/')
+        await bot.connect()
+        await bot.receive_json_from()
+        ids = list(range(100, 100 + self.players))
+
+        if batch:
+            await self.request(bot, {'type': 'register_players',
+                                     'players': [{'telegram_id': tid, 'username': f'u{tid}'} for tid in ids]})
+        else:
+            for tid in ids:
+                await self.request(bot, {'type': 'register_player', 'telegram_id': tid, 'username': f'u{tid}'})
+
+        await self.async_client.get(f'/game/{room}/waiting/')
+        prompts = await self.push(bot, 'receive_players_prompts')
+        await bot.send_json_to({'type': 'receive_players_prompts'})
+        self.assertEqual((await bot.receive_json_from(timeout=5))['players'], prompts['players'])
+        answers = [{'telegram_id': entry['telegram_id'], 'answer': 'ответ', 'round': entry['round']}
+                   for entry in prompts['players']]
+        if batch:
+            await self.request(bot, {'type': 'send_player_answers', 'answers': answers})
+        else:
+            for answer in answers:
+                await self.request(bot, {'type': 'send_player_answer', **answer})
+
+        rounds = 0
+        while True:
+            matchup = await self.push(bot, 'receive_player_answers')
+            rounds += 1
+            candidates = {matchup['answer0']['telegram_id'], matchup['answer1']['telegram_id']}
+            votes = [{'voter_id': tid, 'candidate_id': min(candidates)} for tid in ids if tid not in candidates]
+            if batch:
+                await self.request(bot, {'type': 'send_player_votes', 'votes': votes})
+            else:
+                for vote in votes:
+                    await self.request(bot, {'type': 'send_player_vote', **vote})
+            if rounds == len(answers) // 2:
+                break
+
+        # Неверный номер раунда — ошибка проверки, а не упавший сокет
+        for round in ('abc', [1]):
+            await bot.send_json_to({'type': 'receive_player_answers', 'round': round})
+            reply = await bot.receive_json_from(timeout=5)
+            self.assertEqual((reply['status'], list(reply['errors'])), ('error', ['round']))
+        await bot.send_json_to({'type': 'receive_player_answers', 'round': 1})
+        self.assertEqual((await bot.receive_json_from(timeout=5))['round'], 1)
+        await bot.disconnect()
+        return rounds
+
+    async def test_single_messages(self):
+        self.assertEqual(await self.play(batch=False), 2)
+
+    async def test_batch_messages(self):
+        self.assertEqual(await self.play(batch=True), 2)
+
+
+@override_settings(**GAME_SETTINGS)
+class APIBudgetTests(TransactionTestCase):
+    """
+    Полная игра через REST API с проверкой бюджетов каждого обработчика.
+    """
+
+    def setUp(self):
+        Prompt.objects.bulk_create([Prompt(phrase=f'Фраза {i}') for i in range(5)])
+        # Каталог фраз читается раз на воркер, а бюджеты считают обработчик в рабочем режиме
+        load_catalog()
+        GameRoom.objects.create(code='api')
+        self.factory = RequestFactory()
+
+    def call(self, view, method, data=None, **params):
+        if method == 'post':
+            request = self.factory.post('/', data, content_type='application/json')
+        else:
+            request = self.factory.get('/', params)
+        response = view.as_view()(request, room='api')
+        if hasattr(response, '__await__'):
+            response = async_to_sync(lambda: response)()
+        response.data = json.loads(response.content) if response.get('Content-Type') == 'application/json' else None
+        return response
+
+    def test_game(self):
+        ids = [200, 201, 202, 203]
+        for tid in ids:
+            self.assertEqual(self.call(PlayerConnectAPIView, 'post', {'telegram_id': tid, 'username': 'u'}).status_code, 204)
+
+        Client().get('/game/api/waiting/')
+        prompts = {tid: self.call(PromptAPIView, 'get', telegram_id=tid).data['prompts'] for tid in ids}
+        for round in ('abc', [1]):
+            response = self.call(PlayerAnswerAPIView, 'post', {'telegram_id': ids[0], 'answer': 'a', 'round': round})
+            self.assertEqual(response.status_code, 400)
+        for tid, rounds in prompts.items():
+            for prompt in rounds:
+                response = self.call(PlayerAnswerAPIView, 'post', {'telegram_id': tid, 'answer': 'a', 'round': prompt['round']})
+                self.assertEqual(response.status_code, 204)
+
+        winners = []
+        for _ in range(2):
+            matchup = self.call(PlayerAnswerAPIView, 'get').data
+            candidate = matchup['answer0']['telegram_id']
+            winners.append(candidate)
+            self.assertEqual(self.call(PlayerCountAPIView, 'get').status_code, 200)
+            for tid in ids:
+                self.assertEqual(self.call(VoteAPIView, 'post', {'voter_id': tid, 'candidate_id': candidate}).status_code, 204)
+
+        self.assertEqual(self.call(PlayerCountAPIView, 'get').data, {'count': 0})
+
+        leaderboard = self.call(LeaderboardAPIView, 'get', limit=2, telegram_id=winners[0]).data
+        self.assertEqual([entry['vote_count'] for entry in leaderboard['players']], [4, 4])
+        # Равный счёт: по возрастанию telegram_id
+        self.assertEqual([entry['telegram_id'] for entry in leaderboard['players']], sorted(winners))
+        self.assertEqual(leaderboard['rank'], {'place': 1, 'vote_count': 4})
+
+
+@override_settings(**GAME_SETTINGS)
+class DeadlineTests(TransactionTestCase):
+    """
+    Просроченные фазы завершает планировщик, сколько бы воркеров ни заметили срок.
+    """
+
+    def setUp(self):
+        Prompt.objects.bulk_create([Prompt(phrase=f'Фраза {i}') for i in range(2)])
+        load_catalog()
+
+    async def start(self, code):
+        room = await new_room(code)
+        for tid in (1, 2, 3, 4):
+            await Player.objects.acreate(room=room, telegram_id=tid, username=f'u{tid}')
+        await self.async_client.get(f'/game/{code}/waiting/')
+        return room, await get_phase(room, fresh=True)
+
+    async def deadlines(self, code):
+        return [deadline for deadline in await get_game_state().get_due_deadlines(time() + 3600) if deadline[0] == code]
+
+    async def test_expired_answers_are_filled_once(self):
+        room, answering = await self.start('late')
+        state = get_game_state()
+        await state.set_answer('late', 1, 'свой ответ')
+        await gather(expire('late', answering.version), expire('late', answering.version))
+
+        voting = await get_phase(room, fresh=True)
+        self.assertEqual(voting, (GamePhase.VOTING, 1, answering.version + 1))
+        answers = {}
+        for matchup in await aget_matchups(room):
+            answers[matchup.player_a.telegram_id] = matchup.answer_a
+            answers[matchup.player_b.telegram_id] = matchup.answer_b
+        self.assertEqual(answers, {1: 'свой ответ', 2: FALLBACK_ANSWER, 3: FALLBACK_ANSWER, 4: FALLBACK_ANSWER})
+        # Фаза ответов закрыта: опоздавший ответ не перезапишет перенесённые в БД
+        self.assertEqual(await state.set_answer('late', 2, 'поздно'), (ANSWER_CLOSED, 0, 0))
+        self.assertEqual(await self.deadlines('late'), [('late', voting.version)])
+
+    async def test_vote_page_is_cached_after_answers_are_saved(self):
+        room, _ = await self.start('page')
+        for tid in (1, 2, 3, 4):
+            await get_game_state().set_answer('page', tid, f'ответ {tid}')
+        # Страница, открытая между сменой фазы и переносом ответов, ещё без ответов
+        await start_voting(room)
+        self.assertContains(await self.async_client.get('/game/page/vote/'), 'Нет ответа')
+        await save_answers(room, False)
+        response = await self.async_client.get('/game/page/vote/')
+        self.assertNotContains(response, 'Нет ответа')
+        self.assertContains(response, 'ответ ')
+
+    async def test_expired_voting_closes_round(self):
+        room, answering = await self.start('quiet')
+        await expire('quiet', answering.version)
+        voting = await get_phase(room, fresh=True)
+        matchup = await aget_matchup(room, 1)
+        candidates = {matchup.player_a.telegram_id, matchup.player_b.telegram_id}
+        voter = min({1, 2, 3, 4} - candidates)
+        await get_game_state().record_vote('quiet', voter, matchup.player_a.telegram_id)
+
+        await expire('quiet', voting.version)
+        self.assertEqual(await get_phase(room, fresh=True), (GamePhase.VOTING, 2, voting.version + 1))
+        self.assertEqual(await Vote.objects.filter(room=room, round=1).acount(), 1)
+        self.assertEqual((await Player.objects.aget(id=matchup.player_a_id)).vote_count, 1)
+        # Таблица лидеров считается по тем же бюллетеням, что попали в журнал Vote
+        top = await get_game_state().get_leaderboard('quiet', 4)
+        self.assertEqual({entry.telegram_id: entry.vote_count for entry in top if entry.vote_count},
+                         {matchup.player_a.telegram_id: 1})
+
+    def failing_once(self, func):
+        calls = []
+
+        def wrapper(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise DatabaseError('нет соединения')
+            return func(*args)
+
+        return wrapper
+
+    @patch('game.transitions.RETRY_DELAY', 0)
+    async def test_failed_flush_is_retried(self):
+        room, answering = await self.start('retry')
+        # Фаза уже сменилась, когда перенос упал: повторяет его победитель смены
+        with patch('game.transitions.flush_answers', self.failing_once(flush_answers)), \
+                self.assertLogs('game.transitions', 'ERROR'):
+            await expire('retry', answering.version)
+        voting = await get_phase(room, fresh=True)
+        self.assertEqual(voting.phase, GamePhase.VOTING)
+        self.assertEqual(await Matchup.objects.filter(room=room, answer_a=None).acount(), 0)
+
+        matchup = await aget_matchup(room, 1)
+        voter = min({1, 2, 3, 4} - {matchup.player_a.telegram_id, matchup.player_b.telegram_id})
+        await get_game_state().record_vote('retry', voter, matchup.player_b.telegram_id)
+        with patch('game.transitions.close_voting_round', self.failing_once(close_voting_round)), \
+                self.assertLogs('game.transitions', 'ERROR'):
+            await expire('retry', voting.version)
+        self.assertEqual(await Vote.objects.filter(room=room, round=1).acount(), 1)
+        top = await get_game_state().get_leaderboard('retry', 1)
+        self.assertEqual((top[0].telegram_id, top[0].vote_count), (matchup.player_b.telegram_id, 1))
+
+    async def test_stale_deadline_is_dropped(self):
+        room, answering = await self.start('stale')
+        await get_game_state().set_deadline('stale', answering.version - 1, time())
+        await expire('stale', answering.version - 1)
+        self.assertEqual(await get_phase(room, fresh=True), answering)
+        self.assertEqual(await self.deadlines('stale'), [('stale', answering.version)])
+
+
+@skipUnless(msgpack is not None, 'нужен msgpack')
+@override_settings(**GAME_SETTINGS)
+class MsgpackTests(TransactionTestCase):
+    async def test_bad_frames_get_error_reply(self):
+        from UNIT_HACK_2025.asgi import application
+
+        await acreate_room('binary')
+        bot = WebsocketCommunicator(application, '/ws/bot/binary/', subprotocols=[MSGPACK_SUBPROTOCOL])
+        connected, subprotocol = await bot.connect()
+        self.assertEqual(subprotocol, MSGPACK_SUBPROTOCOL)
+        self.assertEqual(msgpack.unpackb(await bot.receive_from()), {'status': 'ok'})
+
+        error = {'status': 'error', 'message': 'Invalid MessagePack format'}
+        for frame in (b'\xc1', msgpack.packb({'type': 'ping'}) + b'\x00', msgpack.packb({1: 'ключ не строка'})):
+            await bot.send_to(bytes_data=frame)
+            self.assertEqual(msgpack.unpackb(await bot.receive_from()), error)
+        # Сокет пережил плохие кадры и отвечает на хороший
+        await bot.send_to(bytes_data=msgpack.packb({'type': 'ping'}))
+        self.assertEqual(msgpack.unpackb(await bot.receive_from()), {'type': 'pong'})
+        await bot.disconnect()
+
+
+@override_settings(**GAME_SETTINGS)
+class GameStartTests(TransactionTestCase):
+    def test_without_prompts_room_stays_in_lobby(self):
+        room = async_to_sync(new_room)('empty')
+        Player.objects.bulk_create([Player(room=room, telegram_id=tid, username='u') for tid in (1, 2)])
+        Client().get('/game/empty/waiting/')
+        self.assertEqual(async_to_sync(get_phase)(room, fresh=True).phase, GamePhase.LOBBY)
+        self.assertFalse(Matchup.objects.filter(room=room).exists())
+
+        Prompt.objects.create(phrase='Фраза')
+        Client().get('/game/empty/waiting/')
+        self.assertEqual(async_to_sync(get_phase)(room, fresh=True).phase, GamePhase.ANSWERING)
+        self.assertEqual(Matchup.objects.filter(room=room).count(), 1)
+
+
+@override_settings(**GAME_SETTINGS)
+class PhaseTests(SimpleTestCase):
+    """
+    Переход фазы выполняет только тот, кто видел её текущую версию.
+    """
+    async def lobby(self, code):
+        room = GameRoom(code=code)
+        return room, await get_phase(room, fresh=True)
+
+    async def test_stale_version_loses(self):
+        room, current = await self.lobby('stale')
+        answering = await advance(room, current, GamePhase.ANSWERING)
+        self.assertEqual(answering, (GamePhase.ANSWERING, 0, current.version + 1))
+        # Второй переход по уже устаревшей версии не проходит и не трогает фазу
+        self.assertIsNone(await advance(room, current, GamePhase.ANSWERING))
+        self.assertEqual(await get_phase(room, fresh=True), answering)
+
+    async def test_concurrent_advance_has_one_winner(self):
+        room, current = await self.lobby('race')
+        results = await gather(*(advance(room, current, GamePhase.ANSWERING) for _ in range(5)))
+        winners = [result for result in results if result is not None]
+        self.assertEqual(len(winners), 1)
+        # Срок назначил только победитель
+        due = await get_game_state().get_due_deadlines(float('inf'))
+        self.assertEqual([deadline for deadline in due if deadline[0] == 'race'], [('race', winners[0].version)])
+
+    async def test_fresh_bypasses_cache(self):
+        room, current = await self.lobby('cached')
+        # Фазу сменил другой воркер: кэш процесса об этом ещё не знает
+        await get_game_state().compare_and_set_phase(room.code, current.version, GamePhase.ANSWERING, 0)
+        self.assertEqual(await get_phase(room), current)
+        self.assertEqual((await get_phase(room, fresh=True)).phase, GamePhase.ANSWERING)
+        self.assertEqual((await get_phase(room)).phase, GamePhase.ANSWERING)
+
+
+@override_settings(**GAME_SETTINGS)
+class LeaderboardTests(SimpleTestCase):
+    async def test_ties_by_telegram_id(self):
+        state = get_game_state()
+        await state.reset_leaderboard('ties', {telegram_id: str(telegram_id) for telegram_id in (2, 7, 9, 10, 100)})
+        await state.add_scores('ties', {7: 3, 100: 1, 10: 1, 9: 1})
+        # Порядок числовой, а не строковый: 9 раньше 10 и 100
+        top = await state.get_leaderboard('ties', 3)
+        self.assertEqual([(entry.telegram_id, entry.vote_count) for entry in top], [(7, 3), (9, 1), (10, 1)])
+        self.assertEqual([entry.telegram_id for entry in await state.get_leaderboard('ties', 10)], [7, 9, 10, 100, 2])
+
+
+@override_settings(**{**GAME_SETTINGS, 'GAME_BROADCAST_WINDOW': 0.05})
+class BroadcastTests(TransactionTestCase):
+    async def test_joins_in_window_are_one_message(self):
+        room = await new_room('burst')
+        screen = await connect_screen('burst')
+        first = await aregister_player(room, 1, 'first')
+        second = await aregister_player(room, 2, 'second')
+        await players_joined(room, [first])
+        await players_joined(room, [second])
+        # Переподключение внутри окна: игрок один раз, с последним именем
+        await players_joined(room, [await aregister_player(room, 1, 'renamed')])
+        version = (await get_game_state().get_roster(room.code))[0]
+
+        message = await screen.receive_json_from(1)
+        self.assertEqual(message, {'type': 'new_players', 'version': version, 'players': [
+            {'id': first.id, 'username': 'renamed'},
+            {'id': second.id, 'username': 'second'},
+        ]})
+        self.assertTrue(await screen.receive_nothing(0.1))
+        await screen.disconnect()
+
+
+@override_settings(**GAME_SETTINGS)
+class RosterResyncTests(TransactionTestCase):
+    """
+    Экран с версией состава в ?since= получает изменения после неё,
+    а если журнал их не покрывает — полный снимок.
+    """
+    async def join(self, room, *names):
+        for name in names:
+            player = await aregister_player(room, len(name), name)
+            version = await record_joins(room, [{'id': player.id, 'username': name}])
+        return version
+
+    async def resync(self, room, since):
+        from UNIT_HACK_2025.asgi import application
+
+        screen = WebsocketCommunicator(application, f'/ws/players/{room.code}/?since={since}')
+        await screen.connect()
+        message = await screen.receive_json_from()
+        await screen.disconnect()
+        return message
+
+    async def test_delta_when_log_covers_gap(self):
+        room = await new_room('delta')
+        await self.join(room, 'a')
+        version = await self.join(room, 'bb', 'ccc')
+        message = await self.resync(room, version - 2)
+        self.assertEqual(message['type'], 'new_players')
+        self.assertEqual(message['version'], version)
+        self.assertEqual([player['username'] for player in message['players']], ['bb', 'ccc'])
+        # Актуальный экран получает пустые изменения
+        self.assertEqual((await self.resync(room, version))['players'], [])
+
+    async def test_snapshot_when_log_is_trimmed(self):
+        room = await new_room('trimmed')
+        with patch('game.state.ROSTER_LOG_SIZE', 2):
+            version = await self.join(room, 'a', 'bb', 'ccc')
+        message = await self.resync(room, version - 3)
+        self.assertEqual(message['type'], 'init')
+        self.assertEqual(message['version'], version)
+        self.assertEqual([player['username'] for player in message['players']], ['a', 'bb', 'ccc'])
+        # Последние две записи журнал ещё хранит
+        self.assertEqual(len((await self.resync(room, version - 2))['players']), 2)
+
+    async def test_snapshot_for_unknown_version(self):
+        room = await new_room('unknown')
+        version = await self.join(room, 'a')
+        message = await self.resync(room, version + 5)
+        self.assertEqual((message['type'], message['version']), ('init', version))
+
+    async def test_version_survives_clear(self):
+        room = await new_room('cleared')
+        version = await self.join(room, 'a', 'bb')
+        await get_game_state().clear(room.code)
+        # Версия не откатилась: старая версия экрана не совпадёт с новыми изменениями
+        self.assertEqual((await get_game_state().get_roster(room.code))[0], version)
+        self.assertEqual((await self.resync(room, version - 1))['type'], 'init')
+        self.assertEqual(await self.join(room, 'ccc'), version + 1)
+        message = await self.resync(room, version)
+        self.assertEqual((message['type'], message['players'][0]['username']), ('new_players', 'ccc'))
+
+
+@skipUnless(connection.vendor == 'postgresql' and AsyncConnectionPool is not None, 'нужны PostgreSQL и psycopg_pool')
+@override_settings(**GAME_SETTINGS)
+class PooledDatabaseTests(TransactionTestCase):
+    """
+    Запросы пула psycopg возвращают то же, что ORM.
+    """
+
+    def players(self, players):
+        return sorted((player.id, player.room_id, player.telegram_id, player.username, player.vote_count)
+                      for player in players)
+
+    def matchups(self, matchups):
+        return [
+            (matchup.id, matchup.round, matchup.prompt_id, matchup.answer_a,
+             self.players([matchup.player_a]), self.players([matchup.player_b]))
+            for matchup in matchups
+        ]
+
+    async def test_matches_orm(self):
+        pooled, orm = PooledDatabase(connection.settings_dict), OrmDatabase()
+        try:
+            room, created = await pooled.create_room('pool')
+            self.assertTrue(created)
+            self.assertEqual((await orm.get_room('pool')).id, room.id)
+            self.assertEqual((await pooled.get_room('pool')).id, room.id)
+
+            registered = await pooled.register_players(room, {1: 'a', 2: 'b', 3: 'c'})
+            await Player.objects.filter(telegram_id=1).aupdate(vote_count=3)
+            # Вернувшийся игрок меняет имя, но сохраняет счёт
+            returning = await pooled.register_player(room, 1, 'aa')
+            self.assertEqual(self.players([returning]), [(registered[0].id, room.id, 1, 'aa', 3)])
+            self.assertEqual(self.players(await pooled.register_players(room, {2: 'bb', 4: 'd'})),
+                             self.players(await orm.register_players(room, {2: 'bb', 4: 'd'})))
+            self.assertEqual(self.players([await pooled.register_player(room, 5, 'e')]),
+                             self.players([await orm.register_player(room, 5, 'e')]))
+
+            prompt = await Prompt.objects.acreate(phrase='Фраза')
+            players = {player.telegram_id: player async for player in Player.objects.filter(room=room)}
+            await Matchup.objects.abulk_create([
+                Matchup(room=room, round=2, prompt=prompt, player_a=players[3], player_b=players[4], answer_a='x'),
+                Matchup(room=room, round=1, prompt=prompt, player_a=players[1], player_b=players[2]),
+            ])
+            self.assertEqual(self.matchups(await pooled.get_matchups(room)), self.matchups(await orm.get_matchups(room)))
+            self.assertEqual(self.matchups([await pooled.get_matchup(room, 2)]),
+                             self.matchups([await orm.get_matchup(room, 2)]))
+            self.assertIsNone(await pooled.get_matchup(room, 3))
+        finally:
+            await pooled.close()
+
+    def test_orm_connections_return_to_pool(self):
+        connection.ensure_connection()
+        self.assertIsNotNone(connection.pool)
+        raw = connection.connection
+        connection.close()
+        # Закрытие отдаёт соединение обратно в пул Django, а не рвёт его
+        self.assertFalse(raw.closed)
+
+
+WEBSOCKET_SETTINGS = {
+    'players': {'HEARTBEAT': 0.05, 'IDLE_TIMEOUT': 0.2, 'QUEUE_SIZE': 2, 'OVERFLOW': 'drop'},
+    'spectators': {'HEARTBEAT': None, 'IDLE_TIMEOUT': None, 'QUEUE_SIZE': 2, 'OVERFLOW': 'drop'},
+    'bot': {'HEARTBEAT': None, 'IDLE_TIMEOUT': None, 'QUEUE_SIZE': 2, 'OVERFLOW': 'close'},
+}
+
+
+async def new_room(code):
+    return (await acreate_room(code))[0]
+
+
+async def connect_screen(room, path='players', session=None):
+    from UNIT_HACK_2025.asgi import application
+
+    await acreate_room(room)
+    headers = [(b'cookie', f'{settings.SESSION_COOKIE_NAME}={session}'.encode())] if session else []
+    screen = WebsocketCommunicator(application, f'/ws/{path}/{room}/', headers)
+    await screen.connect()
+    await screen.receive_json_from()
+    return screen
+
+
+@override_settings(**GAME_SETTINGS, GAME_WEBSOCKETS=WEBSOCKET_SETTINGS)
+class ConnectionTests(TransactionTestCase):
+    """
+    Проверки живости экранов и очередь отправки медленным клиентам.
+    """
+    async def test_idle_screen_is_reaped(self):
+        screen = await connect_screen('idle')
+        # Экран молчит: после нескольких ping сервер закрывает сокет и выводит его из группы
+        while (message := await screen.receive_output(1))['type'] == 'websocket.send':
+            self.assertEqual(json.loads(message['text']), {'type': 'ping'})
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_IDLE})
+        self.assertFalse(get_channel_layer().groups.get('players_idle'))
+        await screen.disconnect()
+
+    async def test_pong_keeps_screen(self):
+        screen = await connect_screen('alive')
+        for _ in range(8):
+            self.assertEqual(await screen.receive_json_from(), {'type': 'ping'})
+            await screen.send_json_to({'type': 'pong'})
+        self.assertTrue(get_channel_layer().groups.get('players_alive'))
+        await screen.disconnect()
+
+    async def test_frames_that_are_not_objects_are_ignored(self):
+        for path in ('players', 'spectators'):
+            screen = await connect_screen('frames', path)
+            for frame in ([], 1, 'x', None):
+                await screen.send_json_to(frame)
+            await screen.send_json_to({'type': 'ping'})
+            # Сокет жив и отвечает; ping сервера по пути пропускаем
+            while (message := await screen.receive_json_from()) == {'type': 'ping'}:
+                pass
+            self.assertEqual(message, {'type': 'pong'})
+            await screen.disconnect()
+
+    def stalled(self, consumer_class, overflow):
+        # Очередь уже не разбирается: писатель сокета не запущен
+        consumer = consumer_class()
+        consumer.overflow = overflow
+        consumer.send_queue = Queue(2)
+        consumer.sent = []
+
+        async def socket_send(message):
+            consumer.sent.append(message)
+
+        consumer.socket_send = socket_send
+        return consumer
+
+    async def test_slow_screen_drops_oldest(self):
+        consumer = self.stalled(PlayerConsumer, 'drop')
+        for number in range(5):
+            await consumer.enqueue({'type': 'websocket.send', 'text': str(number)})
+        self.assertEqual([consumer.send_queue.get_nowait()['text'] for _ in range(2)], ['3', '4'])
+        self.assertEqual(consumer.sent, [])
+
+    async def test_slow_bot_is_closed(self):
+        consumer = self.stalled(BotConsumer, 'close')
+        for number in range(5):
+            await consumer.enqueue({'type': 'websocket.send', 'text': str(number)})
+        self.assertTrue(consumer.released)
+        self.assertEqual(consumer.sent, [{'type': 'websocket.close', 'code': CLOSE_OVERFLOW}])
+
+    async def test_feed_joins_group_once(self):
+        layer = get_channel_layer()
+        with patch.object(layer, 'group_add', wraps=layer.group_add) as group_add:
+            spectator = await connect_screen('refresh', 'spectators')
+            for _ in range(3):
+                await layer.group_send('players_refresh', {'type': 'leaderboard', 'players': []})
+                self.assertEqual((await spectator.receive_json_from())['type'], 'leaderboard')
+        # Членство продлевается по таймеру, а не на каждое событие
+        feed_adds = [call for call in group_add.call_args_list if call.args[1].startswith('spectators.')]
+        self.assertEqual(len(feed_adds), 1)
+        await spectator.disconnect()
+
+    async def test_spectators_share_one_subscription(self):
+        screen = await connect_screen('audience')
+        spectators = [await connect_screen('audience', 'spectators') for _ in range(3)]
+        # Экран и одна подписка воркера на всех зрителей
+        self.assertEqual(len(get_channel_layer().groups['players_audience']), 2)
+
+        await get_channel_layer().group_send('players_audience', {'type': 'leaderboard', 'players': []})
+        expected = {'type': 'leaderboard', 'players': []}
+        self.assertEqual(await screen.receive_json_from(), expected)
+        for spectator in spectators:
+            self.assertEqual(await spectator.receive_json_from(), expected)
+
+        for spectator in spectators:
+            await spectator.disconnect()
+        self.assertEqual(len(get_channel_layer().groups['players_audience']), 1)
+        await screen.disconnect()
+
+
+@override_settings(**GAME_SETTINGS, GAME_WEBSOCKETS=WEBSOCKET_SETTINGS, GAME_AUDIENCE_FLUSH_INTERVAL=60)
+class AudienceVoteTests(TransactionTestCase):
+    async def session(self):
+        session = SessionStore()
+        await session.acreate()
+        return session.session_key
+
+    async def open_voting(self, code):
+        state = get_game_state()
+        return await state.compare_and_set_phase(code, (await state.get_phase(code))[2], GamePhase.VOTING, 1)
+
+    async def test_votes_are_deduplicated_and_closed_with_round(self):
+        room = await new_room('crowd')
+        state = get_game_state()
+        version = await self.open_voting('crowd')
+
+        spectators = [await connect_screen('crowd', 'spectators', await self.session()) for _ in range(3)]
+        for spectator, choice in zip(spectators, (0, 1, 1)):
+            for _ in range(2):
+                await spectator.send_json_to({'type': 'vote', 'candidate': choice})
+                self.assertEqual(await spectator.receive_json_from(), {'type': 'vote', 'status': 'ok', 'round': 1})
+
+        # До записи голоса лежат в памяти воркера
+        self.assertEqual(await get_audience_votes(room, 1), {'player0': 0, 'player1': 0})
+        await flush_audience(room, 1)
+        self.assertEqual(await get_audience_votes(room, 1), {'player0': 1, 'player1': 2})
+
+        await state.compare_and_set_phase('crowd', version, GamePhase.VOTING, 2)
+        self.assertIsNone(await state.add_audience_votes('crowd', 1, {'late': 0}))
+        self.assertEqual(await get_audience_votes(room, 1), {'player0': 1, 'player1': 2})
+        for spectator in spectators:
+            await spectator.disconnect()
+
+    async def test_reconnect_keeps_one_vote_per_session(self):
+        room = await new_room('again')
+        await self.open_voting('again')
+        session = await self.session()
+        for choice in (0, 1):
+            spectator = await connect_screen('again', 'spectators', session)
+            await spectator.send_json_to({'type': 'vote', 'candidate': choice})
+            self.assertEqual(await spectator.receive_json_from(), {'type': 'vote', 'status': 'ok', 'round': 1})
+            await spectator.disconnect()
+            await flush_audience(room, 1)
+        self.assertEqual(await get_audience_votes(room, 1), {'player0': 1, 'player1': 0})
+
+    async def test_vote_requires_session(self):
+        await self.open_voting('anonymous')
+        for session in (None, 'forged'):
+            spectator = await connect_screen('anonymous', 'spectators', session)
+            await spectator.send_json_to({'type': 'vote', 'candidate': 0})
+            self.assertEqual(await spectator.receive_json_from(),
+                             {'type': 'vote', 'status': 'error', 'message': 'Session required'})
+            await spectator.disconnect()
+
+    def test_room_page_starts_session(self):
+        GameRoom.objects.create(code='pages')
+        response = Client().get('/game/pages/')
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+
+@override_settings(**GAME_SETTINGS)
+class RoomTests(TransactionTestCase):
+    """
+    Комнаты создаются только через API, страницы и сокеты неизвестных комнат их не заводят.
+    """
+    def test_unknown_room_is_not_created(self):
+        for path in ('/game/nowhere/', '/game/nowhere/waiting/', '/game/vote/', '/game/win/',
+                     '/game/nowhere/api/count/'):
+            with self.subTest(path=path):
+                self.assertEqual(Client().get(path).status_code, 404)
+        self.assertFalse(GameRoom.objects.exists())
+
+    async def test_unknown_room_socket_is_rejected(self):
+        from UNIT_HACK_2025.asgi import application
+
+        for path in ('/ws/players/nowhere/', '/ws/spectators/nowhere/', '/ws/bot/nowhere/'):
+            with self.subTest(path=path):
+                socket = WebsocketCommunicator(application, path)
+                connected, _ = await socket.connect()
+                self.assertFalse(connected)
+        self.assertFalse(await GameRoom.objects.aexists())
+
+    def test_create_room(self):
+        client = Client()
+        response = client.post('/game/api/rooms/', {'code': 'party'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'code': 'party', 'url': '/game/party/'})
+        self.assertEqual(client.post('/game/api/rooms/', {'code': 'party'},
+                                     content_type='application/json').status_code, 200)
+        for data in ({'code': 'не slug'}, {}, 'party'):
+            with self.subTest(data=data):
+                self.assertEqual(client.post('/game/api/rooms/', data, content_type='application/json').status_code, 400)
+        self.assertEqual(client.get('/game/party/').status_code, 200)
+        self.assertEqual(GameRoom.objects.count(), 1)
+
+    def test_default_room_is_created_on_first_visit(self):
+        self.assertEqual(Client().get('/game/', follow=True).status_code, 200)
+        self.assertTrue(GameRoom.objects.filter(code=settings.GAME_DEFAULT_ROOM).exists())
+
+
+class MessageValidationTests(SimpleTestCase):
+    """
+    Скомпилированная проверка сообщений бота совпадает с сериализаторами DRF.
+    """
+    cases = {
+        'register_player': [
+            {'telegram_id': 1, 'username': 'u'}, {'telegram_id': '2'}, {'telegram_id': 3.0}, {'username': 'u'},
+            {'telegram_id': None}, {'telegram_id': True}, {'telegram_id': 'x'}, {'telegram_id': 1, 'username': 5},
+            {'telegram_id': 1, 'username': ['u']}, {'telegram_id': 1, 'username': '  '}, [], 'text',
+        ],
+        'send_player_answer': [
+            {'telegram_id': 1, 'answer': ' ответ ', 'round': 2}, {'telegram_id': 1, 'answer': 'a', 'round': None},
+            {'telegram_id': 1, 'answer': ''}, {'telegram_id': 1, 'answer': '   '}, {'telegram_id': 1},
+            {'telegram_id': 1, 'answer': 'a\x00b'}, {'telegram_id': 1, 'answer': 'a\ud800'},
+            {'type': '', 'telegram_id': 1, 'answer': 'a'},
+        ],
+        'send_player_votes': [
+            {'votes': [{'voter_id': 1, 'candidate_id': 2}, {'voter_id': '3', 'candidate_id': 4}]},
+            {'votes': [{'voter_id': 1, 'candidate_id': 2}, {'voter_id': 3}, 'x']}, {'votes': {}}, {'votes': []},
+            {},
+        ],
+        'register_players': [
+            {'players': [{'telegram_id': 1}, {'telegram_id': 2, 'username': ''}]}, {'players': None},
+        ],
+        'receive_player_answers': [
+            {'round': 1}, {'round': '2'}, {'round': None}, {}, {'round': 'abc'}, {'round': [1]}, {'round': 1.5},
+        ],
+    }
+
+    def test_matches_serializers(self):
+        for type, cases in self.cases.items():
+            validate = get_validator(type)
+            for content in cases:
+                with self.subTest(type=type, content=content):
+                    serializer = MESSAGE_SERIALIZERS[type](data=content)
+                    data, errors = validate(content)
+                    if serializer.is_valid():
+                        self.assertIsNone(errors)
+                        self.assertEqual(data, json.loads(json.dumps(serializer.validated_data)))
+                    else:
+                        self.assertIsNone(data)
+                        self.assertEqual(errors, json.loads(json.dumps(serializer.errors)))
+
+    def test_messages_without_contract(self):
+        self.assertIsNone(get_validator('receive_players_prompts'))
+
+
+# Тесты хранилища состояния ещё раз, на RedisGameState
+RedisBotBudgetTests = redis_backend(BotBudgetTests)
+RedisAPIBudgetTests = redis_backend(APIBudgetTests)
+RedisDeadlineTests = redis_backend(DeadlineTests)
+RedisGameStartTests = redis_backend(GameStartTests)
+RedisPhaseTests = redis_backend(PhaseTests)
+RedisLeaderboardTests = redis_backend(LeaderboardTests)
+RedisBroadcastTests = redis_backend(BroadcastTests)
+RedisRosterResyncTests = redis_backend(RosterResyncTests)
+RedisAudienceVoteTests = redis_backend(AudienceVoteTests)
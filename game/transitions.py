@@ -0,0 +1,114 @@
+"""
+Завершение фаз с оповещением экранов и бота.
+
+Фазу завершает тот, кто выиграл её смену (см. game.phase): бот, REST API
+или планировщик дедлайнов (game.scheduler). Остальные вызовы ничего не делают.
+Смена фазы идёт первой: после неё хранилище не принимает ответы закрытой
+фазы, и победитель переносит в БД уже неизменные данные. Перенос идемпотентен,
+и победитель повторяет его, пока тот не пройдёт: срок фазы к этому времени
+уже снят, и другого шанса сохранить её данные не будет.
+"""
+import logging
+from asyncio import sleep
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+
+from game.audience import flush_audience, get_audience_votes
+from game.catalog import aget_catalog
+from game.db import aget_matchups
+from game.leaderboard import record_round
+from game.notify import notify, ROUND_STARTED
+from game.phase import start_voting, finish_round
+from game.rounds import flush_answers, close_voting_round, get_telegram_ids, is_last_round
+from game.state import get_game_state
+
+logger = logging.getLogger(__name__)
+
+# Ответ за игрока, если у фразы нет запасных ответов
+FALLBACK_ANSWER = 'Нет ответа'
+
+# Пауза перед повтором неудавшегося переноса в БД, удваивается до RETRY_MAX_DELAY
+RETRY_DELAY = 0.5
+RETRY_MAX_DELAY = 30
+
+
+async def until_saved(room, save, *args):
+    """Вызывает перенос данных закрытой фазы, пока он не пройдёт."""
+    delay = RETRY_DELAY
+    while True:
+        try:
+            return await save(room, *args)
+        except Exception:
+            logger.exception('Не удалось сохранить фазу комнаты %s, повтор через %s с', room.code, delay)
+        await sleep(delay)
+        delay = min(delay * 2, RETRY_MAX_DELAY)
+
+
+async def complete_answers(room, fill_missing=False):
+    """
+    Открывает голосование за первую пару и переносит ответы в БД.
+    С fill_missing за молчащих игроков отвечают запасные ответы к их фразам.
+    """
+    if await start_voting(room) is None:
+        return
+    await until_saved(room, save_answers, fill_missing)
+
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(room.players_group, {'type': 'all_answers_received'})
+    await notify(room, ROUND_STARTED, 1)
+    await channel_layer.group_send(room.bot_group, {'type': 'receive_player_answers', 'round': 1})
+
+
+async def save_answers(room, fill_missing):
+    answers = await get_game_state().get_answers(room.code)
+    if fill_missing:
+        answers = await add_backup_answers(room, answers)
+    await database_sync_to_async(flush_answers)(room, answers)
+    # Фрагмент страницы голосования кэшируется по этой версии: до переноса
+    # он показал бы пару без ответов
+    await get_game_state().bump_answers_version(room.code)
+
+
+async def add_backup_answers(room, answers):
+    matchups = await aget_matchups(room)
+    catalog = await aget_catalog([matchup.prompt_id for matchup in matchups])
+    answers = dict(answers)
+    for matchup in matchups:
+        for player in (matchup.player_a, matchup.player_b):
+            slot = (matchup.round, player.telegram_id)
+            if slot not in answers:
+                answers[slot] = catalog.backup_answer(matchup.prompt_id) or FALLBACK_ANSWER
+    return answers
+
+
+async def complete_round(room, prompt_index):
+    """
+    Закрывает раунд и переходит к следующей паре или итогам, затем сохраняет
+    голоса раунда в журнал Vote и прибавляет к таблице лидеров те же голоса.
+    """
+    state = get_game_state()
+    # Голоса зрителей из других воркеров, не успевшие до закрытия раунда, отбрасываются
+    await flush_audience(room, prompt_index)
+    last = await database_sync_to_async(is_last_round)(room, prompt_index)
+
+    if await finish_round(room, prompt_index, last) is None:
+        return
+    # Раунд закрыт, хранилище больше не принимает его голоса
+    result, scores = await until_saved(room, save_round, prompt_index)
+    result = {'all_voted': last, **result, 'audience': await get_audience_votes(room, prompt_index)}
+
+    # Сверяем счётчик игроков с БД на границе раунда
+    await state.sync_players(room.code, await database_sync_to_async(get_telegram_ids)(room))
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(room.players_group, {'type': 'all_voted', 'message': result})
+    await record_round(room, scores)
+
+    if not result['all_voted']:
+        await notify(room, ROUND_STARTED, prompt_index + 1)
+        await channel_layer.group_send(room.bot_group, {'type': 'receive_player_answers', 'round': prompt_index + 1})
+
+
+async def save_round(room, prompt_index):
+    ballots = await get_game_state().get_ballots(room.code, prompt_index)
+    return await database_sync_to_async(close_voting_round)(room, prompt_index, ballots)
@@ -14,10 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.urls import path, re_path
+from django.views.generic import RedirectView
 
-from .consumers import PlayerConsumer, BotConsumer
-from .views.API import PlayerConnectAPIView, PlayerAnswerAPIView, VoteAPIView, PromptAPIView, PlayerCountAPIView
+from .consumers import PlayerConsumer, BotConsumer, SpectatorConsumer
+from .views.API import PlayerConnectAPIView, PlayerAnswerAPIView, VoteAPIView, PromptAPIView, PlayerCountAPIView, \
+    LeaderboardAPIView, RoomCreateAPIView
 from .views.pages import HomePageView
 from .views.pages import WaitingPageView
 from .views.pages import VotePageView
@@ -26,14 +29,20 @@ from .views.pages import WinPageView
 app_name = 'game'
 
 urlpatterns = [
-    path('', HomePageView.as_view(), name='home'),
-    path('api/count/', PlayerCountAPIView.as_view()),
-    path('waiting/', WaitingPageView.as_view(), name='waiting'),
-    path('vote/', VotePageView.as_view(), name='vote'),
-    path('win/', WinPageView.as_view(), name='win'),
+    path('', RedirectView.as_view(pattern_name='game:home'), {'room': settings.GAME_DEFAULT_ROOM}),
+    path('api/count/', PlayerCountAPIView.as_view(), {'room': settings.GAME_DEFAULT_ROOM}),
+    path('api/rooms/', RoomCreateAPIView.as_view(), name='rooms'),
+    path('<slug:room>/', HomePageView.as_view(), name='home'),
+    path('<slug:room>/api/count/', PlayerCountAPIView.as_view(), name='count'),
+    path('<slug:room>/api/leaderboard/', LeaderboardAPIView.as_view(), name='leaderboard'),
+    path('<slug:room>/waiting/', WaitingPageView.as_view(), name='waiting'),
+    path('<slug:room>/vote/', VotePageView.as_view(), name='vote'),
+    path('<slug:room>/win/', WinPageView.as_view(), name='win'),
 ]
 
+# Без кода комнаты сокеты подключаются к комнате по умолчанию
 websocket_urlpatterns = [
-    re_path(r'ws/players/$', PlayerConsumer.as_asgi()),
-    re_path(r'ws/bot/$', BotConsumer.as_asgi()),
+    re_path(r'ws/players/(?:(?P<room>[-a-zA-Z0-9_]+)/)?$', PlayerConsumer.as_asgi()),
+    re_path(r'ws/bot/(?:(?P<room>[-a-zA-Z0-9_]+)/)?$', BotConsumer.as_asgi()),
+    re_path(r'ws/spectators/(?:(?P<room>[-a-zA-Z0-9_]+)/)?$', SpectatorConsumer.as_asgi()),
 ]
@@ -0,0 +1,167 @@
+"""
+Проверка сообщений бота по сериализаторам из game.serializers.
+
+Сериализатор DRF на каждое сообщение стоит десятки микросекунд и растёт
+с длиной пакета. Поэтому поля сериализатора один раз разбираются в цепочку
+замыканий, которая проверяет словарь по тем же правилам и с теми же текстами
+ошибок: обязательность, default, null, приведение целых и строк, пустые
+строки, вложенные списки. Поле, которое компилятор не знает, — ошибка
+при сборке, а не молчаливое расхождение с документацией.
+"""
+import re
+from functools import cache
+
+from django.core.validators import ProhibitNullCharactersValidator
+from rest_framework import serializers
+from rest_framework.fields import ProhibitSurrogateCharactersValidator, empty
+
+from game.serializers import RegisterPlayerInputSerializer, RegisterPlayersInputSerializer, \
+    SendPlayerAnswerInputSerializer, SendPlayerAnswersInputSerializer, SendPlayerVoteInputSerializer, \
+    SendPlayerVotesInputSerializer, ReceivePlayerAnswersInputSerializer
+
+# Входные сообщения бота и их контракт
+MESSAGE_SERIALIZERS = {
+    'register_player': RegisterPlayerInputSerializer,
+    'register_players': RegisterPlayersInputSerializer,
+    'send_player_answer': SendPlayerAnswerInputSerializer,
+    'send_player_answers': SendPlayerAnswersInputSerializer,
+    'send_player_vote': SendPlayerVoteInputSerializer,
+    'send_player_votes': SendPlayerVotesInputSerializer,
+    'receive_player_answers': ReceivePlayerAnswersInputSerializer,
+}
+
+SURROGATES = re.compile('[\ud800-\udfff]')
+
+STRING_VALIDATORS = (ProhibitNullCharactersValidator, ProhibitSurrogateCharactersValidator)
+
+
+def compile_integer(field):
+    invalid = [str(field.error_messages['invalid'])]
+    too_long = [str(field.error_messages['max_string_length'])]
+
+    def check(value):
+        if type(value) is int:
+            return value, None
+        if isinstance(value, str) and len(value) > field.MAX_STRING_LENGTH:
+            return None, too_long
+        try:
+            return int(field.re_decimal.sub('', str(value))), None
+        except (ValueError, TypeError):
+            return None, invalid
+
+    return check
+
+
+def compile_string(field):
+    invalid = [str(field.error_messages['invalid'])]
+    blank = [str(field.error_messages['blank'])]
+    null_characters = [str(ProhibitNullCharactersValidator.message)]
+    surrogate = ProhibitSurrogateCharactersValidator.message
+    allow_blank = field.allow_blank
+    trim = field.trim_whitespace
+
+    def check(value):
+        if type(value) is not str:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return None, invalid
+            value = str(value)
+        if trim:
+            value = value.strip()
+        if not value:
+            return ('', None) if allow_blank else (None, blank)
+        if '\x00' in value:
+            return None, null_characters
+        match = SURROGATES.search(value)
+        if match:
+            return None, [surrogate.format(code_point=ord(match.group()))]
+        return value, None
+
+    return check
+
+
+def compile_list(field):
+    not_a_list = str(field.error_messages['not_a_list'])
+    check_item = compile_serializer(field.child)
+
+    def check(value):
+        if not isinstance(value, list):
+            return None, {'non_field_errors': [not_a_list.format(input_type=type(value).__name__)]}
+        items = []
+        errors = []
+        for item in value:
+            item, error = check_item(item)
+            items.append(item)
+            errors.append(error or {})
+        return (None, errors) if any(errors) else (items, None)
+
+    return check
+
+
+def compile_field(field):
+    if isinstance(field, serializers.ListSerializer):
+        return compile_list(field)
+    if isinstance(field, serializers.Serializer):
+        return compile_serializer(field)
+    if any(not isinstance(validator, STRING_VALIDATORS) for validator in field.validators):
+        raise TypeError(f'{field.field_name}: валидаторы полей не поддерживаются')
+    if type(field) is serializers.IntegerField and field.max_value is None and field.min_value is None:
+        return compile_integer(field)
+    if type(field) is serializers.CharField:
+        return compile_string(field)
+    raise TypeError(f'{field.field_name}: {type(field).__name__} не поддерживается')
+
+
+def compile_serializer(serializer):
+    """
+    Возвращает check(data) -> (проверенные данные, None) или (None, ошибки)
+    с ошибками в том же виде, что serializer.errors.
+    """
+    invalid = str(serializer.error_messages['invalid'])
+    fields = []
+    for name, field in serializer.fields.items():
+        if field.read_only:
+            continue
+        fields.append((
+            name,
+            compile_field(field),
+            field.required,
+            field.default,
+            field.allow_null,
+            [str(field.error_messages['required'])],
+            [str(field.error_messages['null'])],
+        ))
+
+    def check(data):
+        if not isinstance(data, dict):
+            return None, {'non_field_errors': [invalid.format(datatype=type(data).__name__)]}
+        validated = {}
+        errors = {}
+        for name, check_field, required, default, allow_null, required_error, null_error in fields:
+            value = data.get(name, empty)
+            if value is empty:
+                if default is not empty:
+                    validated[name] = default() if callable(default) else default
+                elif required:
+                    errors[name] = required_error
+                continue
+            if value is None:
+                if allow_null:
+                    validated[name] = None
+                else:
+                    errors[name] = null_error
+                continue
+            value, error = check_field(value)
+            if error:
+                errors[name] = error
+            else:
+                validated[name] = value
+        return (None, errors) if errors else (validated, None)
+
+    return check
+
+
+@cache
+def get_validator(type):
+    """Скомпилированная проверка сообщения type или None, если контракта нет."""
+    serializer_class = MESSAGE_SERIALIZERS.get(type)
+    return compile_serializer(serializer_class()) if serializer_class is not None else None
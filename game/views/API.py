@@ -1,22 +1,58 @@
 import logging
-from asyncio import sleep
 from json import loads, JSONDecodeError
-from math import ceil
-from time import time
 
 from asgiref.sync import async_to_sync, sync_to_async
-from channels.layers import get_channel_layer
-from django.core.cache import cache
-from django.db import transaction, IntegrityError
+from django.db import IntegrityError
+from django.db.models import Q
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 
-from ..models import Player
-from ..serializers import PlayerCountSerializer
+from ..broadcast import players_joined
+from ..budgets import query_budget
+from ..catalog import aget_catalog
+from ..db import acreate_room
+from ..leaderboard import get_top, get_rank, serialize
+from ..models import Player, Matchup, GamePhase
+from ..notify import get_hub, PROMPTS_ASSIGNED, ROUND_STARTED
+from ..phase import get_phase
+from ..rounds import get_matchup
+from ..state import get_game_state, ANSWER_CLOSED, ANSWER_UNKNOWN_PLAYER, ANSWER_ACCEPTED, VOTE_CLOSED, \
+    VOTE_UNKNOWN_PLAYER, VOTE_DUPLICATE
+from ..transitions import complete_answers, complete_round
+from ..validation import get_validator
+from .mixins import aget_room_or_404, get_room_or_404
+from ..serializers import PlayerCountSerializer, LeaderboardSerializer, RoomCreateInputSerializer
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class RoomCreateAPIView(View):
+    """
+    API для создания комнаты.
+    Ожидает POST-запрос с данными JSON: {'code': slug}
+    Отвечает 201, если комната создана, 200, если она уже была, или 400 при ошибке.
+    Страницы и сокеты неизвестных комнат не создают, а отвечают 404.
+    """
+
+    @query_budget(3)
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = loads(request.body)
+        except JSONDecodeError:
+            return HttpResponseBadRequest('Malformed JSON payload')
+        serializer = RoomCreateInputSerializer(data=data)
+        if not serializer.is_valid():
+            return HttpResponseBadRequest('Invalid data')
+
+        room, created = await acreate_room(serializer.validated_data['code'])
+        return JsonResponse(
+            {'code': room.code, 'url': reverse('game:home', kwargs={'room': room.code})},
+            status=201 if created else 200,
+        )
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -30,7 +66,8 @@ class PlayerConnectAPIView(View):
     В ответ всегда отправляет "OK" или 400 при ошибке.
     """
 
-    def post(self, request, *args, **kwargs):
+    @query_budget(6)
+    async def post(self, request, *args, **kwargs):
         try:
             if request.content_type == 'application/json':
                 data = loads(request.body)
@@ -46,32 +83,25 @@ class PlayerConnectAPIView(View):
             logging.log(1, 'Invalid data')
             return HttpResponseBadRequest('Invalid data')
 
+        room = await aget_room_or_404(kwargs.get('room'))
         try:
-            with transaction.atomic():
-                player, created = Player.objects.get_or_create(
-                    telegram_id=tg_id,
-                    defaults={'username': username, 'prompt': None, 'answer': None, 'vote_count': None},
-                )
+            player, created = await Player.objects.aget_or_create(
+                room=room,
+                telegram_id=tg_id,
+                defaults={'username': username, 'vote_count': None},
+            )
         except IntegrityError:
-            player = Player.objects.get(telegram_id=tg_id)
+            player = await Player.objects.aget(room=room, telegram_id=tg_id)
             created = False
 
         if not created:
             player.username = username
             player.joined_at = timezone.now()
-            player.save()
-
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            'players',
-            {
-                'type': 'player_joined',
-                'player': {
-                    'id': player.id,
-                    'username': player.username,
-                },
-            }
-        )
+            await player.asave()
+
+        await get_game_state().add_player(room.code, player.telegram_id)
+        # Экраны получают подключения пачкой, см. game/broadcast.py
+        await players_joined(room, [player])
 
         return HttpResponse(status=204)
 
@@ -80,14 +110,15 @@ class PlayerConnectAPIView(View):
 class PlayerAnswerAPIView(View):
     CACHE_TIMEOUT = 5 * 60
     TIMEOUT = 10 * 60
-    interval = 15
 
-    def post(self, request, *args, **kwargs):
+    @query_budget(4)
+    async def post(self, request, *args, **kwargs):
         """
             API для приёма ответов пользователей и их кэширования.
             Ожидает POST с JSON: {
                 "telegram_id": int>
-                "answer": "<str>"
+                "answer": "<str>",
+                "round": int          # необязательно
             }
             В ответ всегда отправляет 202 или 400 при ошибке.
         """
@@ -96,31 +127,31 @@ class PlayerAnswerAPIView(View):
                 data = loads(request.body)
             else:
                 data = request.POST
-
-            user_id = data['telegram_id']
-            answer = data['answer']
-        except (ValueError, KeyError):
+        except ValueError:
             return HttpResponseBadRequest('Invalid JSON payload')
+        # Те же правила, что у сообщения бота send_player_answer
+        data, errors = get_validator('send_player_answer')(data)
+        if errors:
+            return HttpResponseBadRequest('Invalid JSON payload')
+        user_id = data['telegram_id']
+        answer = data['answer']
+        prompt_index = data.get('round')
 
-        player = Player.objects.get(telegram_id=user_id)
-        player.answer = answer
-        player.save()
-
-        total_players = Player.objects.count()
-        answered_players = Player.objects.filter(answer__isnull=False).count()
+        room = await aget_room_or_404(kwargs.get('room'))
+        state = get_game_state()
+        status, answered_players, total_players = await state.set_answer(room.code, user_id, answer, prompt_index)
+        if status == ANSWER_CLOSED:
+            return HttpResponseBadRequest('Answering is closed')
+        if status == ANSWER_UNKNOWN_PLAYER:
+            return HttpResponseBadRequest('Unknown player')
 
-        if answered_players >= total_players > 0:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                'players',
-                {
-                    'type': 'all_answers_received',
-                }
-            )
+        if status == ANSWER_ACCEPTED and answered_players >= total_players > 0:
+            await complete_answers(room)
 
         return HttpResponse(status=204)
 
-    def get(self, request, *args, **kwargs):
+    @query_budget(2)
+    async def get(self, request, *args, **kwargs):
         """
            В ответ отправляет JSON: {
                 "prompt": str,
@@ -136,15 +167,12 @@ class PlayerAnswerAPIView(View):
                     }
            }
         """
-        prompt_index = cache.get("prompt_index", None)
-        start_time = time()
-
-        while time() - start_time < self.TIMEOUT:
-            if prompt_index is None:
-                sleep(self.interval)
-                prompt_index = cache.get("prompt_index", None)
-            else:
-                break
+        room = await aget_room_or_404(kwargs.get('room'))
+        phase = await get_phase(room)
+        if phase.phase == GamePhase.VOTING:
+            prompt_index = phase.round
+        else:
+            prompt_index = await get_hub().wait(room, ROUND_STARTED, self.TIMEOUT)
 
         if prompt_index is None:
             return JsonResponse(
@@ -152,17 +180,20 @@ class PlayerAnswerAPIView(View):
                 status=408
             )
 
-        players = Player.objects.all().order_by('prompt')[2 * (prompt_index - 1):2 * prompt_index]
+        matchup = await sync_to_async(get_matchup)(room, prompt_index)
+        if matchup is None:
+            return JsonResponse({"error": f"No matchup for round {prompt_index}."}, status=404)
 
+        catalog = await aget_catalog([matchup.prompt_id])
         result = {
-            "prompt": players[0].prompt.phrase,
+            "prompt": catalog.phrase(matchup.prompt_id),
             "answer0": {
-                "telegram_id": players[0].telegram_id,
-                "answer": players[0].answer,
+                "telegram_id": matchup.player_a.telegram_id,
+                "answer": matchup.answer_a,
             },
             "answer1": {
-                "telegram_id": players[1].telegram_id,
-                "answer": players[1].answer,
+                "telegram_id": matchup.player_b.telegram_id,
+                "answer": matchup.answer_b,
             },
         }
 
@@ -173,6 +204,7 @@ class PlayerAnswerAPIView(View):
 class VoteAPIView(View):
     CACHE_TIMEOUT = 60
 
+    @query_budget(10)
     def post(self, request, *args, **kwargs):
         try:
             if request.content_type == 'application/json':
@@ -185,51 +217,19 @@ class VoteAPIView(View):
         except (ValueError, KeyError, TypeError):
             return HttpResponseBadRequest('Invalid JSON payload')
 
-        prompt_index = cache.get("prompt_index")
-        voter = Player.objects.get(telegram_id=voter_id)
-        if voter.is_voted:
+        room = get_room_or_404(kwargs.get('room'))
+        state = get_game_state()
+        status, remaining, prompt_index = async_to_sync(state.record_vote)(room.code, voter_id, candidate_id)
+        if status == VOTE_CLOSED:
+            return HttpResponseBadRequest('Voting is closed')
+        if status == VOTE_UNKNOWN_PLAYER:
+            return HttpResponseBadRequest('Unknown player')
+        if status == VOTE_DUPLICATE:
             return HttpResponseBadRequest('Already voted')
 
-        voter.is_voted = True
-        voter.save()  # Сохраняем изменения
-
-        candidate = Player.objects.get(telegram_id=candidate_id)
-        candidate.vote_count = 0 if candidate.is_voted is None else candidate.is_voted
-        candidate.vote_count += 1
-        candidate.save()
-
         # Проверяем, все ли игроки проголосовали
-        if not Player.objects.filter(is_voted=False).exists():
-            for p in Player.objects.filter(is_voted=True):
-                p.is_voted = False
-
-            players = Player.objects.all().order_by('prompt')[prompt_index - 1:2 * prompt_index]
-            cache.set("prompt_index", prompt_index + 1, timeout=300)
-
-            result = {
-                'all_voted': prompt_index == ceil(Player.objects.count() / 2),
-                "prompt": players[0].prompt.phrase,
-                "player0": {
-                    "username": players[0].username,
-                    "answer": players[0].answer,
-                    'vote_count': players[0].vote_count or 0,
-                },
-                "player1": {
-                    "username": players[1].username,
-                    "answer": players[1].answer,
-                    'vote_count': players[1].vote_count or 0,
-                },
-            }
-
-            # Отправляем сообщение через WebSocket
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                'players',
-                {
-                    'type': 'all_voted',
-                    'message': result,
-                }
-            )
+        if remaining == 0:
+            async_to_sync(complete_round)(room, prompt_index)
 
         return HttpResponse(status=204)
 
@@ -237,40 +237,68 @@ class VoteAPIView(View):
 @method_decorator(csrf_exempt, name='dispatch')
 class PromptAPIView(View):
     timeout = 10 * 60
-    interval = 5
 
+    @query_budget(4)
     async def get(self, request, *args, **kwargs):
         """
             GET /api/get_prompt/?telegram_id=<ID>
             На вход принимает user_id: int
             В ответ отправляет JSON: {
                 "telegram_id": int,         # идентификатор пользователя
-                "prompt": str      # фраза
+                "prompt": str,     # фраза первого раунда игрока
+                "prompts": [{"round": int, "prompt": str}]  # все фразы игрока
             }
         """
         telegram_id = request.GET.get('telegram_id')
-        start_time = time()
+        room = await aget_room_or_404(kwargs.get('room'))
+        player = await Player.objects.aget(room=room, telegram_id=telegram_id)
 
-        while time() - start_time < self.timeout:
-            player = await Player.objects.aget(telegram_id=telegram_id)
-            prompt = await sync_to_async(lambda: player.prompt)()
-            if prompt is not None:
-                return JsonResponse({
-                    'telegram_id': telegram_id,
-                    'prompt': player.prompt.phrase
-                })
+        # Фразы раздаются всем игрокам комнаты разом: ждём события и читаем их один раз
+        if not await Matchup.objects.filter(room=room).aexists():
+            if await get_hub().wait(room, PROMPTS_ASSIGNED, self.timeout) is None:
+                return HttpResponse(status=408)
 
-            await sleep(self.interval)
-
-        return HttpResponse(status=408)
+        matchups = [m async for m in Matchup.objects.filter(Q(player_a=player) | Q(player_b=player))]
+        catalog = await aget_catalog([m.prompt_id for m in matchups])
+        prompts = [{'round': m.round, 'prompt': catalog.phrase(m.prompt_id)} for m in matchups]
+        return JsonResponse({
+            'telegram_id': telegram_id,
+            'prompt': prompts[0]['prompt'] if prompts else None,
+            'prompts': prompts,
+        })
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class PlayerCountAPIView(APIView):
     serializer_class = PlayerCountSerializer
 
-    async def get(self, request, *args, **kwargs):
-        count = await Player.objects.acount()
-        prompt_index = await sync_to_async(cache.get)("prompt_index", 0)
-        players_pairs_count = ceil(count / 2) - (prompt_index - 1)
-        return JsonResponse({'count': players_pairs_count})
+    @query_budget(1)
+    def get(self, request, *args, **kwargs):
+        room = get_room_or_404(kwargs.get('room'))
+        counters = async_to_sync(get_game_state().get_counters)(room.code)
+        return JsonResponse({'count': counters.pairs_remaining})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class LeaderboardAPIView(APIView):
+    """
+    GET ?limit=<K>&telegram_id=<ID>
+    Первые K игроков комнаты и, если передан telegram_id, место игрока.
+    """
+    serializer_class = LeaderboardSerializer
+
+    @query_budget(1)
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.GET.get('limit', 0))
+            telegram_id = request.GET.get('telegram_id')
+            telegram_id = int(telegram_id) if telegram_id is not None else None
+        except ValueError:
+            return HttpResponseBadRequest('Invalid query parameters')
+
+        room = get_room_or_404(kwargs.get('room'))
+        result = {'players': serialize(async_to_sync(get_top)(room, limit))}
+        if telegram_id is not None:
+            rank = async_to_sync(get_rank)(room, telegram_id)
+            result['rank'] = {'place': rank[0], 'vote_count': rank[1]} if rank else None
+        return JsonResponse(result)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views import View
+
+from game import metrics
+
+
+class MetricsView(View):
+    """
+    Метрики процесса в текстовом формате Prometheus
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not settings.GAME_METRICS:
+            raise Http404
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,45 @@
+from functools import cached_property
+
+from django.conf import settings
+from django.http import Http404
+
+from game.db import aget_room
+from game.models import GameRoom
+from game.rooms import get_room
+
+
+def get_room_or_404(code):
+    """Комната по коду из URL; неизвестный код — 404, а не новая комната."""
+    try:
+        return get_room(code)
+    except GameRoom.DoesNotExist:
+        raise Http404(f'Room {code} not found')
+
+
+async def aget_room_or_404(code):
+    try:
+        return await aget_room(code)
+    except GameRoom.DoesNotExist:
+        raise Http404(f'Room {code} not found')
+
+
+class RoomMixin:
+    """
+    Определяет комнату игры по коду из URL и добавляет её в контекст шаблона
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        # Зритель голосует от имени сессии браузера, поэтому страницы комнаты её заводят
+        if request.session.session_key is None:
+            request.session.save()
+        return super().dispatch(request, *args, **kwargs)
+
+    @cached_property
+    def room(self):
+        return get_room_or_404(self.kwargs.get('room'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['room'] = self.room
+        context['fragment_timeout'] = settings.GAME_FRAGMENT_CACHE_TIMEOUT
+        return context
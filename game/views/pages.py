@@ -1,21 +1,32 @@
-from math import ceil
-
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.conf import settings
 from django.core.cache import cache
 from django.db import transaction
+from django.db.models import F
 from django.shortcuts import redirect
+from django.utils.functional import SimpleLazyObject
 from django.views.generic import TemplateView
 
-from game.models import Prompt, Player
+from game.catalog import get_catalog
+from game.leaderboard import start_leaderboard, get_top, serialize, get_version as get_leaderboard_version
+from game.matchups import get_strategy
+from game.models import Player, Matchup, GamePhase, Prompt
+from game.notify import notify, PROMPTS_ASSIGNED
+from game.phase import get_phase, advance, reset_phase
+from game.prompts import draw_prompts
+from game.rooms import ROOM_CACHE_KEYS
+from game.roster import get_snapshot, reset_roster
+from game.rounds import get_matchup, get_slots
+from game.state import get_game_state
+from game.views.mixins import RoomMixin
 
 
-def get_players():
-    from game.models import Player
-    return Player.objects.order_by('joined_at')
+def get_players(room):
+    return Player.objects.filter(room=room).order_by('joined_at')
 
 
-class HomePageView(TemplateView):
+class HomePageView(RoomMixin, TemplateView):
     """
     Отображает страницу ожидания со списком игроков и QR-кодом
     """
@@ -23,78 +34,103 @@ class HomePageView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        players = get_players()
-        context['players'] = players
+        snapshot = get_snapshot(self.room)
+        context['players'] = snapshot.players
+        context['roster_version'] = snapshot.version
         return context
 
 
-class WaitingPageView(TemplateView):
+class WaitingPageView(RoomMixin, TemplateView):
     template_name = 'game/wait.html'
-    PROMPTS_FLAG_KEY = "prompts_assigned"
-    PROMPTS_LOCK_KEY = "prompts_assign_lock"
-    LOCK_TIMEOUT = 300
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         self.assign_prompts_once()
-        context['players'] = get_players()
         return context
 
     def assign_prompts_once(self):
-        if cache.get(self.PROMPTS_FLAG_KEY):
+        current = async_to_sync(get_phase)(self.room, fresh=True)
+        if current.phase != GamePhase.LOBBY:
             return
 
-        players = get_players()
-        if len(players) < 2:
+        players = list(get_players(self.room))
+        # Без фраз игру не начинаем: иначе комната застрянет в фазе ответов без пар
+        if len(players) < 2 or not Prompt.objects.exists():
             return
 
-        cache.set(self.PROMPTS_FLAG_KEY, True, None)
-        num_prompts = ceil(len(players) / 2)
-        prompts = list(Prompt.objects.order_by('?')[:num_prompts])
-
+        # Фразы раздаёт только воркер, успевший перевести комнату в фазу ответов
+        if async_to_sync(advance)(self.room, current, GamePhase.ANSWERING) is None:
+            return
+        try:
+            self.assign_prompts(players)
+        except Exception:
+            # Раздача не удалась: комната возвращается в лобби, чтобы игру можно было начать снова
+            async_to_sync(reset_phase)(self.room)
+            raise
+
+    def assign_prompts(self, players):
+        pairs = get_strategy()(players)
+        prompts = draw_prompts(self.room, len(pairs))
+
+        matchups = [
+            Matchup(room=self.room, round=i, prompt=prompts[(i - 1) % len(prompts)], player_a=a, player_b=b)
+            for i, (a, b) in enumerate(pairs, start=1)
+        ]
         with transaction.atomic():
-            for i, player in enumerate(players):
-                player.prompt = prompts[i // 2]
-                player.save()
+            Matchup.objects.filter(room=self.room).delete()
+            Matchup.objects.bulk_create(matchups)
+
+        # Сверяем список игроков в горячем состоянии с БД перед началом раунда
+        async_to_sync(get_game_state().assign_slots)(self.room.code, get_slots(players, matchups))
+        async_to_sync(start_leaderboard)(self.room, players)
+        async_to_sync(notify)(self.room, PROMPTS_ASSIGNED)
 
         channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)('bot', {'type': 'receive_players_prompts'})
+        async_to_sync(channel_layer.group_send)(self.room.bot_group, {'type': 'receive_players_prompts'})
 
 
-class VotePageView(TemplateView):
+class VotePageView(RoomMixin, TemplateView):
     template_name = 'game/vote.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cache.set("prompt_index", 1, timeout=300)
-        players = Player.objects.all().order_by('prompt')
-        context['prompt'] = players[0].prompt.phrase
-        context['players'] = players
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)('bot', {'type': 'receive_player_answers'})
-
+        phase = async_to_sync(get_phase)(self.room)
+        # Пара читается из БД, только если фрагмент этой версии фазы ещё не в кэше
+        matchup = SimpleLazyObject(lambda: get_matchup(self.room, phase.round or 1))
+        context['prompt'] = SimpleLazyObject(
+            lambda: get_catalog([matchup.prompt_id]).phrase(matchup.prompt_id) if matchup else None)
+        context['matchup'] = matchup
+        context['phase_version'] = phase.version
+        context['answers_version'] = async_to_sync(get_game_state().get_answers_version)(self.room.code)
         return context
 
 
-class WinPageView(TemplateView):
+class WinPageView(RoomMixin, TemplateView):
     template_name = 'game/win.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        qs = Player.objects.order_by('-vote_count')
-
-        players = [
-            {
-                "username": player.username,
-                "vote_count": player.vote_count or 0
-            }
-            for player in qs
-        ]
-        context['players'] = players
+        context['players'] = SimpleLazyObject(self.get_players)
+        context['leaderboard_version'] = async_to_sync(get_leaderboard_version)(self.room)
+        context['roster_version'], _ = async_to_sync(get_game_state().get_roster)(self.room.code)
         return context
 
+    def get_players(self):
+        players = serialize(async_to_sync(get_top)(self.room))
+        if not players:
+            # Таблицы нет, если игра не начиналась или состояние комнаты истекло
+            players = list(
+                Player.objects.filter(room=self.room)
+                .order_by(F('vote_count').desc(nulls_last=True))
+                .values('username', 'vote_count')[:settings.GAME_LEADERBOARD_SIZE]
+            )
+        return players
+
     def post(self, request, *args, **kwargs):
-        Player.objects.all().delete()
+        Player.objects.filter(room=self.room).delete()
 
-        cache.clear()
-        return redirect('game:home')
+        cache.delete_many([self.room.cache_key(name) for name in ROOM_CACHE_KEYS])
+        async_to_sync(get_game_state().clear)(self.room.code)
+        async_to_sync(reset_phase)(self.room)
+        async_to_sync(reset_roster)(self.room)
+        return redirect('game:home', room=self.room.code)
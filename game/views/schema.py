@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
+
+from game.schema import load_schema
+
+
+class SchemaView(View):
+    """
+    Схема OpenAPI из файла, собранного командой buildschema.
+    Без файла схема генерируется на лету, если подключена документация.
+    """
+
+    def get(self, request, *args, **kwargs):
+        schema = load_schema()
+        if schema is None:
+            if not settings.GAME_API_DOCS:
+                raise Http404
+            from drf_spectacular.views import SpectacularAPIView
+
+            return SpectacularAPIView.as_view()(request, *args, **kwargs)
+
+        response = get_conditional_response(request, etag=schema.etag)
+        if response is None:
+            response = HttpResponse(schema.content, content_type='application/vnd.oai.openapi+json')
+        response['ETag'] = schema.etag
+        # Клиент хранит схему у себя, но сверяет ETag при каждом запросе
+        patch_cache_control(response, public=True, no_cache=True)
+        return response